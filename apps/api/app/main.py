@@ -1,25 +1,44 @@
 # apps/api/app/main.py
-from fastapi import FastAPI, Depends, HTTPException, Response, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from supabase import create_client, Client
 from pydantic import BaseModel, Field, field_validator
-from typing import Optional, List, Literal, Dict, Any
-from datetime import datetime, timedelta
+from typing import Optional, List, Literal, Dict, Any, Iterator
+from datetime import datetime, timedelta, timezone
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from uuid import uuid4
+from uuid import UUID, uuid4
 import os
+import asyncio
 import hashlib
+import heapq
 import logging
 import json
 import hmac
 import unicodedata
 import re
+import base64
+import csv
+import io
+import tempfile
+import math
+import zlib
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from pathlib import Path
+import numpy as np
 try:
     from mangum import Mangum  # type: ignore
 except ImportError:  # pragma: no cover - optional dependency for serverless
     Mangum = None  # type: ignore[assignment]
+try:
+    import xlsxwriter  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency for XLSX export
+    xlsxwriter = None  # type: ignore[assignment]
     
 # Configuración
 SUPABASE_URL_ENV_KEYS = (
@@ -45,6 +64,58 @@ PASSWORD_CONTEXT = CryptContext(schemes=["bcrypt"], deprecated="auto")
 EMAIL_REGEX = re.compile(r"^[A-Z0-9._%+-]+@[A-Z0-9.-]+\.[A-Z]{2,}$", re.IGNORECASE)
 ALLOWED_ROLES = {"DOCENTE", "ADMINISTRATIVO", "TI", "DIRECTOR", "LIDER_TI"}
 PUBLIC_USERS_INSERT_ERROR_MESSAGE = "El perfil no fue creado en public.users"
+DEVICE_SEARCH_MAX_LIMIT = 50
+TICKET_SEARCH_MAX_LIMIT = 50
+DEFAULT_PAGE_SIZE = 50
+COMMENTS_PAGE_SIZE = 50
+TICKET_EVENTS_BUFFER_SIZE = int(os.getenv("TICKET_EVENTS_BUFFER_SIZE", "1000"))
+TICKET_EVENTS_HEARTBEAT_SECONDS = 15
+TICKET_EVENTS_TICKET_SECONDS = 30
+STREAM_TICKET_SCOPE = "ticket_events"
+MAX_PAGE_SIZE = 200
+FLEET_ANALYTICS_TTL_SECONDS = int(os.getenv("FLEET_ANALYTICS_TTL_SECONDS", "300"))
+BACKUP_COMPLIANCE_TTL_SECONDS = int(os.getenv("BACKUP_COMPLIANCE_TTL_SECONDS", "900"))
+ORG_BREAKDOWN_TTL_SECONDS = int(os.getenv("ORG_BREAKDOWN_TTL_SECONDS", "60"))
+EXPORT_PAGE_SIZE = 500
+TICKET_AUTO_ASSIGN = os.getenv("TICKET_AUTO_ASSIGN", "false").lower() in {"1", "true", "yes"}
+ASSIGNMENT_ROSTER_TTL_SECONDS = int(os.getenv("ASSIGNMENT_ROSTER_TTL_SECONDS", "300"))
+ATTACHMENT_MAX_BYTES = int(os.getenv("ATTACHMENT_MAX_BYTES", str(25 * 1024 * 1024)))
+ATTACHMENT_STORAGE = os.getenv("ATTACHMENT_STORAGE", "local")
+ATTACHMENT_LOCAL_DIR = os.getenv(
+    "ATTACHMENT_LOCAL_DIR", os.path.join(tempfile.gettempdir(), "gemelli-attachments")
+)
+ATTACHMENT_BUCKET = os.getenv("ATTACHMENT_BUCKET", "attachments")
+ATTACHMENT_UPLOAD_TTL_SECONDS = int(os.getenv("ATTACHMENT_UPLOAD_TTL_SECONDS", str(24 * 3600)))
+ATTACHMENT_PURGE_INTERVAL_SECONDS = 3600
+ATTACHMENT_MAX_CHUNK_BYTES = int(os.getenv("ATTACHMENT_MAX_CHUNK_BYTES", str(4 * 1024 * 1024)))
+ATTACHMENT_SIGNED_URL_SECONDS = int(os.getenv("ATTACHMENT_SIGNED_URL_SECONDS", "300"))
+ATTACHMENT_UPLOADS_PREFIX = "uploads"
+EXPORT_FLUSH_BYTES = 64 * 1024
+DEVICE_EXPORT_SELECT = (
+    "id, nombre, tipo, estado, ubicacion, serial, marca, modelo, fecha_ingreso, fecha_garantia, "
+    "usuario_actual:users!usuario_actual_id(nombre), "
+    "device_specs(cpu, cpu_velocidad, ram, ram_capacidad, disco, disco_capacidad, os)"
+)
+DEVICE_EXPORT_COLUMNS = (
+    ("ID", "id"),
+    ("Nombre", "nombre"),
+    ("Tipo", "tipo"),
+    ("Estado", "estado"),
+    ("Ubicación", "ubicacion"),
+    ("Serial", "serial"),
+    ("Marca", "marca"),
+    ("Modelo", "modelo"),
+    ("Fecha ingreso", "fecha_ingreso"),
+    ("Fecha garantía", "fecha_garantia"),
+    ("Usuario actual", "usuario_actual.nombre"),
+    ("CPU", "device_specs.cpu"),
+    ("Velocidad CPU", "device_specs.cpu_velocidad"),
+    ("RAM", "device_specs.ram"),
+    ("Capacidad RAM", "device_specs.ram_capacidad"),
+    ("Disco", "device_specs.disco"),
+    ("Capacidad disco", "device_specs.disco_capacidad"),
+    ("Sistema operativo", "device_specs.os"),
+)
 
 
 def _configure_logging() -> logging.Logger:
@@ -165,6 +236,41 @@ def extract_supabase_error_message(error: Any, default_message: str) -> str:
     if not message:
         message = str(error)
     return message or default_message
+
+
+class OrgScopedCache:
+    """Caché en proceso con TTL, indexada por org unit (None = alcance global)."""
+
+    def __init__(self, ttl_seconds: float) -> None:
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[Optional[str], tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, org_unit_id: Optional[str]) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(org_unit_id)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[org_unit_id]
+                return None
+            return value
+
+    def set(self, org_unit_id: Optional[str], value: Any) -> None:
+        with self._lock:
+            self._entries[org_unit_id] = (time.monotonic(), value)
+
+    def invalidate(self, org_unit_id: Optional[str] = None) -> None:
+        """Descarta la entrada de la org unit y la global, que la incluye."""
+        with self._lock:
+            self._entries.pop(org_unit_id, None)
+            self._entries.pop(None, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
     
 app = FastAPI(
     title="Gemelli IT API",
@@ -262,6 +368,9 @@ class BackupCreate(BaseModel):
     evidencia_url: Optional[str] = None
     notas: Optional[str] = None
 
+class BackupBatchCreate(BaseModel):
+    backups: List[BackupCreate] = Field(..., min_length=1, max_length=500)
+
 class TicketCreate(BaseModel):
     titulo: str
     descripcion: str
@@ -273,12 +382,24 @@ class TicketUpdate(BaseModel):
     prioridad: Optional[Literal["BAJA", "MEDIA", "ALTA", "CRITICA"]] = None
     asignado_a: Optional[str] = None
 
+class TicketBulkUpdate(BaseModel):
+    ticket_ids: List[str] = Field(..., min_length=1, max_length=500)
+    updates: TicketUpdate
+
 class TicketComment(BaseModel):
     ticket_id: str
     comentario: str
     adjunto_url: Optional[str] = None
 
 
+class AttachmentUploadCreate(BaseModel):
+    nombre: str = Field(..., min_length=1, max_length=300)
+    tipo_mime: Optional[str] = Field(None, max_length=100)
+    tamanio_bytes: int = Field(..., gt=0)
+    ticket_id: str
+    comment_id: Optional[str] = None
+
+
 class InventoryPermissionCreate(BaseModel):
     email: str = Field(..., max_length=255)
     notes: Optional[str] = Field(default=None, max_length=500)
@@ -581,14 +702,19 @@ async def register_audit_event(action: str, entity_id: str, user_id: str, metada
 
 # ==================== AUTH ====================
 
+def strip_accents(value: str) -> str:
+    """Remueve tildes y diacríticos ("Dirección" -> "Direccion")."""
+    normalized = unicodedata.normalize("NFKD", value)
+    return "".join(ch for ch in normalized if not unicodedata.combining(ch))
+
+
 def normalize_role_value(role: Optional[str]) -> Optional[str]:
     """Normaliza un valor de rol proveniente de Supabase."""
     if role is None:
         return None
 
     # Remover acentos y normalizar caracteres
-    normalized = unicodedata.normalize("NFKD", str(role))
-    normalized = "".join(ch for ch in normalized if not unicodedata.combining(ch))
+    normalized = strip_accents(str(role))
 
     # Limpiar espacios, guiones y mayúsculas
     normalized = normalized.strip().upper()
@@ -630,40 +756,45 @@ def build_user_profile_from_record(record: Dict[str, Any]) -> UserProfile:
     )
 
 
+def load_authenticated_user(user_id: str) -> UserProfile:
+    """Perfil activo del usuario identificado por el token."""
+    user_data_response = (
+        supabase.table("users")
+        .select("id, nombre, email, rol, org_unit_id, org_units(nombre), activo")
+        .eq("id", user_id)
+        .limit(1)
+        .execute()
+    )
+
+    data = handle_supabase_error(
+        user_data_response,
+        "No se pudo obtener el perfil del usuario",
+        require_data=False,
+    )
+
+    if not data:
+        raise HTTPException(status_code=401, detail="Usuario eliminado o no encontrado")
+
+    record = data[0] if isinstance(data, list) else data
+    if not isinstance(record, dict) or not record.get("id"):
+        raise HTTPException(status_code=401, detail="Usuario eliminado o no encontrado")
+
+    if record.get("activo") is False:
+        raise HTTPException(status_code=403, detail="Usuario inactivo")
+         
+    return build_user_profile_from_record(record)
+
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> UserProfile:
     """Obtener usuario autenticado desde JWT"""
     try:
         token = credentials.credentials
         payload = jwt.decode(token, require_jwt_secret(), algorithms=[JWT_ALGORITHM])
         user_id = payload.get("sub")
-        if not user_id:
+        # Los tickets de stream solo sirven para abrir /tickets/events
+        if not user_id or payload.get("scope"):
             raise HTTPException(status_code=401, detail="Token inválido")
-            
-        user_data_response = (
-            supabase.table("users")
-            .select("id, nombre, email, rol, org_unit_id, org_units(nombre), activo")
-            .eq("id", user_id)
-            .limit(1)
-            .execute()
-        )
-
-        data = handle_supabase_error(
-            user_data_response,
-            "No se pudo obtener el perfil del usuario",
-            require_data=False,
-        )
-
-        if not data:
-            raise HTTPException(status_code=401, detail="Usuario eliminado o no encontrado")
-
-        record = data[0] if isinstance(data, list) else data
-        if not isinstance(record, dict) or not record.get("id"):
-            raise HTTPException(status_code=401, detail="Usuario eliminado o no encontrado")
-
-        if record.get("activo") is False:
-            raise HTTPException(status_code=403, detail="Usuario inactivo")
-             
-        return build_user_profile_from_record(record)
+        return load_authenticated_user(user_id)
     except JWTError:
         raise HTTPException(status_code=401, detail="Token inválido o expirado")
     except HTTPException:
@@ -831,239 +962,1807 @@ def require_inventory_manager():
 
     return dependency
 
-# ==================== ROUTES ====================
 
-@app.get("/")
-async def root():
-    return {
-        "app": "Gemelli IT API",
-        "version": "1.0.0",
-        "status": "running",
-        "audit_system": "Hash Chain"
-    }
+def resolve_org_scope(user: UserProfile) -> Optional[str]:
+    """Org unit que limita las consultas del usuario (None = alcance global)."""
+    if user.rol == "LIDER_TI":
+        return None
+    return user.org_unit_id
 
-@app.get("/health")
-async def health():
-    return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
+# ==================== PAGINATION ====================
 
+def encode_cursor(*values: Any) -> str:
+    """Cursor opaco para keyset pagination (p. ej. fecha + id del último registro)."""
+    raw = json.dumps(list(values), default=str, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
 
-@app.get("/healt")
-async def health_database_check():
-    """Verifica la conexión con la base de datos de Supabase."""
 
+def decode_cursor(cursor: str, size: int) -> List[Any]:
     try:
-        response = supabase.table("users").select("id").limit(1).execute()
-        data = handle_supabase_error(
-            response, "No se pudo conectar a la base de datos de Supabase"
-        )
-    except HTTPException:
-        raise
-    except Exception as exc:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail=f"No se pudo conectar a la base de datos: {exc}",
-        )
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+    if not isinstance(values, list) or len(values) != size or any(v in (None, "") for v in values):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return values
+
+
+def apply_keyset_cursor(query, column: str, cursor: Optional[str], *, desc: bool = True):
+    """Filtra las filas posteriores al cursor para un orden (column, id)."""
+    if not cursor:
+        return query
+    value, row_id = decode_cursor(cursor, 2)
+    # Los valores se interpolan en el filtro de PostgREST: sólo se aceptan
+    # una marca de tiempo ISO y un UUID, re-serializados en forma canónica.
+    try:
+        value = datetime.fromisoformat(str(value).replace("Z", "+00:00")).isoformat()
+        row_id = str(UUID(str(row_id)))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    op = "lt" if desc else "gt"
+    return query.or_(
+        f'{column}.{op}."{value}",and({column}.eq."{value}",id.{op}.{row_id})'
+    )
 
-    return {
-        "status": "healthy",
-        "database": "connected",
-        "timestamp": datetime.utcnow().isoformat(),
-        "records_checked": len(data or []),
-    }
-    
 
+def paginate_rows(rows: List[Dict[str, Any]], limit: int, column: str) -> tuple[List[Dict[str, Any]], Optional[str]]:
+    """Recorta la página (se consulta limit + 1) y calcula el cursor siguiente."""
+    if len(rows) <= limit:
+        return rows, None
+    page = rows[:limit]
+    last = page[-1]
+    return page, encode_cursor(last[column], last["id"])
+
+# ==================== DEVICE SPECS NORMALIZATION ====================
+
+# Las capacidades se normalizan a bytes con unidades binarias (1 GB = 1024^3)
+# y las velocidades de CPU a MHz, para poder filtrar por rangos en la base.
+CAPACITY_UNITS = {
+    "B": 1,
+    "KB": 1024,
+    "MB": 1024 ** 2,
+    "GB": 1024 ** 3,
+    "TB": 1024 ** 4,
+}
+CAPACITY_PATTERN = re.compile(
+    r"(?<![A-Z\d.,])(\d+(?:[.,]\d+)?)\s*(TB|GB|MB|KB|B|T|G|M|K)?\b", re.IGNORECASE
+)
+SPEED_PATTERN = re.compile(r"(?<![A-Z\d.,])(\d+(?:[.,]\d+)?)\s*(GHZ|MHZ)?\b", re.IGNORECASE)
+SPEC_BACKFILL_PAGE_SIZE = 500
 
-@app.post("/debug/supabase-insert")
-async def supabase_insert_probe(request: SupabaseInsertProbe):
-    """Ejecuta un insert de prueba en Supabase y registra los errores detalladamente."""
 
-    try:
-        payload = request.payload or {}
-        payload.setdefault("inserted_at", datetime.utcnow().isoformat())
+def _parse_decimal(raw: str) -> float:
+    return float(raw.replace(",", "."))
 
-        response = supabase.table(request.table).insert(payload).execute()
-        data = handle_supabase_error(
-            response, "Fallo al insertar prueba en Supabase", require_data=False
-        )
-        return {"status": "ok", "table": request.table, "data": data}
-    except HTTPException:
-        logger.error(
-            "Inserción de prueba en Supabase falló para tabla %s", request.table, exc_info=True
-        )
-        raise
-    except Exception as exc:
-        logger.exception("Error inesperado en inserción de prueba de Supabase")
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail=f"No se pudo ejecutar la inserción de prueba: {exc}",
-        )
-        
-# --- AUTH ---
 
-@app.get("/auth/profile", response_model=UserProfile)
-async def get_profile(user: UserProfile = Depends(get_current_user)):
-    """Obtener perfil del usuario autenticado"""
-    return user
+def _first_measure(pattern: re.Pattern, value: str) -> Optional[re.Match]:
+    """Prefiere el primer número con unidad explícita ("DDR4 8GB" -> 8GB)."""
+    matches = list(pattern.finditer(value))
+    for match in matches:
+        if match.group(2):
+            return match
+    return matches[0] if matches else None
 
 
-@app.post("/auth/login", response_model=LoginResponse)
-async def login(payload: LoginRequest):
-    """Iniciar sesión con correo y contraseña."""
-    normalized_email = normalize_email_value(payload.email)
-    if not normalized_email:
-        raise HTTPException(status_code=422, detail="Correo electrónico inválido")
+def parse_capacity_bytes(value: Optional[str]) -> Optional[int]:
+    """Convierte textos como "8GB" o "512 GB SSD" a bytes. Sin unidad se asume GB."""
+    if not value:
+        return None
 
-    record = fetch_user_record_by_email(normalized_email)
+    match = _first_measure(CAPACITY_PATTERN, str(value))
+    if not match:
+        return None
 
-    if record.get("activo") is False:
-        raise HTTPException(status_code=403, detail="Usuario inactivo")
+    amount = _parse_decimal(match.group(1))
+    unit = (match.group(2) or "GB").upper()
+    if len(unit) == 1 and unit != "B":
+        unit = f"{unit}B"
 
-    password_hash = record.get("password_hash") or ""
-    password_valid = False
+    total = int(round(amount * CAPACITY_UNITS[unit]))
+    return total or None
 
-    if password_hash and password_hash != "managed_by_supabase_auth":
-        try:
-            password_valid = verify_password(payload.password, password_hash)
-        except Exception as exc:
-            logger.warning("No se pudo validar password_hash local para %s: %s", normalized_email, exc)
 
-    if not password_valid:
-        supabase_valid, supabase_error = authenticate_with_supabase_password(
-            normalized_email, payload.password
-        )
-        if not supabase_valid:
-            raise HTTPException(status_code=401, detail=supabase_error or "Credenciales inválidas")
+def parse_speed_mhz(value: Optional[str]) -> Optional[int]:
+    """Convierte textos como "2.4GHz" o "3200 MHz" a MHz. Sin unidad, < 100 se asume GHz."""
+    if not value:
+        return None
 
-        # Mantener compatibilidad con el flujo actual: al validar por Supabase,
-        # sincronizamos un hash local para futuros inicios de sesión.
-        try:
-            supabase.table("users").update(
-                {"password_hash": get_password_hash(payload.password)}
-            ).eq("id", record["id"]).execute()
-        except Exception as exc:
-            logger.warning("No se pudo sincronizar password_hash local para %s: %s", normalized_email, exc)
-            
-    user_profile = build_user_profile_from_record(record)
-    token = create_access_token(user_profile.id)
-    return LoginResponse(access_token=token, user=user_profile)
+    match = _first_measure(SPEED_PATTERN, str(value))
+    if not match:
+        return None
 
+    amount = _parse_decimal(match.group(1))
+    unit = (match.group(2) or "").upper()
+    if unit == "GHZ" or (not unit and amount < 100):
+        amount *= 1000
 
-@app.post("/auth/register", status_code=201)
-async def register_user(payload: AdminUserCreate):
-    """Registro público de usuarios con perfil inicial."""
-    result = create_user_with_profile(payload)
+    total = int(round(amount))
+    return total or None
 
-    await register_audit_event(
-        "SELF_REGISTER",
-        result["id"],
-        result["id"],
-        {
-            "email": result["email"],
-            "rol": result["rol"],
-            "org_unit_id": result["org_unit_id"],
-            "activo": result["activo"],
-        },
-    )
 
-    return {"data": result["profile"]}
-    
-# --- ADMIN ---
+def normalize_spec_metrics(specs: Dict[str, Any]) -> Dict[str, Optional[int]]:
+    """Columnas numéricas derivadas de los campos libres de device_specs."""
+    return {
+        "ram_bytes": parse_capacity_bytes(specs.get("ram_capacidad")),
+        "disco_bytes": parse_capacity_bytes(specs.get("disco_capacidad")),
+        "cpu_mhz": parse_speed_mhz(specs.get("cpu_velocidad")),
+    }
 
-@app.get("/admin/users")
-async def admin_list_users(user: UserProfile = Depends(require_global_admin())):
-    try:
-        response = (
-            supabase.table("users")
-            .select("id, nombre, email, rol, activo, org_unit_id, org_units(nombre)")
-            .order("nombre")
-            .execute()
-        )
-    except HTTPException:
-        raise
-    except Exception as exc:
-        raise HTTPException(status_code=503, detail=f"No se pudieron obtener los usuarios: {exc}")
 
-    records = [serialize_user_record(item) for item in (response.data or [])]
-    return {"data": records, "count": len(records)}
+def backfill_device_spec_metrics() -> Dict[str, int]:
+    """Recalcula ram_bytes, disco_bytes y cpu_mhz para todas las specs existentes."""
+    scanned = 0
+    updated = 0
+    last_id: Optional[str] = None
 
+    while True:
+        query = supabase.table("device_specs").select(
+            "id, ram_capacidad, disco_capacidad, cpu_velocidad, ram_bytes, disco_bytes, cpu_mhz"
+        )
+        if last_id:
+            query = query.gt("id", last_id)
+        response = query.order("id").limit(SPEC_BACKFILL_PAGE_SIZE).execute()
+        page = handle_supabase_error(response, "No se pudieron leer las especificaciones") or []
+
+        for record in page:
+            scanned += 1
+            metrics = normalize_spec_metrics(record)
+            if any(record.get(key) != value for key, value in metrics.items()):
+                supabase.table("device_specs").update(metrics).eq("id", record["id"]).execute()
+                updated += 1
+
+        if len(page) < SPEC_BACKFILL_PAGE_SIZE:
+            break
+        last_id = page[-1]["id"]
+
+    return {"scanned": scanned, "updated": updated}
+
+# ==================== FLEET ANALYTICS ====================
+
+FLEET_AGE_BINS_YEARS = (0, 1, 2, 3, 4, 5, 7, 10)
+FLEET_RAM_TIERS_GB = (4, 8, 16, 32)
+FLEET_PERCENTILES = (25, 50, 75, 90)
+FLEET_ANALYTICS_SELECT = (
+    "id, tipo, estado, ubicacion, fecha_ingreso, device_specs(ram_bytes, disco_bytes, cpu_mhz)"
+)
 
-@app.post("/admin/users", status_code=201)
-async def admin_create_user(payload: AdminUserCreate, user: UserProfile = Depends(require_global_admin())):
-    result = create_user_with_profile(payload)
-    
-    await register_audit_event(
-        "CREATE_USER",
-        result["id"],
-        user.id,
-        {
-           "email": result["email"],
-            "rol": result["rol"],
-            "org_unit_id": result["org_unit_id"],
-            "activo": result["activo"],
-        },
-    )
+fleet_analytics_cache = OrgScopedCache(FLEET_ANALYTICS_TTL_SECONDS)
 
-    return {"data": result["profile"]}
 
+def load_fleet_columns(org_unit_id: Optional[str]) -> Dict[str, np.ndarray]:
+    """Carga dispositivos + specs del alcance como arreglos columnares."""
+    columns: Dict[str, List[Any]] = {
+        key: [] for key in ("tipo", "estado", "ubicacion", "fecha_ingreso", "ram_bytes", "disco_bytes", "cpu_mhz")
+    }
+    last_id: Optional[str] = None
+
+    while True:
+        query = supabase.table("devices").select(FLEET_ANALYTICS_SELECT)
+        if org_unit_id:
+            query = query.eq("org_unit_id", org_unit_id)
+        if last_id:
+            query = query.gt("id", last_id)
+        response = query.order("id").limit(EXPORT_PAGE_SIZE).execute()
+        page = handle_supabase_error(response, "No se pudieron cargar los dispositivos") or []
+
+        for record in page:
+            columns["tipo"].append(record.get("tipo") or "OTRO")
+            columns["estado"].append(record.get("estado") or "ACTIVO")
+            columns["ubicacion"].append((record.get("ubicacion") or "").strip() or "Sin ubicación")
+            columns["fecha_ingreso"].append(record.get("fecha_ingreso") or "NaT")
+            for key in ("ram_bytes", "disco_bytes", "cpu_mhz"):
+                value = _export_value(record, f"device_specs.{key}")
+                columns[key].append(np.nan if value is None else value)
+
+        if len(page) < EXPORT_PAGE_SIZE:
+            break
+        last_id = page[-1]["id"]
 
-@app.patch("/admin/users/{user_id}")
-async def admin_update_user(
-    user_id: str,
-    payload: AdminUserUpdate,
-    user: UserProfile = Depends(require_global_admin()),
-):
-    updates: Dict[str, Any] = {}
-    audit_metadata: Dict[str, Any] = {}
+    return {
+        "tipo": np.asarray(columns["tipo"], dtype=object),
+        "estado": np.asarray(columns["estado"], dtype=object),
+        "ubicacion": np.asarray(columns["ubicacion"], dtype=object),
+        "fecha_ingreso": np.asarray(
+            [str(value)[:10] for value in columns["fecha_ingreso"]], dtype="datetime64[D]"
+        ),
+        "ram_bytes": np.asarray(columns["ram_bytes"], dtype=np.float64),
+        "disco_bytes": np.asarray(columns["disco_bytes"], dtype=np.float64),
+        "cpu_mhz": np.asarray(columns["cpu_mhz"], dtype=np.float64),
+    }
 
-    if payload.nombre is not None:
-        updates["nombre"] = payload.nombre
-        audit_metadata["nombre"] = payload.nombre
 
-    if payload.rol is not None:
-        normalized_role = ensure_allowed_role(payload.rol)
-        updates["rol"] = normalized_role
-        audit_metadata["rol"] = normalized_role
+def _grouped_counts(values: np.ndarray) -> Dict[str, int]:
+    if values.size == 0:
+        return {}
+    labels, counts = np.unique(values.astype(str), return_counts=True)
+    return {str(label): int(count) for label, count in zip(labels, counts)}
 
-    if payload.org_unit_id is not None:
-        updates["org_unit_id"] = payload.org_unit_id
-        audit_metadata["org_unit_id"] = payload.org_unit_id
 
-    if payload.activo is not None:
-        updates["activo"] = payload.activo
-        audit_metadata["activo"] = payload.activo
+def _percentiles(values: np.ndarray, scale: float = 1.0) -> Optional[Dict[str, float]]:
+    present = values[~np.isnan(values)]
+    if present.size == 0:
+        return None
+    points = np.percentile(present, FLEET_PERCENTILES) / scale
+    return {f"p{p}": round(float(value), 2) for p, value in zip(FLEET_PERCENTILES, points)}
+
+
+def compute_fleet_analytics(columns: Dict[str, np.ndarray], today: Optional[np.datetime64] = None) -> Dict[str, Any]:
+    """Agregados del inventario calculados de forma vectorizada sobre los arreglos."""
+    total = int(columns["tipo"].size)
+    today = today if today is not None else np.datetime64(datetime.utcnow().date(), "D")
+
+    age_days = (today - columns["fecha_ingreso"]).astype("timedelta64[D]").astype(np.float64)
+    age_days[np.isnat(columns["fecha_ingreso"])] = np.nan
+    age_years = age_days / 365.25
+    known_age = age_years[~np.isnan(age_years)]
+    age_edges = np.asarray(FLEET_AGE_BINS_YEARS + (np.inf,), dtype=np.float64)
+    age_hist, _ = np.histogram(known_age, bins=age_edges)
+
+    ram_gb = columns["ram_bytes"] / CAPACITY_UNITS["GB"]
+    known_ram = ram_gb[~np.isnan(ram_gb)]
+    tier_index = np.digitize(known_ram, FLEET_RAM_TIERS_GB)
+    tier_counts = np.bincount(tier_index, minlength=len(FLEET_RAM_TIERS_GB) + 1)
+    tier_labels = [f"<{FLEET_RAM_TIERS_GB[0]}GB"] + [
+        f"{low}-{high}GB" for low, high in zip(FLEET_RAM_TIERS_GB, FLEET_RAM_TIERS_GB[1:])
+    ] + [f">={FLEET_RAM_TIERS_GB[-1]}GB"]
+
+    by_tipo_estado: Dict[str, Dict[str, int]] = {}
+    if total:
+        pairs = np.char.add(np.char.add(columns["tipo"].astype(str), "|"), columns["estado"].astype(str))
+        for key, count in _grouped_counts(pairs).items():
+            tipo, estado = key.split("|", 1)
+            by_tipo_estado.setdefault(tipo, {})[estado] = count
+
+    age_labels = [
+        f"{low}-{high}" for low, high in zip(FLEET_AGE_BINS_YEARS, FLEET_AGE_BINS_YEARS[1:])
+    ] + [f"{FLEET_AGE_BINS_YEARS[-1]}+"]
 
-    if payload.password:
-        updates["password_hash"] = get_password_hash(payload.password)
-        audit_metadata["password_reset"] = True
+    return {
+        "total": total,
+        "por_tipo": _grouped_counts(columns["tipo"]),
+        "por_estado": _grouped_counts(columns["estado"]),
+        "por_ubicacion": _grouped_counts(columns["ubicacion"]),
+        "por_tipo_estado": by_tipo_estado,
+        "antiguedad": {
+            "histograma_anios": dict(zip(age_labels, (int(count) for count in age_hist))),
+            "sin_fecha": int(total - known_age.size),
+            "percentiles_anios": _percentiles(age_years),
+        },
+        "specs": {
+            "ram_niveles": dict(zip(tier_labels, (int(count) for count in tier_counts))),
+            "ram_sin_dato": int(total - known_ram.size),
+            "ram_percentiles_gb": _percentiles(columns["ram_bytes"], CAPACITY_UNITS["GB"]),
+            "disco_percentiles_gb": _percentiles(columns["disco_bytes"], CAPACITY_UNITS["GB"]),
+            "cpu_percentiles_mhz": _percentiles(columns["cpu_mhz"]),
+        },
+    }
 
-    if not updates:
-        raise HTTPException(status_code=400, detail="No se proporcionaron cambios para actualizar")
+# ==================== DEVICE SERIALS ====================
 
-    try:
-        if updates:
-            response = (
-                supabase.table("users")
-                .update(updates)
-                .eq("id", user_id)
-                .execute()
-            )
+# idx_devices_serial_unique solo admite un serial por dispositivo; los vacíos
+# se guardan como NULL para que varios equipos sin serial puedan coexistir.
+UNIQUE_VIOLATION_CODE = "23505"
 
-            if not response.data:
-                raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
-    except HTTPException:
-        raise
-    except Exception as exc:
-        raise HTTPException(status_code=400, detail=f"No se pudo actualizar el usuario: {exc}")
+def normalize_serial(value: Optional[str]) -> Optional[str]:
+    serial = (value or "").strip()
+    return serial or None
 
-    if audit_metadata:
-        await register_audit_event("UPDATE_USER", user_id, user.id, audit_metadata)
 
-    return {"data": fetch_user_profile_by_id(user_id)}
+def is_unique_violation(error: Any) -> bool:
+    code = getattr(error, "code", None)
+    if code is None and isinstance(error, dict):
+        code = error.get("code")
+    return str(code) == UNIQUE_VIOLATION_CODE
 
 
-@app.get("/admin/org-units")
-async def admin_list_org_units(user: UserProfile = Depends(require_global_admin())):
+def execute_device_write(query, serial: Optional[str]):
+    """Ejecuta un insert/update de devices y traduce el serial duplicado a 409."""
+    try:
+        response = query.execute()
+    except Exception as exc:
+        if is_unique_violation(exc):
+            raise HTTPException(status_code=409, detail=f"Ya existe un dispositivo con el serial {serial}")
+        raise
+    if is_unique_violation(getattr(response, "error", None)):
+        raise HTTPException(status_code=409, detail=f"Ya existe un dispositivo con el serial {serial}")
+    return response
+
+# ==================== LOCATION HIERARCHY ====================
+
+# "Sede Norte / Bloque B / Sala 204" -> ruta "sede-norte/bloque-b/sala-204/".
+# La barra final permite resolver subárboles con un único LIKE 'prefijo/%'.
+LOCATION_SEPARATOR_PATTERN = re.compile(r"\s*[/>|\\,]\s*")
+LOCATION_KEY_PATTERN = re.compile(r"[^a-z0-9]+")
+
+
+def location_key(segment: str) -> str:
+    return LOCATION_KEY_PATTERN.sub("-", strip_accents(segment).lower()).strip("-")
+
+
+def normalize_location(value: Optional[str]) -> tuple[Optional[str], Optional[str]]:
+    """Devuelve (ubicacion legible, ubicacion_path) a partir del texto capturado."""
+    if not value:
+        return None, None
+
+    segments = [
+        re.sub(r"\s+", " ", segment).strip()
+        for segment in LOCATION_SEPARATOR_PATTERN.split(str(value))
+    ]
+    segments = [segment for segment in segments if segment and location_key(segment)]
+    if not segments:
+        return None, None
+
+    display = " / ".join(segments)
+    path = "".join(f"{location_key(segment)}/" for segment in segments)
+    return display, path
+
+
+def normalize_location_prefix(path: str) -> str:
+    """Acepta "sede-norte/bloque-b" o el texto legible y devuelve la ruta con barra final."""
+    keys = [location_key(part) for part in LOCATION_SEPARATOR_PATTERN.split(path)]
+    return "".join(f"{key}/" for key in keys if key)
+
+
+def build_location_tree(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Agrupa filas de location_rollups (path, estado, total) por nodo."""
+    nodes: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        path = row["path"]
+        node = nodes.setdefault(
+            path,
+            {
+                "path": path,
+                "nombre": row.get("nombre") or path.rstrip("/").rsplit("/", 1)[-1],
+                "depth": path.count("/"),
+                "total": 0,
+                "por_estado": {},
+            },
+        )
+        total = int(row.get("total") or 0)
+        node["total"] += total
+        node["por_estado"][row["estado"]] = node["por_estado"].get(row["estado"], 0) + total
+
+    return [node for _, node in sorted(nodes.items()) if node["total"] > 0]
+
+# ==================== BACKUP COMPLIANCE ====================
+
+BACKUP_AT_RISK_RATIO = 0.8
+BACKUP_FREQUENCY_UNITS_HOURS = {
+    "h": 1,
+    "hora": 1,
+    "horas": 1,
+    "d": 24,
+    "dia": 24,
+    "dias": 24,
+    "semana": 168,
+    "semanas": 168,
+    "mes": 720,
+    "meses": 720,
+}
+BACKUP_FREQUENCY_KEYWORDS_HOURS = (
+    ("diari", 24),
+    ("semanal", 168),
+    ("quincenal", 360),
+    ("mensual", 720),
+    ("bimestral", 1440),
+    ("trimestral", 2160),
+    ("semestral", 4380),
+    ("anual", 8760),
+)
+BACKUP_FREQUENCY_PATTERN = re.compile(
+    r"(\d+)\s*(horas|hora|h|dias|dia|d|semanas|semana|meses|mes)\b"
+)
+
+
+def parse_backup_frequency_hours(value: Optional[str]) -> Optional[float]:
+    """Interpreta la frecuencia capturada ("Diaria", "cada 3 días", "12h") en horas."""
+    if not value:
+        return None
+
+    normalized = strip_accents(str(value)).lower()
+
+    match = BACKUP_FREQUENCY_PATTERN.search(normalized)
+    if match:
+        hours = int(match.group(1)) * BACKUP_FREQUENCY_UNITS_HOURS[match.group(2)]
+        return float(hours) or None
+
+    for keyword, hours in BACKUP_FREQUENCY_KEYWORDS_HOURS:
+        if keyword in normalized:
+            return float(hours)
+    return None
+
+
+def _timestamp_seconds(value: Optional[str]) -> float:
+    if not value:
+        return np.nan
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return np.nan
+    if parsed.tzinfo is None:
+        # fecha_backup se guarda con datetime.utcnow() (sin zona horaria)
+        return (parsed - datetime(1970, 1, 1)).total_seconds()
+    return parsed.timestamp()
+
+
+def build_compliance_row(record: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "device_id": record["device_id"],
+        "nombre": record.get("nombre"),
+        "tipo": record.get("tipo"),
+        "org_unit_id": record.get("org_unit_id"),
+        "frecuencia": record.get("frecuencia"),
+        "ultimo_backup": record.get("ultimo_backup"),
+        "ultimo_backup_ts": _timestamp_seconds(record.get("ultimo_backup")),
+        "intervalo_horas": parse_backup_frequency_hours(record.get("frecuencia")),
+    }
+
+
+class BackupComplianceCache(OrgScopedCache):
+    """Snapshots del último backup por dispositivo, actualizables sin recargar."""
+
+    def record_backup(self, device_id: str, fecha_backup: str, frecuencia: Optional[str]) -> None:
+        with self._lock:
+            for _, snapshot in self._entries.values():
+                row = snapshot.get(device_id)
+                if row is None:
+                    continue
+                row.update(
+                    build_compliance_row(
+                        {**row, "device_id": device_id, "ultimo_backup": fecha_backup, "frecuencia": frecuencia}
+                    )
+                )
+
+
+backup_compliance_cache = BackupComplianceCache(BACKUP_COMPLIANCE_TTL_SECONDS)
+
+
+def load_backup_compliance_snapshot(org_unit_id: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    """Último backup exitoso por dispositivo (DISTINCT ON en get_latest_backups)."""
+    response = supabase.rpc("get_latest_backups", {"p_org_unit_id": org_unit_id}).execute()
+    rows = handle_supabase_error(response, "No se pudo calcular el cumplimiento de backups") or []
+    return {row["device_id"]: build_compliance_row(row) for row in rows}
+
+
+def compute_backup_compliance(rows: List[Dict[str, Any]], now: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Estado de cumplimiento de toda la flota en una sola pasada vectorizada."""
+    if not rows:
+        return []
+
+    now = time.time() if now is None else now
+    last = np.asarray([row["ultimo_backup_ts"] for row in rows], dtype=np.float64)
+    interval = np.asarray(
+        [np.nan if row["intervalo_horas"] is None else row["intervalo_horas"] for row in rows],
+        dtype=np.float64,
+    ) * 3600.0
+
+    estados = np.full(len(rows), "AL_DIA", dtype=object)
+    # ratio es NaN sin backup o sin frecuencia: esas filas se reclasifican abajo
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ratio = (now - last) / interval
+        estados[ratio >= BACKUP_AT_RISK_RATIO] = "EN_RIESGO"
+        estados[ratio > 1.0] = "VENCIDO"
+    due_at = last + interval
+
+    estados[np.isnan(interval)] = "SIN_FRECUENCIA"
+    estados[np.isnan(last)] = "SIN_BACKUP"
+
+    results = []
+    for row, estado, due, row_ratio in zip(rows, estados, due_at, ratio):
+        results.append(
+            {
+                "device_id": row["device_id"],
+                "nombre": row["nombre"],
+                "tipo": row["tipo"],
+                "org_unit_id": row["org_unit_id"],
+                "frecuencia": row["frecuencia"],
+                "ultimo_backup": row["ultimo_backup"],
+                "proximo_backup": None
+                if np.isnan(due)
+                else datetime.utcfromtimestamp(float(due)).isoformat(),
+                "avance": None if np.isnan(row_ratio) else round(float(row_ratio), 3),
+                "estado": estado,
+            }
+        )
+    return results
+
+# ==================== HELPDESK SLA METRICS ====================
+
+SLA_SKETCH_RELATIVE_ACCURACY = 0.01
+SLA_QUANTILES = (0.5, 0.9, 0.99)
+SLA_DEFAULT_WINDOW_DAYS = 30
+SLA_METRIC_COLUMNS = {
+    "respuesta": ("tiempo_respuesta_minutos", "fecha_asignacion"),
+    "resolucion": ("tiempo_resolucion_minutos", "fecha_resolucion"),
+}
+
+
+class QuantileSketch:
+    """Sketch de cuantiles con error relativo acotado (estilo DDSketch).
+
+    Cada valor cae en un bucket logarítmico, así que el tamaño depende del
+    rango de valores y no de la cantidad de tickets; dos sketches se
+    combinan sumando buckets.
+    """
+
+    def __init__(self, relative_accuracy: float = SLA_SKETCH_RELATIVE_ACCURACY) -> None:
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._buckets: Dict[int, int] = {}
+        self._zero_count = 0
+        self.count = 0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        if value <= 0:
+            self._zero_count += 1
+            return
+        key = math.ceil(math.log(value) / self._log_gamma)
+        self._buckets[key] = self._buckets.get(key, 0) + 1
+
+    def merge(self, other: "QuantileSketch") -> None:
+        self.count += other.count
+        self._zero_count += other._zero_count
+        for key, value in other._buckets.items():
+            self._buckets[key] = self._buckets.get(key, 0) + value
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self._zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self._buckets):
+            seen += self._buckets[key]
+            if seen > rank:
+                return 2 * self._gamma ** key / (self._gamma + 1)
+        return 2 * self._gamma ** max(self._buckets) / (self._gamma + 1)
+
+
+class SlaMetricsStore:
+    """Sketches por (org unit, prioridad, métrica, día) actualizados al resolver tickets."""
+
+    def __init__(self) -> None:
+        self._sketches: Dict[tuple, QuantileSketch] = {}
+        self._seen: set[tuple[str, str]] = set()
+        self._lock = threading.Lock()
+        self.built_at: Optional[str] = None
+
+    def observe(self, ticket: Dict[str, Any]) -> None:
+        with self._lock:
+            self._observe_locked(ticket)
+
+    def _observe_locked(self, ticket: Dict[str, Any]) -> None:
+        ticket_id = ticket.get("id")
+        for metric, (column, date_column) in SLA_METRIC_COLUMNS.items():
+            value = ticket.get(column)
+            if value is None or not ticket_id or (ticket_id, metric) in self._seen:
+                continue
+            day = str(ticket.get(date_column) or ticket.get("fecha_creacion") or "")[:10]
+            if not day:
+                continue
+            key = (ticket.get("org_unit_id"), ticket.get("prioridad"), metric, day)
+            sketch = self._sketches.get(key)
+            if sketch is None:
+                sketch = self._sketches[key] = QuantileSketch()
+            sketch.add(float(value))
+            self._seen.add((ticket_id, metric))
+
+    def rebuild(self, tickets: Iterator[Dict[str, Any]]) -> int:
+        """Recalcula todo fuera del lock y reemplaza los sketches de una vez."""
+        fresh = SlaMetricsStore()
+        for ticket in tickets:
+            fresh._observe_locked(ticket)
+        with self._lock:
+            self._sketches, self._seen = fresh._sketches, fresh._seen
+            self.built_at = datetime.utcnow().isoformat()
+            return len(self._seen)
+
+    def query(
+        self,
+        org_unit_id: Optional[str],
+        desde: str,
+        hasta: str,
+        prioridad: Optional[str] = None,
+    ) -> Dict[str, Dict[str, Any]]:
+        merged: Dict[tuple[str, str], QuantileSketch] = {}
+        with self._lock:
+            for (org, prio, metric, day), sketch in self._sketches.items():
+                if org_unit_id and org != org_unit_id:
+                    continue
+                if prioridad and prio != prioridad:
+                    continue
+                if not (desde <= day <= hasta):
+                    continue
+                target = merged.setdefault((prio, metric), QuantileSketch())
+                target.merge(sketch)
+
+        result: Dict[str, Dict[str, Any]] = {}
+        for (prio, metric), sketch in sorted(merged.items(), key=lambda item: str(item[0])):
+            result.setdefault(prio or "SIN_PRIORIDAD", {})[metric] = {
+                "count": sketch.count,
+                **{
+                    f"p{int(q * 100)}": round(sketch.quantile(q), 1)
+                    for q in SLA_QUANTILES
+                },
+            }
+        return result
+
+
+sla_metrics = SlaMetricsStore()
+
+
+def iter_resolved_ticket_times() -> Iterator[Dict[str, Any]]:
+    """Tickets con tiempos calculados por calculate_ticket_times, paginados por id."""
+    last_id: Optional[str] = None
+    while True:
+        query = supabase.table("tickets").select(
+            "id, org_unit_id, prioridad, fecha_creacion, fecha_asignacion, fecha_resolucion, "
+            "tiempo_respuesta_minutos, tiempo_resolucion_minutos"
+        ).or_("tiempo_respuesta_minutos.not.is.null,tiempo_resolucion_minutos.not.is.null")
+        if last_id:
+            query = query.gt("id", last_id)
+        response = query.order("id").limit(EXPORT_PAGE_SIZE).execute()
+        page = handle_supabase_error(response, "No se pudieron leer los tiempos de tickets") or []
+        yield from page
+        if len(page) < EXPORT_PAGE_SIZE:
+            return
+        last_id = page[-1]["id"]
+
+# ==================== DUPLICATE TICKET DETECTION ====================
+
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16
+MINHASH_PRIME = (1 << 31) - 1  # primo de Mersenne: a, x, b < 2^31, así (a * x + b) < 2^63 cabe en uint64
+DUPLICATE_SIMILARITY_THRESHOLD = 0.5
+DUPLICATE_MAX_CANDIDATES = 10
+TICKET_ACTIVE_STATES = ("ABIERTO", "EN_PROCESO")
+DUPLICATE_STOPWORDS = frozenset(
+    "a al con de del el en es la las lo los mi mis no por que se sin su sus un una y ya "
+    "me nos le les para como esta este esto hay muy".split()
+)
+TICKET_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def ticket_shingles(titulo: Optional[str], descripcion: Optional[str]) -> set[str]:
+    """Palabras y bigramas del texto normalizado (sin tildes ni palabras vacías)."""
+    text = strip_accents(f"{titulo or ''} {descripcion or ''}").lower()
+    tokens = [
+        token for token in TICKET_TOKEN_PATTERN.findall(text)
+        if token not in DUPLICATE_STOPWORDS
+    ]
+    shingles = set(tokens)
+    shingles.update(f"{first} {second}" for first, second in zip(tokens, tokens[1:]))
+    return shingles
+
+
+class TicketMinHashIndex:
+    """Índice MinHash/LSH en memoria de los tickets activos.
+
+    Con 16 bandas de 4 filas, dos tickets con similitud de Jaccard ~0.5 caen
+    en algún bucket común con alta probabilidad, y la consulta solo compara
+    contra esos candidatos en lugar de toda la tabla.
+    """
+
+    def __init__(self, num_perm: int = MINHASH_PERMUTATIONS, bands: int = MINHASH_BANDS, seed: int = 1) -> None:
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._a = rng.integers(1, MINHASH_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, MINHASH_PRIME, size=num_perm, dtype=np.uint64)
+        self._signatures: Dict[str, tuple[Optional[str], Optional[str], np.ndarray]] = {}
+        self._buckets: Dict[tuple[int, bytes], set[str]] = {}
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def signature(self, shingles: set[str]) -> np.ndarray:
+        if not shingles:
+            return np.full(self.num_perm, MINHASH_PRIME, dtype=np.uint64)
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode()) % MINHASH_PRIME for shingle in shingles),
+            dtype=np.uint64,
+            count=len(shingles),
+        )
+        permuted = (np.outer(hashes, self._a) + self._b) % np.uint64(MINHASH_PRIME)
+        return permuted.min(axis=0)
+
+    @staticmethod
+    def is_empty(signature: np.ndarray) -> bool:
+        # Un texto solo de stopwords no tiene shingles: su firma no indica parecido
+        return bool(np.all(signature == MINHASH_PRIME))
+
+    def _band_keys(self, signature: np.ndarray) -> List[tuple[int, bytes]]:
+        return [
+            (band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+            for band in range(self.bands)
+        ]
+
+    def add(
+        self,
+        ticket_id: str,
+        org_unit_id: Optional[str],
+        signature: np.ndarray,
+        solicitante_id: Optional[str] = None,
+    ) -> None:
+        with self._lock:
+            self._remove_locked(ticket_id)
+            self._signatures[ticket_id] = (org_unit_id, solicitante_id, signature)
+            for key in self._band_keys(signature):
+                self._buckets.setdefault(key, set()).add(ticket_id)
+
+    def remove(self, ticket_id: str) -> None:
+        with self._lock:
+            self._remove_locked(ticket_id)
+
+    def _remove_locked(self, ticket_id: str) -> None:
+        entry = self._signatures.pop(ticket_id, None)
+        if entry is None:
+            return
+        for key in self._band_keys(entry[2]):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(ticket_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def get_signature(self, ticket_id: str) -> Optional[np.ndarray]:
+        entry = self._signatures.get(ticket_id)
+        return entry[2] if entry else None
+
+    def query(
+        self,
+        signature: np.ndarray,
+        org_unit_id: Optional[str],
+        *,
+        global_scope: bool = False,
+        exclude: Optional[str] = None,
+        solicitante_id: Optional[str] = None,
+        threshold: float = DUPLICATE_SIMILARITY_THRESHOLD,
+        limit: int = DUPLICATE_MAX_CANDIDATES,
+    ) -> List[tuple[str, float]]:
+        """Candidatos (ticket_id, similitud estimada) del mismo alcance.
+        Solo `global_scope` (LIDER_TI) cruza org units: sin org unit no hay
+        candidatos. Con `solicitante_id` solo se consideran los tickets de ese
+        solicitante."""
+        if self.is_empty(signature) or (not global_scope and not org_unit_id):
+            return []
+        with self._lock:
+            candidates: set[str] = set()
+            for key in self._band_keys(signature):
+                candidates.update(self._buckets.get(key, ()))
+            candidates.discard(exclude)
+
+            scored = []
+            for candidate in candidates:
+                candidate_org, candidate_owner, candidate_signature = self._signatures[candidate]
+                if not global_scope and candidate_org != org_unit_id:
+                    continue
+                if solicitante_id and candidate_owner != solicitante_id:
+                    continue
+                similarity = float(np.mean(candidate_signature == signature))
+                if similarity >= threshold:
+                    scored.append((candidate, round(similarity, 3)))
+
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored[:limit]
+
+    def index_ticket(self, ticket: Dict[str, Any]) -> np.ndarray:
+        signature = self.signature(ticket_shingles(ticket.get("titulo"), ticket.get("descripcion")))
+        if ticket.get("estado", "ABIERTO") in TICKET_ACTIVE_STATES and not self.is_empty(signature):
+            self.add(ticket["id"], ticket.get("org_unit_id"), signature, ticket.get("solicitante_id"))
+        else:
+            self.remove(ticket["id"])
+        return signature
+
+
+ticket_duplicate_index = TicketMinHashIndex()
+
+
+def ensure_duplicate_index_loaded() -> None:
+    """Carga inicial de los tickets activos (una vez por proceso)."""
+    if ticket_duplicate_index.loaded:
+        return
+    last_id: Optional[str] = None
+    while True:
+        query = supabase.table("tickets").select(
+            "id, titulo, descripcion, estado, org_unit_id, solicitante_id"
+        ).in_("estado", list(TICKET_ACTIVE_STATES))
+        if last_id:
+            query = query.gt("id", last_id)
+        response = query.order("id").limit(EXPORT_PAGE_SIZE).execute()
+        page = handle_supabase_error(response, "No se pudo cargar el índice de duplicados") or []
+        for ticket in page:
+            ticket_duplicate_index.index_ticket(ticket)
+        if len(page) < EXPORT_PAGE_SIZE:
+            break
+        last_id = page[-1]["id"]
+    ticket_duplicate_index.loaded = True
+
+
+def duplicate_requester_scope(user: UserProfile) -> Optional[str]:
+    """Los solicitantes solo ven duplicados entre sus propios tickets."""
+    return None if user.rol in TICKET_STAFF_ROLES else user.id
+
+
+def fetch_duplicate_candidates(matches: List[tuple[str, float]], user: UserProfile) -> List[Dict[str, Any]]:
+    if not matches:
+        return []
+    query = (
+        supabase.table("tickets")
+        .select("id, titulo, estado, prioridad, fecha_creacion")
+        .in_("id", [ticket_id for ticket_id, _ in matches])
+    )
+    solicitante_id = duplicate_requester_scope(user)
+    if solicitante_id:
+        query = query.eq("solicitante_id", solicitante_id)
+    response = query.execute()
+    rows = {row["id"]: row for row in (handle_supabase_error(response, "No se pudieron obtener tickets similares") or [])}
+    return [
+        {**rows[ticket_id], "similitud": similarity}
+        for ticket_id, similarity in matches
+        if ticket_id in rows
+    ]
+
+# ==================== TICKET AUTO-ASSIGNMENT ====================
+
+TICKET_PRIORITY_WEIGHTS = {"BAJA": 1, "MEDIA": 2, "ALTA": 4, "CRITICA": 8}
+
+
+def ticket_weight(ticket: Dict[str, Any]) -> int:
+    return TICKET_PRIORITY_WEIGHTS.get(ticket.get("prioridad") or "MEDIA", TICKET_PRIORITY_WEIGHTS["MEDIA"])
+
+
+class TicketAssignmentScheduler:
+    """Carga de trabajo del personal TI por org unit.
+
+    La carga de cada técnico es la suma de pesos por prioridad de sus tickets
+    activos. Cada org unit mantiene un min-heap (carga, técnico) con borrado
+    perezoso: al cambiar una carga se empuja la entrada nueva y las obsoletas
+    se descartan cuando llegan a la cima, así que asignar es O(log n).
+    """
+
+    def __init__(self) -> None:
+        self._loads: Dict[str, Dict[str, int]] = {}
+        self._heaps: Dict[str, List[tuple[int, str]]] = {}
+        self._tickets: Dict[str, tuple[str, str, int]] = {}
+        self._lock = threading.Lock()
+        self.loaded = False
+        self.roster_loaded_at: Optional[float] = None
+
+    def set_staff(self, org_unit_id: str, staff_ids: List[str]) -> None:
+        with self._lock:
+            self._set_staff_locked(org_unit_id, staff_ids)
+
+    def _set_staff_locked(self, org_unit_id: str, staff_ids: List[str]) -> None:
+        # La carga sale de los tickets ya registrados: refrescar el personal no la reinicia
+        loads = {staff_id: 0 for staff_id in staff_ids}
+        for ticket_org, assignee, weight in self._tickets.values():
+            if ticket_org == org_unit_id and assignee in loads:
+                loads[assignee] += weight
+        self._loads[org_unit_id] = loads
+        self._heaps[org_unit_id] = [(load, staff_id) for staff_id, load in loads.items()]
+        heapq.heapify(self._heaps[org_unit_id])
+
+    def set_roster(self, staff_by_org: Dict[str, List[str]]) -> None:
+        """Reemplaza el personal de todas las org units (altas, bajas y traslados)."""
+        with self._lock:
+            for org_unit_id in set(self._loads) - set(staff_by_org):
+                del self._loads[org_unit_id]
+                del self._heaps[org_unit_id]
+            for org_unit_id, staff_ids in staff_by_org.items():
+                self._set_staff_locked(org_unit_id, staff_ids)
+            self.roster_loaded_at = time.monotonic()
+
+    def roster_stale(self, ttl_seconds: float) -> bool:
+        return self.roster_loaded_at is None or time.monotonic() - self.roster_loaded_at > ttl_seconds
+
+    def invalidate_roster(self) -> None:
+        self.roster_loaded_at = None
+
+    def _adjust(self, org_unit_id: str, staff_id: str, delta: int) -> None:
+        loads = self._loads.get(org_unit_id)
+        if loads is None or staff_id not in loads:
+            return
+        loads[staff_id] += delta
+        heap = self._heaps[org_unit_id]
+        heapq.heappush(heap, (loads[staff_id], staff_id))
+        if len(heap) > 4 * len(loads) + 16:
+            self._heaps[org_unit_id] = [(load, staff) for staff, load in loads.items()]
+            heapq.heapify(self._heaps[org_unit_id])
+
+    def track(self, ticket: Dict[str, Any]) -> None:
+        """Refleja el estado actual del ticket (crear, reasignar, cerrar)."""
+        with self._lock:
+            previous = self._tickets.pop(ticket["id"], None)
+            if previous:
+                self._adjust(previous[0], previous[1], -previous[2])
+            org_unit_id = ticket.get("org_unit_id")
+            assignee = ticket.get("asignado_a")
+            if org_unit_id and assignee and ticket.get("estado", "ABIERTO") in TICKET_ACTIVE_STATES:
+                weight = ticket_weight(ticket)
+                self._tickets[ticket["id"]] = (org_unit_id, assignee, weight)
+                self._adjust(org_unit_id, assignee, weight)
+
+    def pick(self, org_unit_id: Optional[str]) -> Optional[str]:
+        """Técnico con menor carga de la org unit (None si no hay personal)."""
+        with self._lock:
+            loads = self._loads.get(org_unit_id or "")
+            heap = self._heaps.get(org_unit_id or "")
+            while heap:
+                load, staff_id = heap[0]
+                if loads.get(staff_id) == load:
+                    return staff_id
+                heapq.heappop(heap)
+            return None
+
+    def workload(self, org_unit_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            loads = dict(self._loads.get(org_unit_id, {}))
+        return [
+            {"usuario_id": staff_id, "carga": load}
+            for staff_id, load in sorted(loads.items(), key=lambda item: (item[1], item[0]))
+        ]
+
+    def plan_rebalance(self, org_unit_id: str, movable: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Redistribuye los tickets movibles (mayor peso primero) hacia el técnico
+        menos cargado; si el asignado actual empata con el mínimo, se conserva."""
+        with self._lock:
+            loads = dict(self._loads.get(org_unit_id, {}))
+            for ticket in movable:
+                tracked = self._tickets.get(ticket["id"])
+                if tracked and tracked[1] in loads:
+                    loads[tracked[1]] -= tracked[2]
+        if not loads:
+            return []
+
+        heap = [(load, staff_id) for staff_id, load in loads.items()]
+        heapq.heapify(heap)
+        moves = []
+        ordered = sorted(movable, key=lambda ticket: (-ticket_weight(ticket), ticket.get("fecha_creacion") or ""))
+        for ticket in ordered:
+            while heap[0][0] != loads[heap[0][1]]:
+                heapq.heappop(heap)
+            min_load, target = heap[0]
+            current = ticket.get("asignado_a")
+            if current in loads and loads[current] <= min_load:
+                target = current
+            loads[target] += ticket_weight(ticket)
+            heapq.heappush(heap, (loads[target], target))
+            if target != current:
+                moves.append({"ticket_id": ticket["id"], "desde": current, "hacia": target})
+        return moves
+
+
+ticket_assignment_scheduler = TicketAssignmentScheduler()
+
+
+def refresh_assignment_roster() -> None:
+    """Personal TI activo por org unit."""
+    response = (
+        supabase.table("users")
+        .select("id, org_unit_id")
+        .eq("rol", "TI")
+        .eq("activo", True)
+        .execute()
+    )
+    staff_by_org: Dict[str, List[str]] = {}
+    for row in handle_supabase_error(response, "No se pudo cargar el personal TI") or []:
+        if row.get("org_unit_id"):
+            staff_by_org.setdefault(row["org_unit_id"], []).append(row["id"])
+    ticket_assignment_scheduler.set_roster(staff_by_org)
+
+
+def ensure_assignment_scheduler_loaded() -> None:
+    """Carga inicial de los tickets activos asignados; el personal TI se vuelve
+    a leer cada ASSIGNMENT_ROSTER_TTL_SECONDS o cuando se modifica un usuario.
+    Hace consultas bloqueantes: desde un endpoint se llama con asyncio.to_thread."""
+    if ticket_assignment_scheduler.roster_stale(ASSIGNMENT_ROSTER_TTL_SECONDS):
+        refresh_assignment_roster()
+    if ticket_assignment_scheduler.loaded:
+        return
+
+    last_id: Optional[str] = None
+    while True:
+        query = supabase.table("tickets").select(
+            "id, estado, prioridad, asignado_a, org_unit_id"
+        ).in_("estado", list(TICKET_ACTIVE_STATES))
+        if last_id:
+            query = query.gt("id", last_id)
+        response = query.order("id").limit(EXPORT_PAGE_SIZE).execute()
+        page = handle_supabase_error(response, "No se pudo cargar la carga de tickets") or []
+        for ticket in page:
+            ticket_assignment_scheduler.track(ticket)
+        if len(page) < EXPORT_PAGE_SIZE:
+            break
+        last_id = page[-1]["id"]
+    ticket_assignment_scheduler.loaded = True
+
+
+def fetch_rebalance_candidates(org_unit_id: str) -> List[Dict[str, Any]]:
+    """Tickets ABIERTO de la org unit: los EN_PROCESO ya tienen a alguien trabajando."""
+    response = (
+        supabase.table("tickets")
+        .select("id, titulo, prioridad, asignado_a, fecha_creacion")
+        .eq("org_unit_id", org_unit_id)
+        .eq("estado", "ABIERTO")
+        .execute()
+    )
+    return handle_supabase_error(response, "No se pudieron obtener los tickets abiertos") or []
+
+
+def resolve_assignment_org(user: UserProfile, org_unit_id: Optional[str]) -> str:
+    scope = org_unit_id if user.rol == "LIDER_TI" else user.org_unit_id
+    if not scope:
+        raise HTTPException(status_code=400, detail="Debe indicar la unidad organizacional")
+    return scope
+
+# ==================== TICKET EVENTS ====================
+
+class TicketEventSubscriber:
+    def __init__(self, user: UserProfile) -> None:
+        self.user = user
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=100)
+        self.lagging = False
+
+
+class TicketEventHub:
+    """Fan-out en proceso de eventos de tickets hacia los streams SSE abiertos.
+
+    Guarda los últimos eventos en un buffer circular para reanudar con
+    Last-Event-ID. Los ids llevan el epoch del proceso: un id de otro proceso
+    (o ya fuera del buffer) obliga al cliente a resincronizar.
+    """
+
+    def __init__(self, buffer_size: int) -> None:
+        self._epoch = uuid4().hex[:8]
+        self._sequence = 0
+        self._buffer: deque = deque(maxlen=buffer_size)
+        self._subscribers: set[TicketEventSubscriber] = set()
+
+    @staticmethod
+    def is_visible(event: Dict[str, Any], user: UserProfile) -> bool:
+        if user.rol == "LIDER_TI":
+            return True
+        if user.rol in ["TI", "DIRECTOR"]:
+            return bool(user.org_unit_id) and event.get("org_unit_id") == user.org_unit_id
+        return event.get("solicitante_id") == user.id
+
+    def publish(self, event_type: str, ticket: Dict[str, Any], data: Dict[str, Any]) -> Dict[str, Any]:
+        self._sequence += 1
+        event = {
+            "id": f"{self._epoch}:{self._sequence}",
+            "seq": self._sequence,
+            "type": event_type,
+            "ticket_id": ticket.get("id"),
+            "org_unit_id": ticket.get("org_unit_id"),
+            "solicitante_id": ticket.get("solicitante_id"),
+            "data": data,
+            "timestamp": datetime.utcnow().isoformat(),
+        }
+        self._buffer.append(event)
+
+        for subscriber in list(self._subscribers):
+            if not self.is_visible(event, subscriber.user):
+                continue
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                subscriber.lagging = True
+        return event
+
+    def subscribe(self, user: UserProfile) -> TicketEventSubscriber:
+        subscriber = TicketEventSubscriber(user)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: TicketEventSubscriber) -> None:
+        self._subscribers.discard(subscriber)
+
+    def replay(self, last_event_id: Optional[str], user: UserProfile) -> Optional[List[Dict[str, Any]]]:
+        """Eventos posteriores a last_event_id; None si ya no se pueden reconstruir."""
+        if not last_event_id:
+            return []
+        epoch, _, raw_sequence = last_event_id.partition(":")
+        if epoch != self._epoch or not raw_sequence.isdigit():
+            return None
+        sequence = int(raw_sequence)
+        oldest = self._buffer[0]["seq"] if self._buffer else self._sequence + 1
+        if sequence + 1 < oldest and sequence < self._sequence:
+            return None
+        return [
+            event for event in self._buffer
+            if event["seq"] > sequence and self.is_visible(event, user)
+        ]
+
+
+ticket_event_hub = TicketEventHub(TICKET_EVENTS_BUFFER_SIZE)
+
+
+def format_sse(event: Dict[str, Any]) -> str:
+    payload = {key: event[key] for key in ("type", "ticket_id", "data", "timestamp")}
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(payload, default=str)}\n\n"
+
+
+def format_sse_resync() -> str:
+    return 'event: resync\ndata: {"type": "resync"}\n\n'
+
+
+class StreamTicketRegistry:
+    """Tickets firmados de un solo uso para abrir el stream SSE.
+
+    EventSource no envía cabeceras, así que el JWT de sesión terminaría en la
+    query string (y en los logs de proxies). En su lugar se emite un ticket
+    que vence en segundos; aquí se recuerdan los ya usados hasta que expiran.
+    """
+
+    def __init__(self, ttl_seconds: int) -> None:
+        self.ttl_seconds = ttl_seconds
+        self._used: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def issue(self, user_id: str) -> str:
+        expire = datetime.utcnow() + timedelta(seconds=self.ttl_seconds)
+        claims = {"sub": user_id, "exp": expire, "scope": STREAM_TICKET_SCOPE, "jti": uuid4().hex}
+        return jwt.encode(claims, require_jwt_secret(), algorithm=JWT_ALGORITHM)
+
+    def redeem(self, ticket: str) -> str:
+        """Valida el ticket, lo marca como usado y devuelve el id del usuario."""
+        try:
+            payload = jwt.decode(ticket, require_jwt_secret(), algorithms=[JWT_ALGORITHM])
+        except JWTError:
+            raise HTTPException(status_code=401, detail="Ticket de stream inválido o expirado")
+        jti = payload.get("jti")
+        if payload.get("scope") != STREAM_TICKET_SCOPE or not jti or not payload.get("sub"):
+            raise HTTPException(status_code=401, detail="Ticket de stream inválido")
+
+        now = time.time()
+        with self._lock:
+            for used_jti, expires_at in list(self._used.items()):
+                if expires_at <= now:
+                    del self._used[used_jti]
+            if jti in self._used:
+                raise HTTPException(status_code=401, detail="Ticket de stream ya utilizado")
+            self._used[jti] = now + self.ttl_seconds
+        return payload["sub"]
+
+
+stream_tickets = StreamTicketRegistry(TICKET_EVENTS_TICKET_SECONDS)
+
+# ==================== ATTACHMENT STORAGE ====================
+
+class AttachmentStorage(ABC):
+    """Subidas por fragmentos reanudables desde cualquier instancia.
+
+    El manifiesto y cada fragmento se guardan como objetos bajo
+    ``uploads/<upload_id>/`` en el mismo almacenamiento compartido que los
+    adjuntos, así que una función serverless distinta puede continuar la
+    subida. Cada fragmento se nombra por su rango de bytes y nunca se
+    sobrescribe; el offset es el final de la cadena contigua desde el byte 0.
+    Al completarse, los fragmentos se ensamblan en el objeto definitivo.
+    Las subidas creadas hace más de ``ttl_seconds`` se eliminan."""
+
+    PART_PATTERN = re.compile(r"(\d{12})-(\d{12})\.part")
+
+    def __init__(self, ttl_seconds: int = ATTACHMENT_UPLOAD_TTL_SECONDS) -> None:
+        self.ttl_seconds = ttl_seconds
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._last_purge = 0.0
+
+    @abstractmethod
+    def put_object(self, key: str, data: bytes, tipo_mime: Optional[str]) -> None:
+        """Crea el objeto; FileExistsError si ya existe."""
+
+    @abstractmethod
+    def get_object(self, key: str) -> bytes:
+        """Contenido del objeto; FileNotFoundError si no existe."""
+
+    @abstractmethod
+    def list_objects(self, prefix: str) -> List[str]:
+        """Nombres de los objetos (o carpetas) directamente bajo ``prefix``."""
+
+    @abstractmethod
+    def remove_objects(self, keys: List[str]) -> None:
+        """Elimina los objetos indicados (los inexistentes se ignoran)."""
+
+    @abstractmethod
+    def signed_url(self, key: str, expires_in: int) -> str:
+        """URL temporal de lectura para un objeto privado."""
+
+    def _session_prefix(self, upload_id: str) -> str:
+        return f"{ATTACHMENT_UPLOADS_PREFIX}/{upload_id}"
+
+    def _manifest_key(self, upload_id: str) -> str:
+        return f"{self._session_prefix(upload_id)}/manifest.json"
+
+    def _part_key(self, upload_id: str, start: int, end: int) -> str:
+        return f"{self._session_prefix(upload_id)}/{start:012d}-{end:012d}.part"
+
+    def lock(self, upload_id: str) -> asyncio.Lock:
+        return self._locks.setdefault(upload_id, asyncio.Lock())
+
+    def create(self, upload_id: str, manifest: Dict[str, Any]) -> None:
+        self.put_object(self._manifest_key(upload_id), json.dumps(manifest).encode(), "application/json")
+
+    def load(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        if not re.fullmatch(r"[0-9a-f]{32}", upload_id):
+            return None
+        try:
+            manifest = json.loads(self.get_object(self._manifest_key(upload_id)))
+        except FileNotFoundError:
+            return None
+        manifest["offset"] = self.offset(upload_id)
+        return manifest
+
+    def parts(self, upload_id: str) -> List[tuple[int, int]]:
+        """Rangos contiguos desde 0. Si dos instancias escribieron el mismo
+        offset, el fragmento más largo contiene al otro (mismo archivo)."""
+        ends: Dict[int, int] = {}
+        for name in self.list_objects(self._session_prefix(upload_id)):
+            match = self.PART_PATTERN.fullmatch(name)
+            if match:
+                start, end = int(match.group(1)), int(match.group(2))
+                ends[start] = max(end, ends.get(start, end))
+
+        chain: List[tuple[int, int]] = []
+        position = 0
+        while position in ends and ends[position] > position:
+            chain.append((position, ends[position]))
+            position = ends[position]
+        return chain
+
+    def offset(self, upload_id: str) -> int:
+        chain = self.parts(upload_id)
+        return chain[-1][1] if chain else 0
+
+    async def append(self, upload_id: str, offset: int, chunks, limit: int) -> int:
+        """Guarda el cuerpo recibido como fragmento ``offset``-``fin`` y devuelve el nuevo offset."""
+        buffer = bytearray()
+        async for chunk in chunks:
+            if offset + len(buffer) + len(chunk) > limit:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail="El fragmento excede el tamaño declarado del archivo",
+                )
+            if len(buffer) + len(chunk) > ATTACHMENT_MAX_CHUNK_BYTES:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"Cada fragmento admite como máximo {ATTACHMENT_MAX_CHUNK_BYTES} bytes",
+                )
+            buffer.extend(chunk)
+        if not buffer:
+            return offset
+
+        end = offset + len(buffer)
+        try:
+            await asyncio.to_thread(
+                self.put_object, self._part_key(upload_id, offset, end), bytes(buffer), "application/octet-stream"
+            )
+        except FileExistsError:
+            current = await asyncio.to_thread(self.offset, upload_id)
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail={"message": "El offset no coincide con lo recibido", "offset": current},
+            )
+        return end
+
+    def publish(self, upload_id: str, key: str, tipo_mime: Optional[str]) -> str:
+        """Ensambla los fragmentos en el objeto definitivo y devuelve su ruta."""
+        content = b"".join(
+            self.get_object(self._part_key(upload_id, start, end)) for start, end in self.parts(upload_id)
+        )
+        try:
+            self.put_object(key, content, tipo_mime or "application/octet-stream")
+        except FileExistsError:
+            # Reintento tras un fallo al registrar el adjunto: el objeto ya está completo
+            pass
+        return key
+
+    def unpublish(self, key: str) -> None:
+        """Elimina un objeto publicado (si no se pudo registrar en attachments)."""
+        self.remove_objects([key])
+
+    def discard(self, upload_id: str) -> None:
+        prefix = self._session_prefix(upload_id)
+        self.remove_objects([f"{prefix}/{name}" for name in self.list_objects(prefix)])
+        self._locks.pop(upload_id, None)
+
+    def purge_expired(self, now: Optional[float] = None) -> int:
+        """Elimina las subidas abandonadas (como máximo una pasada por intervalo)."""
+        now = time.time() if now is None else now
+        if now - self._last_purge < ATTACHMENT_PURGE_INTERVAL_SECONDS:
+            return 0
+        self._last_purge = now
+
+        purged = 0
+        for upload_id in self.list_objects(ATTACHMENT_UPLOADS_PREFIX):
+            lock = self._locks.get(upload_id)
+            if lock is not None and lock.locked():
+                continue
+            try:
+                manifest = json.loads(self.get_object(self._manifest_key(upload_id)))
+            except FileNotFoundError:
+                continue
+            if now - manifest.get("creado_en", 0) > self.ttl_seconds:
+                self.discard(upload_id)
+                purged += 1
+        return purged
+
+
+class LocalAttachmentStorage(AttachmentStorage):
+    """Sistema de archivos local (desarrollo y pruebas)."""
+
+    def __init__(self, root_dir: str) -> None:
+        super().__init__()
+        self.root_dir = root_dir
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root_dir, *key.split("/"))
+
+    def put_object(self, key: str, data: bytes, tipo_mime: Optional[str]) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "xb") as handle:
+            handle.write(data)
+
+    def get_object(self, key: str) -> bytes:
+        with open(self._path(key), "rb") as handle:
+            return handle.read()
+
+    def list_objects(self, prefix: str) -> List[str]:
+        try:
+            return sorted(os.listdir(self._path(prefix)))
+        except FileNotFoundError:
+            return []
+
+    def remove_objects(self, keys: List[str]) -> None:
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            try:
+                os.rmdir(os.path.dirname(self._path(key)))
+            except OSError:
+                pass
+
+    def signed_url(self, key: str, expires_in: int) -> str:
+        return Path(self._path(key)).as_uri()
+
+
+def storage_error_status(exc: Exception) -> Optional[int]:
+    """Código HTTP de un StorageException de Supabase (el detalle llega como dict)."""
+    detail = exc.args[0] if exc.args else None
+    if isinstance(detail, dict):
+        raw = detail.get("statusCode") or detail.get("status")
+        if raw is not None and str(raw).isdigit():
+            return int(raw)
+    return None
+
+
+class SupabaseAttachmentStorage(AttachmentStorage):
+    """Bucket privado de Supabase Storage (producción)."""
+
+    LIST_PAGE_SIZE = 1000
+
+    def __init__(self, bucket: str) -> None:
+        super().__init__()
+        self.bucket = bucket
+
+    def _bucket(self):
+        return supabase.storage.from_(self.bucket)
+
+    def put_object(self, key: str, data: bytes, tipo_mime: Optional[str]) -> None:
+        try:
+            self._bucket().upload(
+                key, data, {"content-type": tipo_mime or "application/octet-stream", "upsert": "false"}
+            )
+        except Exception as exc:
+            if storage_error_status(exc) == 409:
+                raise FileExistsError(key) from exc
+            raise
+
+    def get_object(self, key: str) -> bytes:
+        try:
+            return self._bucket().download(key)
+        except Exception as exc:
+            if storage_error_status(exc) in (400, 404):
+                raise FileNotFoundError(key) from exc
+            raise
+
+    def list_objects(self, prefix: str) -> List[str]:
+        names: List[str] = []
+        while True:
+            page = self._bucket().list(prefix, {"limit": self.LIST_PAGE_SIZE, "offset": len(names)}) or []
+            names.extend(item["name"] for item in page)
+            if len(page) < self.LIST_PAGE_SIZE:
+                return names
+
+    def remove_objects(self, keys: List[str]) -> None:
+        if keys:
+            self._bucket().remove(keys)
+
+    def signed_url(self, key: str, expires_in: int) -> str:
+        result = self._bucket().create_signed_url(key, expires_in)
+        return result.get("signedURL") or result.get("signedUrl")
+
+
+def build_attachment_storage() -> AttachmentStorage:
+    if ATTACHMENT_STORAGE == "supabase":
+        return SupabaseAttachmentStorage(ATTACHMENT_BUCKET)
+    return LocalAttachmentStorage(ATTACHMENT_LOCAL_DIR)
+
+
+attachment_storage = build_attachment_storage()
+
+
+def attachment_object_key(manifest: Dict[str, Any], upload_id: str) -> str:
+    safe_name = re.sub(r"[^A-Za-z0-9._-]+", "-", strip_accents(manifest["nombre"])).strip("-.") or "archivo"
+    return f"{manifest['entidad_tipo']}/{manifest['entidad_id']}/{upload_id}-{safe_name}"
+
+
+async def load_upload_session(upload_id: str, user: UserProfile) -> Dict[str, Any]:
+    manifest = await asyncio.to_thread(attachment_storage.load, upload_id)
+    if not manifest or manifest.get("subido_por") != user.id:
+        raise HTTPException(status_code=404, detail="Subida no encontrada")
+    return manifest
+
+
+def upload_session_payload(upload_id: str, manifest: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "upload_id": upload_id,
+        "nombre": manifest["nombre"],
+        "offset": manifest["offset"],
+        "tamanio_bytes": manifest["tamanio_bytes"],
+    }
+
+# ==================== DASHBOARD METRICS ====================
+
+DASHBOARD_DEVICE_COUNTERS = ("total", "activos", "reparacion", "retirados")
+DASHBOARD_TICKET_COUNTERS = (
+    "total", "abiertos", "en_proceso", "resueltos", "cerrados",
+    "prioridad_baja", "prioridad_media", "prioridad_alta", "prioridad_critica",
+)
+
+
+def build_dashboard_metrics(stats: Dict[str, Any]) -> Dict[str, Any]:
+    """Normaliza la respuesta del RPC (los contadores BIGINT/NUMERIC pueden llegar como texto)."""
+    devices = stats.get("dispositivos") or {}
+    tickets = stats.get("tickets") or {}
+    backups = stats.get("backups") or {}
+
+    def average(key: str) -> Optional[float]:
+        value = tickets.get(key)
+        return round(float(value), 1) if value is not None else None
+
+    return {
+        "dispositivos": {key: int(devices.get(key) or 0) for key in DASHBOARD_DEVICE_COUNTERS},
+        "tickets": {
+            **{key: int(tickets.get(key) or 0) for key in DASHBOARD_TICKET_COUNTERS},
+            "tiempo_promedio_respuesta": average("tiempo_promedio_respuesta"),
+            "tiempo_promedio_resolucion": average("tiempo_promedio_resolucion"),
+        },
+        "backups": {"total": int(backups.get("total") or 0)},
+    }
+
+
+org_breakdown_cache = OrgScopedCache(ORG_BREAKDOWN_TTL_SECONDS)
+
+
+def load_dashboard_metrics(org_unit_id: Optional[str]) -> Dict[str, Any]:
+    """Lee dashboard_counters, que los triggers mantienen en la misma transacción
+    de cada escritura: el resultado es exacto sin importar qué instancia escribió."""
+    response = supabase.rpc("get_dashboard_counters", {"p_org_unit_id": org_unit_id}).execute()
+    stats = handle_supabase_error(response, "No se pudieron obtener las métricas del dashboard") or {}
+    return build_dashboard_metrics(stats)
+
+
+def dashboard_metrics_for(user: UserProfile) -> Dict[str, Any]:
+    org_unit_id = resolve_org_scope(user)
+    if user.rol != "LIDER_TI" and not org_unit_id:
+        return build_dashboard_metrics({})
+    return load_dashboard_metrics(org_unit_id)
+
+
+def fetch_dashboard_drift() -> List[Dict[str, Any]]:
+    """Diferencias (recalculado - contador) por org unit, calculadas en una sola consulta."""
+    response = supabase.rpc("get_dashboard_counter_drift", {}).execute()
+    rows = handle_supabase_error(response, "No se pudo verificar la deriva de los contadores") or []
+    report: Dict[Optional[str], Dict[str, int]] = {}
+    for row in rows:
+        drift = report.setdefault(row.get("org_unit_id"), {})
+        drift[f"{row['seccion']}.{row['contador']}"] = int(row["esperado"]) - int(row["actual"])
+    return [{"org_unit_id": org_unit_id, "deriva": drift} for org_unit_id, drift in report.items()]
+
+
+def rebuild_dashboard_counters() -> None:
+    response = supabase.rpc("rebuild_dashboard_counters", {}).execute()
+    handle_supabase_error(response, "No se pudieron reconstruir los contadores")
+
+METRIC_SERIES = ("tickets_creados", "tickets_resueltos", "backups", "backups_fallidos", "device_logs")
+SERIES_STEPS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+SERIES_DEFAULT_BUCKETS = {"hour": 48, "day": 30}
+SERIES_MAX_BUCKETS = 1000
+
+
+def to_utc_naive(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def truncate_bucket(value: datetime, granularidad: str) -> datetime:
+    value = to_utc_naive(value).replace(minute=0, second=0, microsecond=0)
+    return value.replace(hour=0) if granularidad == "day" else value
+
+
+def build_metric_series(
+    rows: List[Dict[str, Any]],
+    metricas: List[str],
+    granularidad: str,
+    desde: datetime,
+    hasta: datetime,
+) -> Dict[str, List[Dict[str, Any]]]:
+    """Series densas [desde, hasta): los buckets sin eventos no existen en los rollups y se rellenan con 0."""
+    totals = {
+        (row["metrica"], truncate_bucket(datetime.fromisoformat(str(row["bucket"])), granularidad)): int(row["total"])
+        for row in rows
+    }
+    step = SERIES_STEPS[granularidad]
+    buckets = []
+    bucket = desde
+    while bucket < hasta:
+        buckets.append(bucket)
+        bucket += step
+    return {
+        metrica: [
+            {"bucket": bucket.isoformat() + "Z", "total": totals.get((metrica, bucket), 0)}
+            for bucket in buckets
+        ]
+        for metrica in metricas
+    }
+
+# ==================== ROUTES ====================
+
+@app.get("/")
+async def root():
+    return {
+        "app": "Gemelli IT API",
+        "version": "1.0.0",
+        "status": "running",
+        "audit_system": "Hash Chain"
+    }
+
+@app.get("/health")
+async def health():
+    return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
+
+
+@app.get("/healt")
+async def health_database_check():
+    """Verifica la conexión con la base de datos de Supabase."""
+
+    try:
+        response = supabase.table("users").select("id").limit(1).execute()
+        data = handle_supabase_error(
+            response, "No se pudo conectar a la base de datos de Supabase"
+        )
+    except HTTPException:
+        raise
+    except Exception as exc:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"No se pudo conectar a la base de datos: {exc}",
+        )
+
+    return {
+        "status": "healthy",
+        "database": "connected",
+        "timestamp": datetime.utcnow().isoformat(),
+        "records_checked": len(data or []),
+    }
+    
+
+
+@app.post("/debug/supabase-insert")
+async def supabase_insert_probe(request: SupabaseInsertProbe):
+    """Ejecuta un insert de prueba en Supabase y registra los errores detalladamente."""
+
+    try:
+        payload = request.payload or {}
+        payload.setdefault("inserted_at", datetime.utcnow().isoformat())
+
+        response = supabase.table(request.table).insert(payload).execute()
+        data = handle_supabase_error(
+            response, "Fallo al insertar prueba en Supabase", require_data=False
+        )
+        return {"status": "ok", "table": request.table, "data": data}
+    except HTTPException:
+        logger.error(
+            "Inserción de prueba en Supabase falló para tabla %s", request.table, exc_info=True
+        )
+        raise
+    except Exception as exc:
+        logger.exception("Error inesperado en inserción de prueba de Supabase")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"No se pudo ejecutar la inserción de prueba: {exc}",
+        )
+        
+# --- AUTH ---
+
+@app.get("/auth/profile", response_model=UserProfile)
+async def get_profile(user: UserProfile = Depends(get_current_user)):
+    """Obtener perfil del usuario autenticado"""
+    return user
+
+
+@app.post("/auth/login", response_model=LoginResponse)
+async def login(payload: LoginRequest):
+    """Iniciar sesión con correo y contraseña."""
+    normalized_email = normalize_email_value(payload.email)
+    if not normalized_email:
+        raise HTTPException(status_code=422, detail="Correo electrónico inválido")
+
+    record = fetch_user_record_by_email(normalized_email)
+
+    if record.get("activo") is False:
+        raise HTTPException(status_code=403, detail="Usuario inactivo")
+
+    password_hash = record.get("password_hash") or ""
+    password_valid = False
+
+    if password_hash and password_hash != "managed_by_supabase_auth":
+        try:
+            password_valid = verify_password(payload.password, password_hash)
+        except Exception as exc:
+            logger.warning("No se pudo validar password_hash local para %s: %s", normalized_email, exc)
+
+    if not password_valid:
+        supabase_valid, supabase_error = authenticate_with_supabase_password(
+            normalized_email, payload.password
+        )
+        if not supabase_valid:
+            raise HTTPException(status_code=401, detail=supabase_error or "Credenciales inválidas")
+
+        # Mantener compatibilidad con el flujo actual: al validar por Supabase,
+        # sincronizamos un hash local para futuros inicios de sesión.
+        try:
+            supabase.table("users").update(
+                {"password_hash": get_password_hash(payload.password)}
+            ).eq("id", record["id"]).execute()
+        except Exception as exc:
+            logger.warning("No se pudo sincronizar password_hash local para %s: %s", normalized_email, exc)
+            
+    user_profile = build_user_profile_from_record(record)
+    token = create_access_token(user_profile.id)
+    return LoginResponse(access_token=token, user=user_profile)
+
+
+@app.post("/auth/register", status_code=201)
+async def register_user(payload: AdminUserCreate):
+    """Registro público de usuarios con perfil inicial."""
+    result = create_user_with_profile(payload)
+
+    await register_audit_event(
+        "SELF_REGISTER",
+        result["id"],
+        result["id"],
+        {
+            "email": result["email"],
+            "rol": result["rol"],
+            "org_unit_id": result["org_unit_id"],
+            "activo": result["activo"],
+        },
+    )
+    ticket_assignment_scheduler.invalidate_roster()
+
+    return {"data": result["profile"]}
+    
+# --- ADMIN ---
+
+@app.get("/admin/users")
+async def admin_list_users(user: UserProfile = Depends(require_global_admin())):
+    try:
+        response = (
+            supabase.table("users")
+            .select("id, nombre, email, rol, activo, org_unit_id, org_units(nombre)")
+            .order("nombre")
+            .execute()
+        )
+    except HTTPException:
+        raise
+    except Exception as exc:
+        raise HTTPException(status_code=503, detail=f"No se pudieron obtener los usuarios: {exc}")
+
+    records = [serialize_user_record(item) for item in (response.data or [])]
+    return {"data": records, "count": len(records)}
+
+
+@app.post("/admin/users", status_code=201)
+async def admin_create_user(payload: AdminUserCreate, user: UserProfile = Depends(require_global_admin())):
+    result = create_user_with_profile(payload)
+    
+    await register_audit_event(
+        "CREATE_USER",
+        result["id"],
+        user.id,
+        {
+           "email": result["email"],
+            "rol": result["rol"],
+            "org_unit_id": result["org_unit_id"],
+            "activo": result["activo"],
+        },
+    )
+    ticket_assignment_scheduler.invalidate_roster()
+
+    return {"data": result["profile"]}
+
+
+@app.patch("/admin/users/{user_id}")
+async def admin_update_user(
+    user_id: str,
+    payload: AdminUserUpdate,
+    user: UserProfile = Depends(require_global_admin()),
+):
+    updates: Dict[str, Any] = {}
+    audit_metadata: Dict[str, Any] = {}
+
+    if payload.nombre is not None:
+        updates["nombre"] = payload.nombre
+        audit_metadata["nombre"] = payload.nombre
+
+    if payload.rol is not None:
+        normalized_role = ensure_allowed_role(payload.rol)
+        updates["rol"] = normalized_role
+        audit_metadata["rol"] = normalized_role
+
+    if payload.org_unit_id is not None:
+        updates["org_unit_id"] = payload.org_unit_id
+        audit_metadata["org_unit_id"] = payload.org_unit_id
+
+    if payload.activo is not None:
+        updates["activo"] = payload.activo
+        audit_metadata["activo"] = payload.activo
+
+    if payload.password:
+        updates["password_hash"] = get_password_hash(payload.password)
+        audit_metadata["password_reset"] = True
+
+    if not updates:
+        raise HTTPException(status_code=400, detail="No se proporcionaron cambios para actualizar")
+
+    try:
+        if updates:
+            response = (
+                supabase.table("users")
+                .update(updates)
+                .eq("id", user_id)
+                .execute()
+            )
+
+            if not response.data:
+                raise HTTPException(status_code=404, detail="Usuario no encontrado")
+
+    except HTTPException:
+        raise
+    except Exception as exc:
+        raise HTTPException(status_code=400, detail=f"No se pudo actualizar el usuario: {exc}")
+
+    if audit_metadata:
+        await register_audit_event("UPDATE_USER", user_id, user.id, audit_metadata)
+    ticket_assignment_scheduler.invalidate_roster()
+
+    return {"data": fetch_user_profile_by_id(user_id)}
+
+
+@app.get("/admin/org-units")
+async def admin_list_org_units(user: UserProfile = Depends(require_global_admin())):
     try:
         response = (
             supabase.table("org_units")
@@ -1082,18 +2781,46 @@ async def admin_list_org_units(user: UserProfile = Depends(require_global_admin(
     data = response.data or []
     return {"data": data, "count": len(data)}
 
+
+@app.post("/admin/device-specs/backfill")
+async def admin_backfill_device_specs(user: UserProfile = Depends(require_global_admin())):
+    """Recalcular columnas numéricas de specs a partir de los textos capturados."""
+    result = backfill_device_spec_metrics()
+    fleet_analytics_cache.clear()
+    logger.info("Backfill de device_specs: %s", result)
+    return {"data": result, "message": "Especificaciones normalizadas"}
+
 # --- INVENTORY ---
 
 @app.get("/inventory/devices")
 async def list_devices(
     estado: Optional[str] = None,
     tipo: Optional[str] = None,
+    ram_min_gb: Optional[float] = Query(None, ge=0),
+    ram_max_gb: Optional[float] = Query(None, ge=0),
+    disco_min_gb: Optional[float] = Query(None, ge=0),
+    disco_max_gb: Optional[float] = Query(None, ge=0),
+    cpu_min_mhz: Optional[int] = Query(None, ge=0),
+    cpu_max_mhz: Optional[int] = Query(None, ge=0),
     user: UserProfile = Depends(get_current_user)
 ):
     """Listar dispositivos (filtrados por org_unit del usuario)"""
-    query = supabase.table("devices").select(
-        "*, usuario_actual:users!usuario_actual_id(nombre, email)"
-    )
+    gigabyte = CAPACITY_UNITS["GB"]
+    spec_filters = [
+        ("gte", "ram_bytes", None if ram_min_gb is None else int(ram_min_gb * gigabyte)),
+        ("lte", "ram_bytes", None if ram_max_gb is None else int(ram_max_gb * gigabyte)),
+        ("gte", "disco_bytes", None if disco_min_gb is None else int(disco_min_gb * gigabyte)),
+        ("lte", "disco_bytes", None if disco_max_gb is None else int(disco_max_gb * gigabyte)),
+        ("gte", "cpu_mhz", cpu_min_mhz),
+        ("lte", "cpu_mhz", cpu_max_mhz),
+    ]
+    spec_filters = [item for item in spec_filters if item[2] is not None]
+
+    select = "*, usuario_actual:users!usuario_actual_id(nombre, email)"
+    if spec_filters:
+        # !inner descarta los dispositivos cuyas specs no cumplen los rangos
+        select += ", device_specs!inner(ram_bytes, disco_bytes, cpu_mhz)"
+    query = supabase.table("devices").select(select)
 
     if user.rol != "LIDER_TI":
         query = query.eq("org_unit_id", user.org_unit_id)
@@ -1102,10 +2829,167 @@ async def list_devices(
         query = query.eq("estado", estado)
     if tipo:
         query = query.eq("tipo", tipo)
+    for operator, column, value in spec_filters:
+        query = getattr(query, operator)(f"device_specs.{column}", value)
     
     response = query.execute()
     return {"data": response.data, "count": len(response.data)}
 
+
+@app.get("/inventory/devices/search")
+async def search_devices(
+    q: str = Query(..., min_length=2, max_length=200),
+    limit: int = Query(20, ge=1, le=DEVICE_SEARCH_MAX_LIMIT),
+    user: UserProfile = Depends(get_current_user),
+):
+    """Buscar dispositivos por nombre, serial, marca, modelo o ubicación"""
+    term = q.strip()
+    if len(term) < 2:
+        raise HTTPException(status_code=422, detail="La búsqueda requiere al menos 2 caracteres")
+
+    org_unit_id = resolve_org_scope(user)
+    if user.rol != "LIDER_TI" and not org_unit_id:
+        return {"data": [], "count": 0}
+
+    response = supabase.rpc(
+        "search_devices",
+        {"p_query": term, "p_org_unit_id": org_unit_id, "p_limit": limit},
+    ).execute()
+    data = handle_supabase_error(response, "No se pudo ejecutar la búsqueda de dispositivos") or []
+    return {"data": data, "count": len(data)}
+
+
+def _export_value(record: Dict[str, Any], path: str) -> Any:
+    value: Any = record
+    for key in path.split("."):
+        # Las relaciones embebidas pueden venir como objeto o como lista de un elemento.
+        if isinstance(value, list):
+            value = value[0] if value else None
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def iter_device_export_rows(
+    org_unit_id: Optional[str],
+    estado: Optional[str] = None,
+    tipo: Optional[str] = None,
+) -> Iterator[List[Any]]:
+    """Recorre el inventario por páginas (keyset sobre id) sin materializarlo completo."""
+    last_id: Optional[str] = None
+
+    while True:
+        query = supabase.table("devices").select(DEVICE_EXPORT_SELECT)
+        if org_unit_id:
+            query = query.eq("org_unit_id", org_unit_id)
+        if estado:
+            query = query.eq("estado", estado)
+        if tipo:
+            query = query.eq("tipo", tipo)
+        if last_id:
+            query = query.gt("id", last_id)
+
+        response = query.order("id").limit(EXPORT_PAGE_SIZE).execute()
+        page = handle_supabase_error(response, "No se pudo exportar el inventario") or []
+
+        for record in page:
+            yield [_export_value(record, path) for _, path in DEVICE_EXPORT_COLUMNS]
+
+        if len(page) < EXPORT_PAGE_SIZE:
+            return
+        last_id = page[-1]["id"]
+
+
+def stream_devices_csv(rows: Iterator[List[Any]]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM para que Excel reconozca UTF-8 (tildes en ubicaciones y nombres)
+    buffer.write("\ufeff")
+    writer.writerow([header for header, _ in DEVICE_EXPORT_COLUMNS])
+
+    for row in rows:
+        writer.writerow(["" if value is None else value for value in row])
+        if buffer.tell() >= EXPORT_FLUSH_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    yield buffer.getvalue()
+
+
+def stream_devices_xlsx(rows: Iterator[List[Any]]) -> Iterator[bytes]:
+    # constant_memory escribe cada fila a disco; el archivo final se envía por bloques.
+    tmp = tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False)
+    tmp.close()
+    try:
+        workbook = xlsxwriter.Workbook(tmp.name, {"constant_memory": True})
+        worksheet = workbook.add_worksheet("Inventario")
+        worksheet.write_row(0, 0, [header for header, _ in DEVICE_EXPORT_COLUMNS])
+        for index, row in enumerate(rows, start=1):
+            worksheet.write_row(index, 0, ["" if value is None else value for value in row])
+        workbook.close()
+
+        with open(tmp.name, "rb") as handle:
+            while True:
+                chunk = handle.read(EXPORT_FLUSH_BYTES)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(tmp.name)
+
+
+@app.get("/inventory/devices/export")
+async def export_devices(
+    export_format: Literal["csv", "xlsx"] = Query("csv", alias="format"),
+    estado: Optional[str] = None,
+    tipo: Optional[str] = None,
+    user: UserProfile = Depends(get_current_user),
+):
+    """Exportar inventario con especificaciones en CSV o XLSX (streaming)"""
+    org_unit_id = resolve_org_scope(user)
+    filename = f"inventario-{datetime.utcnow().strftime('%Y%m%d')}.{export_format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if user.rol != "LIDER_TI" and not org_unit_id:
+        rows: Iterator[List[Any]] = iter(())
+    else:
+        rows = iter_device_export_rows(org_unit_id, estado=estado, tipo=tipo)
+
+    if export_format == "xlsx":
+        if xlsxwriter is None:
+            raise HTTPException(
+                status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                detail="La exportación XLSX no está disponible en este servidor",
+            )
+        return StreamingResponse(
+            stream_devices_xlsx(rows),
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            headers=headers,
+        )
+
+    return StreamingResponse(
+        stream_devices_csv(rows),
+        media_type="text/csv; charset=utf-8",
+        headers=headers,
+    )
+
+@app.get("/inventory/analytics")
+async def get_fleet_analytics(user: UserProfile = Depends(get_current_user)):
+    """Desgloses del inventario para planeación de renovación"""
+    org_unit_id = resolve_org_scope(user)
+    if user.rol != "LIDER_TI" and not org_unit_id:
+        raise HTTPException(status_code=403, detail="El usuario no tiene unidad organizacional")
+
+    cached = fleet_analytics_cache.get(org_unit_id)
+    if cached is not None:
+        return {"data": cached, "cached": True}
+
+    result = compute_fleet_analytics(load_fleet_columns(org_unit_id))
+    result["generado_en"] = datetime.utcnow().isoformat()
+    fleet_analytics_cache.set(org_unit_id, result)
+    return {"data": result, "cached": False}
+
 @app.post("/inventory/devices", status_code=201)
 async def create_device(
     device: DeviceCreate,
@@ -1115,15 +2999,17 @@ async def create_device(
     device_data = device.model_dump()
     specs_data = device_data.pop("specs", None)
     device_data = {k: v for k, v in device_data.items() if v is not None}
+    device_data["serial"] = normalize_serial(device_data.get("serial"))
+    ubicacion, ubicacion_path = normalize_location(device_data.get("ubicacion"))
+    device_data["ubicacion"] = ubicacion or device_data.get("ubicacion")
+    device_data["ubicacion_path"] = ubicacion_path
     device_data["org_unit_id"] = user.org_unit_id
     device_data["creado_por"] = user.id
     device_data["fecha_ingreso"] = datetime.utcnow().date().isoformat()
     
-    response = (
-        supabase.table("devices")
-        .insert(device_data)
-        .select("*")
-        .execute()
+    response = execute_device_write(
+        supabase.table("devices").insert(device_data).select("*"),
+        device_data["serial"],
     )
     device_data_response = handle_supabase_error(
         response, "No se pudo crear el dispositivo en Supabase", require_data=True
@@ -1159,6 +3045,8 @@ async def create_device(
         if perifericos:
             specs_payload["perifericos"] = perifericos
 
+        specs_payload.update(normalize_spec_metrics(specs_payload))
+
         specs_payload = {
             key: value for key, value in specs_payload.items() if value not in (None, "", {})
         }
@@ -1184,6 +3072,9 @@ async def create_device(
         {"device_name": device.nombre, "type": device.tipo},
     )
 
+    fleet_analytics_cache.invalidate(device_record.get("org_unit_id"))
+    backup_compliance_cache.invalidate(device_record.get("org_unit_id"))
+
     return {"data": device_record, "message": "Dispositivo creado exitosamente"}
 
 @app.get("/inventory/devices/{device_id}/cv")
@@ -1235,6 +3126,12 @@ async def update_device(
 ):
     """Actualizar dispositivo"""
     update_data = {k: v for k, v in updates.model_dump().items() if v is not None}
+    if "ubicacion" in update_data:
+        ubicacion, ubicacion_path = normalize_location(update_data["ubicacion"])
+        update_data["ubicacion"] = ubicacion or update_data["ubicacion"]
+        update_data["ubicacion_path"] = ubicacion_path
+    if "serial" in update_data:
+        update_data["serial"] = normalize_serial(update_data["serial"])
     update_data["actualizado_en"] = datetime.utcnow().isoformat()
     
     update_query = supabase.table("devices").update(update_data).eq("id", device_id)
@@ -1242,7 +3139,7 @@ async def update_device(
     if user.rol != "LIDER_TI":
         update_query = update_query.eq("org_unit_id", user.org_unit_id)
 
-    response = update_query.execute()
+    response = execute_device_write(update_query, update_data.get("serial"))
     
     if not response.data:
         raise HTTPException(status_code=404, detail="Dispositivo no encontrado")
@@ -1262,13 +3159,104 @@ async def update_device(
         user.id,
         {"changes": update_data}
     )
+
+    fleet_analytics_cache.invalidate(response.data[0].get("org_unit_id"))
+    backup_compliance_cache.invalidate(response.data[0].get("org_unit_id"))
     
     return {"data": response.data[0], "message": "Dispositivo actualizado"}
 
+# --- LOCATIONS ---
+
+@app.get("/inventory/locations")
+async def list_locations(
+    path: Optional[str] = None,
+    user: UserProfile = Depends(get_current_user),
+):
+    """Árbol de ubicaciones con conteos por estado (opcionalmente un subárbol)"""
+    org_unit_id = resolve_org_scope(user)
+    if user.rol != "LIDER_TI" and not org_unit_id:
+        return {"data": [], "count": 0}
+
+    query = supabase.table("location_rollups").select("path, nombre, estado, total")
+    if org_unit_id:
+        query = query.eq("org_unit_id", org_unit_id)
+    if path:
+        prefix = normalize_location_prefix(path)
+        if prefix:
+            query = query.like("path", f"{prefix}%")
+
+    response = query.gt("total", 0).execute()
+    rows = handle_supabase_error(response, "No se pudieron obtener las ubicaciones") or []
+    nodes = build_location_tree(rows)
+    return {"data": nodes, "count": len(nodes)}
+
+
+@app.get("/inventory/locations/devices")
+async def list_location_devices(
+    path: str = Query(..., min_length=1),
+    estado: Optional[str] = None,
+    user: UserProfile = Depends(get_current_user),
+):
+    """Dispositivos ubicados en un nodo o cualquiera de sus descendientes"""
+    prefix = normalize_location_prefix(path)
+    if not prefix:
+        raise HTTPException(status_code=422, detail="Ruta de ubicación inválida")
+
+    org_unit_id = resolve_org_scope(user)
+    if user.rol != "LIDER_TI" and not org_unit_id:
+        return {"data": [], "count": 0}
+
+    query = supabase.table("devices").select(
+        "*, usuario_actual:users!usuario_actual_id(nombre, email)"
+    ).like("ubicacion_path", f"{prefix}%")
+    if org_unit_id:
+        query = query.eq("org_unit_id", org_unit_id)
+    if estado:
+        query = query.eq("estado", estado)
+
+    response = query.order("ubicacion_path").execute()
+    data = handle_supabase_error(response, "No se pudieron obtener los dispositivos") or []
+    return {"data": data, "count": len(data)}
+
+
+@app.post("/admin/locations/backfill")
+async def admin_backfill_locations(user: UserProfile = Depends(require_global_admin())):
+    """Normalizar la ubicación de los dispositivos existentes y recalcular rollups."""
+    scanned = 0
+    updated = 0
+    last_id: Optional[str] = None
+
+    while True:
+        query = supabase.table("devices").select("id, ubicacion, ubicacion_path")
+        if last_id:
+            query = query.gt("id", last_id)
+        response = query.order("id").limit(EXPORT_PAGE_SIZE).execute()
+        page = handle_supabase_error(response, "No se pudieron leer los dispositivos") or []
+
+        for record in page:
+            scanned += 1
+            ubicacion, ubicacion_path = normalize_location(record.get("ubicacion"))
+            if ubicacion_path != record.get("ubicacion_path") or (
+                ubicacion and ubicacion != record.get("ubicacion")
+            ):
+                supabase.table("devices").update(
+                    {"ubicacion": ubicacion or record.get("ubicacion"), "ubicacion_path": ubicacion_path}
+                ).eq("id", record["id"]).execute()
+                updated += 1
+
+        if len(page) < EXPORT_PAGE_SIZE:
+            break
+        last_id = page[-1]["id"]
+
+    rebuild = supabase.rpc("rebuild_location_rollups", {}).execute()
+    handle_supabase_error(rebuild, "No se pudieron recalcular los rollups de ubicación")
+    fleet_analytics_cache.clear()
+
+    return {"data": {"scanned": scanned, "updated": updated}, "message": "Ubicaciones normalizadas"}
+
 # --- INVENTORY PERMISSIONS ---
 
-@app.get("/inventory/permissions/check")
-async def check_inventory_permission(user: UserProfile = Depends(get_current_user)):
+def resolve_inventory_permission(user: UserProfile) -> Dict[str, Any]:
     if user.rol in ("TI", "LIDER_TI"):
         return {"can_manage": True, "source": "role"}
 
@@ -1279,6 +3267,11 @@ async def check_inventory_permission(user: UserProfile = Depends(get_current_use
     return {"can_manage": False, "source": "none"}
 
 
+@app.get("/inventory/permissions/check")
+async def check_inventory_permission(user: UserProfile = Depends(get_current_user)):
+    return resolve_inventory_permission(user)
+
+
 @app.get("/inventory/permissions", response_model=dict)
 async def list_inventory_permissions(
     user: UserProfile = Depends(require_role(["LIDER_TI"]))
@@ -1355,21 +3348,99 @@ async def delete_inventory_permission(
     
 # --- BACKUPS ---
 
+BACKUP_SUMMARY_COLUMNS = (
+    "id, device_id, tipo, almacenamiento, frecuencia, fecha_backup, exitoso, notas, evidencia_url"
+)
+
+
 @app.get("/backups")
 async def list_backups(
     device_id: Optional[str] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    exitoso: Optional[bool] = None,
+    tipo: Optional[Literal["INCREMENTAL", "COMPLETA", "DIFERENCIAL"]] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    detalle: bool = False,
     user: UserProfile = Depends(get_current_user)
 ):
-    """Listar backups"""
-    query = supabase.table("backups").select(
-        "*, device:devices!device_id(nombre, tipo)"
-    )
-    
+    """Listar backups (paginado por fecha_backup, id)"""
+    org_unit_id = resolve_org_scope(user)
+    if user.rol != "LIDER_TI" and not org_unit_id:
+        return {"data": [], "count": 0, "next_cursor": None}
+
+    columns = "*" if detalle else BACKUP_SUMMARY_COLUMNS
+    # !inner permite filtrar por la org_unit del dispositivo sin traer backups ajenos
+    device_join = "device:devices!device_id!inner(nombre, tipo, org_unit_id)"
+    query = supabase.table("backups").select(f"{columns}, {device_join}")
+
+    if org_unit_id:
+        query = query.eq("device.org_unit_id", org_unit_id)
     if device_id:
         query = query.eq("device_id", device_id)
-    
-    response = query.order("fecha_backup", desc=True).execute()
-    return {"data": response.data}
+    if desde:
+        query = query.gte("fecha_backup", desde.isoformat())
+    if hasta:
+        query = query.lte("fecha_backup", hasta.isoformat())
+    if exitoso is not None:
+        query = query.eq("exitoso", exitoso)
+    if tipo:
+        query = query.eq("tipo", tipo)
+
+    query = apply_keyset_cursor(query, "fecha_backup", cursor)
+    response = (
+        query.order("fecha_backup", desc=True)
+        .order("id", desc=True)
+        .limit(limit + 1)
+        .execute()
+    )
+    rows = handle_supabase_error(response, "No se pudieron obtener los backups") or []
+    page, next_cursor = paginate_rows(rows, limit, "fecha_backup")
+    return {"data": page, "count": len(page), "next_cursor": next_cursor}
+
+def build_backup_record(backup: BackupCreate, user: UserProfile, fecha_backup: datetime) -> Dict[str, Any]:
+    backup_data = backup.model_dump()
+    backup_data["realizado_por"] = user.id
+    backup_data["fecha_backup"] = fecha_backup.isoformat()
+    intervalo_horas = parse_backup_frequency_hours(backup.frecuencia)
+    if intervalo_horas:
+        backup_data["proximo_backup"] = (fecha_backup + timedelta(hours=intervalo_horas)).date().isoformat()
+    return backup_data
+
+
+def build_backup_log(backup: BackupCreate, user: UserProfile) -> Dict[str, Any]:
+    return {
+        "device_id": backup.device_id,
+        "tipo": "BACKUP",
+        "descripcion": f"Backup {backup.tipo} realizado",
+        "realizado_por": user.id,
+    }
+
+
+@app.get("/backups/compliance")
+async def get_backup_compliance(
+    estado: Optional[Literal["AL_DIA", "EN_RIESGO", "VENCIDO", "SIN_BACKUP", "SIN_FRECUENCIA"]] = None,
+    user: UserProfile = Depends(get_current_user),
+):
+    """Cumplimiento de backups (vencidos / en riesgo) para toda la flota del alcance"""
+    org_unit_id = resolve_org_scope(user)
+    if user.rol != "LIDER_TI" and not org_unit_id:
+        return {"data": [], "resumen": {}, "count": 0}
+
+    snapshot = backup_compliance_cache.get(org_unit_id)
+    if snapshot is None:
+        snapshot = load_backup_compliance_snapshot(org_unit_id)
+        backup_compliance_cache.set(org_unit_id, snapshot)
+
+    results = compute_backup_compliance(list(snapshot.values()))
+    resumen: Dict[str, int] = {}
+    for item in results:
+        resumen[item["estado"]] = resumen.get(item["estado"], 0) + 1
+
+    if estado:
+        results = [item for item in results if item["estado"] == estado]
+    return {"data": results, "resumen": resumen, "count": len(results)}
 
 @app.post("/backups", status_code=201)
 async def create_backup(
@@ -1377,19 +3448,16 @@ async def create_backup(
     user: UserProfile = Depends(require_role(["TI", "LIDER_TI"]))
 ):
     """Registrar backup"""
-    backup_data = backup.model_dump()
-    backup_data["realizado_por"] = user.id
-    backup_data["fecha_backup"] = datetime.utcnow().isoformat()
+    backup_data = build_backup_record(backup, user, datetime.utcnow())
     
     response = supabase.table("backups").insert(backup_data).execute()
+    created = handle_supabase_error(response, "No se pudo registrar el backup", require_data=True)
+    backup_compliance_cache.record_backup(
+        backup.device_id, backup_data["fecha_backup"], backup.frecuencia
+    )
     
     # Log en device
-    supabase.table("device_logs").insert({
-        "device_id": backup.device_id,
-        "tipo": "BACKUP",
-        "descripcion": f"Backup {backup.tipo} realizado",
-        "realizado_por": user.id
-    }).execute()
+    supabase.table("device_logs").insert(build_backup_log(backup, user)).execute()
     
     # Auditoría
     await register_audit_event(
@@ -1399,32 +3467,347 @@ async def create_backup(
         {"backup_type": backup.tipo, "storage": backup.almacenamiento}
     )
     
-    return {"data": response.data[0], "message": "Backup registrado"}
+    return {"data": created[0], "message": "Backup registrado"}
+
+@app.post("/backups/batch", status_code=201)
+async def create_backups_batch(
+    payload: BackupBatchCreate,
+    user: UserProfile = Depends(require_role(["TI", "LIDER_TI"]))
+):
+    """Registrar varios backups en una sola solicitud (un bloque de auditoría)"""
+    device_ids = sorted({item.device_id for item in payload.backups})
+    devices_query = supabase.table("devices").select("id, org_unit_id").in_("id", device_ids)
+    org_unit_id = resolve_org_scope(user)
+    if org_unit_id:
+        devices_query = devices_query.eq("org_unit_id", org_unit_id)
+    devices_response = devices_query.execute()
+    known_devices = {
+        row["id"]: row.get("org_unit_id")
+        for row in handle_supabase_error(devices_response, "No se pudieron validar los dispositivos") or []
+    }
+
+    fecha_backup = datetime.utcnow()
+    results: List[Dict[str, Any]] = []
+    accepted: List[tuple[int, BackupCreate]] = []
+    for index, item in enumerate(payload.backups):
+        if item.device_id in known_devices:
+            accepted.append((index, item))
+        else:
+            results.append(
+                {"index": index, "device_id": item.device_id, "status": "error", "error": "Dispositivo no encontrado"}
+            )
+
+    if accepted:
+        insert_response = (
+            supabase.table("backups")
+            .insert([build_backup_record(item, user, fecha_backup) for _, item in accepted])
+            .execute()
+        )
+        inserted = handle_supabase_error(
+            insert_response, "No se pudieron registrar los backups", require_data=True
+        )
+
+        logs_response = (
+            supabase.table("device_logs")
+            .insert([build_backup_log(item, user) for _, item in accepted])
+            .execute()
+        )
+        handle_supabase_error(logs_response, "No se pudieron registrar los logs de backup")
+
+        # PostgREST devuelve las filas insertadas en el mismo orden del lote
+        for (index, item), row in zip(accepted, inserted):
+            backup_compliance_cache.record_backup(
+                item.device_id, row.get("fecha_backup") or fecha_backup.isoformat(), item.frecuencia
+            )
+            results.append({"index": index, "device_id": item.device_id, "status": "created", "data": row})
+
+        batch_id = str(uuid4())
+        await register_audit_event(
+            "BACKUP_BATCH",
+            batch_id,
+            user.id,
+            {
+                "batch_id": batch_id,
+                "count": len(accepted),
+                "device_ids": [item.device_id for _, item in accepted],
+                "backups": [
+                    {"device_id": item.device_id, "backup_type": item.tipo, "storage": item.almacenamiento}
+                    for _, item in accepted
+                ],
+            },
+        )
+    else:
+        batch_id = None
+
+    results.sort(key=lambda item: item["index"])
+    created = len(accepted)
+    return {
+        "data": results,
+        "batch_id": batch_id,
+        "created": created,
+        "failed": len(results) - created,
+        "message": f"{created} backups registrados",
+    }
 
 # --- TICKETS ---
 
+TICKET_SUMMARY_COLUMNS = (
+    "id, titulo, descripcion_resumen, estado, prioridad, fecha_creacion, "
+    "org_unit_id, solicitante_id, asignado_a, device_id"
+)
+TICKET_USER_JOINS = "solicitante:users!solicitante_id(nombre, email), asignado:users!asignado_a(nombre)"
+
+
+def apply_ticket_scope(query, user: UserProfile):
+    """Mismas reglas de visibilidad que list_tickets: global, org_unit o solicitante."""
+    if user.rol == "LIDER_TI":
+        return query
+    if user.rol in ["TI", "DIRECTOR"]:
+        return query.eq("org_unit_id", user.org_unit_id)
+    return query.eq("solicitante_id", user.id)
+
+
+def fetch_tickets_page(
+    user: UserProfile,
+    estado: Optional[str] = None,
+    prioridad: Optional[str] = None,
+    asignado_a: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    detalle: bool = False,
+) -> Dict[str, Any]:
+    columns = "*" if detalle else TICKET_SUMMARY_COLUMNS
+    if user.rol in ["LIDER_TI", "TI", "DIRECTOR"]:
+        columns = f"{columns}, {TICKET_USER_JOINS}"
+    query = apply_ticket_scope(supabase.table("tickets").select(columns), user)
+    
+    if estado:
+        query = query.eq("estado", estado)
+    if prioridad:
+        query = query.eq("prioridad", prioridad)
+    if asignado_a:
+        query = query.eq("asignado_a", asignado_a)
+
+    query = apply_keyset_cursor(query, "fecha_creacion", cursor)
+    response = (
+        query.order("fecha_creacion", desc=True)
+        .order("id", desc=True)
+        .limit(limit + 1)
+        .execute()
+    )
+    rows = handle_supabase_error(response, "No se pudieron obtener los tickets") or []
+    page, next_cursor = paginate_rows(rows, limit, "fecha_creacion")
+    return {"data": page, "count": len(page), "next_cursor": next_cursor}
+
+
 @app.get("/tickets")
 async def list_tickets(
     estado: Optional[str] = None,
+    prioridad: Optional[Literal["BAJA", "MEDIA", "ALTA", "CRITICA"]] = None,
+    asignado_a: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    detalle: bool = False,
     user: UserProfile = Depends(get_current_user)
 ):
-    """Listar tickets"""
-    if user.rol == "LIDER_TI":
-        query = supabase.table("tickets").select(
-            "*, solicitante:users!solicitante_id(nombre, email), asignado:users!asignado_a(nombre)"
+    """Listar tickets (paginado por fecha_creacion, id)"""
+    return fetch_tickets_page(user, estado, prioridad, asignado_a, cursor, limit, detalle)
+
+async def get_stream_user(
+    request: Request,
+    ticket: Optional[str] = None,
+) -> UserProfile:
+    """Acepta el JWT en la cabecera o un ticket de stream de un solo uso en la query."""
+    authorization = request.headers.get("Authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() == "bearer" and token:
+        return await get_current_user(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+    if not ticket:
+        raise HTTPException(status_code=401, detail="Token requerido")
+    return load_authenticated_user(stream_tickets.redeem(ticket))
+
+
+@app.post("/tickets/events/ticket")
+async def create_stream_ticket(user: UserProfile = Depends(get_current_user)):
+    """Emitir un ticket de corta duración para abrir el stream con EventSource"""
+    return {"ticket": stream_tickets.issue(user.id), "expires_in": TICKET_EVENTS_TICKET_SECONDS}
+
+
+@app.get("/tickets/events")
+async def stream_ticket_events(
+    request: Request,
+    last_event_id: Optional[str] = None,
+    user: UserProfile = Depends(get_stream_user),
+):
+    """Stream SSE de cambios en tickets y comentarios visibles para el usuario.
+
+    El hub vive en memoria del proceso: requiere un despliegue ASGI de larga
+    duración (uvicorn/gunicorn), no la función serverless.
+    """
+    resume_from = request.headers.get("Last-Event-ID") or last_event_id
+    subscriber = ticket_event_hub.subscribe(user)
+    backlog = ticket_event_hub.replay(resume_from, user)
+
+    async def event_stream():
+        try:
+            if backlog is None:
+                yield format_sse_resync()
+            else:
+                for event in backlog:
+                    yield format_sse(event)
+
+            while True:
+                if await request.is_disconnected():
+                    break
+                if subscriber.lagging:
+                    subscriber.lagging = False
+                    while not subscriber.queue.empty():
+                        subscriber.queue.get_nowait()
+                    yield format_sse_resync()
+                    continue
+                try:
+                    event = await asyncio.wait_for(
+                        subscriber.queue.get(), timeout=TICKET_EVENTS_HEARTBEAT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_sse(event)
+        finally:
+            ticket_event_hub.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/tickets/search")
+async def search_tickets(
+    q: str = Query(..., min_length=2, max_length=200),
+    limit: int = Query(20, ge=1, le=TICKET_SEARCH_MAX_LIMIT),
+    user: UserProfile = Depends(get_current_user),
+):
+    """Búsqueda de texto completo en títulos, descripciones y comentarios"""
+    term = re.sub(r"\s+", " ", strip_accents(q)).strip()
+    if len(term) < 2:
+        raise HTTPException(status_code=422, detail="La búsqueda requiere al menos 2 caracteres")
+
+    # Mismo alcance que list_tickets
+    params: Dict[str, Any] = {
+        "p_query": term,
+        "p_org_unit_id": None,
+        "p_solicitante_id": None,
+        "p_limit": limit,
+    }
+    if user.rol in ["TI", "DIRECTOR"]:
+        if not user.org_unit_id:
+            return {"data": [], "count": 0}
+        params["p_org_unit_id"] = user.org_unit_id
+    elif user.rol != "LIDER_TI":
+        params["p_solicitante_id"] = user.id
+
+    response = supabase.rpc("search_tickets", params).execute()
+    data = handle_supabase_error(response, "No se pudo ejecutar la búsqueda de tickets") or []
+    return {"data": data, "count": len(data)}
+
+@app.get("/tickets/sla")
+async def get_ticket_sla(
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    prioridad: Optional[Literal["BAJA", "MEDIA", "ALTA", "CRITICA"]] = None,
+    user: UserProfile = Depends(require_role(["TI", "DIRECTOR"])),
+):
+    """Percentiles p50/p90/p99 de tiempos de respuesta y resolución por prioridad"""
+    if sla_metrics.built_at is None:
+        await asyncio.to_thread(sla_metrics.rebuild, iter_resolved_ticket_times())
+
+    hasta_day = (hasta or datetime.utcnow()).date()
+    desde_day = desde.date() if desde else hasta_day - timedelta(days=SLA_DEFAULT_WINDOW_DAYS)
+    org_unit_id = resolve_org_scope(user)
+    if user.rol != "LIDER_TI" and not org_unit_id:
+        return {"data": {}, "desde": desde_day.isoformat(), "hasta": hasta_day.isoformat()}
+
+    data = sla_metrics.query(org_unit_id, desde_day.isoformat(), hasta_day.isoformat(), prioridad)
+    return {
+        "data": data,
+        "desde": desde_day.isoformat(),
+        "hasta": hasta_day.isoformat(),
+        "actualizado_desde": sla_metrics.built_at,
+    }
+
+
+@app.post("/tickets/sla/rebuild")
+async def rebuild_ticket_sla(user: UserProfile = Depends(require_global_admin())):
+    """Reconstruir los sketches de SLA leyendo todos los tickets resueltos."""
+    observed = await asyncio.to_thread(sla_metrics.rebuild, iter_resolved_ticket_times())
+    return {"data": {"observaciones": observed, "built_at": sla_metrics.built_at}}
+
+@app.get("/tickets/assignment")
+async def preview_ticket_assignment(
+    org_unit_id: Optional[str] = None,
+    user: UserProfile = Depends(require_role(["TI", "LIDER_TI"])),
+):
+    """Carga actual del personal TI y plan de rebalanceo propuesto (sin aplicar)"""
+    scope = resolve_assignment_org(user, org_unit_id)
+    await asyncio.to_thread(ensure_assignment_scheduler_loaded)
+    movable = await asyncio.to_thread(fetch_rebalance_candidates, scope)
+    return {
+        "data": {
+            "org_unit_id": scope,
+            "carga": ticket_assignment_scheduler.workload(scope),
+            "plan": ticket_assignment_scheduler.plan_rebalance(scope, movable),
+        }
+    }
+
+
+@app.post("/tickets/assignment/rebalance")
+async def rebalance_ticket_assignment(
+    org_unit_id: Optional[str] = None,
+    user: UserProfile = Depends(require_role(["LIDER_TI"])),
+):
+    """Aplicar el plan de rebalanceo: un UPDATE por técnico destino y un bloque de auditoría"""
+    scope = resolve_assignment_org(user, org_unit_id)
+    await asyncio.to_thread(ensure_assignment_scheduler_loaded)
+    movable = await asyncio.to_thread(fetch_rebalance_candidates, scope)
+    moves = ticket_assignment_scheduler.plan_rebalance(scope, movable)
+
+    ticket_ids_by_target: Dict[str, List[str]] = {}
+    for move in moves:
+        ticket_ids_by_target.setdefault(move["hacia"], []).append(move["ticket_id"])
+
+    updated_rows: List[Dict[str, Any]] = []
+    for target, ticket_ids in ticket_ids_by_target.items():
+        response = (
+            supabase.table("tickets")
+            .update({"asignado_a": target})
+            .in_("id", ticket_ids)
+            .eq("estado", "ABIERTO")
+            .execute()
         )
-    elif user.rol in ["TI", "DIRECTOR"]:
-        query = supabase.table("tickets").select(
-            "*, solicitante:users!solicitante_id(nombre, email), asignado:users!asignado_a(nombre)"
-        ).eq("org_unit_id", user.org_unit_id)
-    else:
-        query = supabase.table("tickets").select("*").eq("solicitante_id", user.id)
-    
-    if estado:
-        query = query.eq("estado", estado)
-    
-    response = query.order("fecha_creacion", desc=True).execute()
-    return {"data": response.data}
+        updated_rows.extend(handle_supabase_error(response, "No se pudieron reasignar los tickets") or [])
+
+    audit_block = None
+    if updated_rows:
+        audit_data = await register_audit_event(
+            "REBALANCE_TICKETS",
+            str(uuid4()),
+            user.id,
+            {"org_unit_id": scope, "moves": moves},
+        )
+        audit_block = audit_data["block_number"]
+
+    for row in updated_rows:
+        ticket_assignment_scheduler.track(row)
+        ticket_event_hub.publish("ticket.updated", row, {"asignado_a": row.get("asignado_a")})
+
+    return {
+        "data": moves,
+        "updated": len(updated_rows),
+        "carga": ticket_assignment_scheduler.workload(scope),
+        "audit_block": audit_block,
+        "message": f"{len(updated_rows)} tickets reasignados",
+    }
 
 @app.post("/tickets", status_code=201)
 async def create_ticket(
@@ -1437,37 +3820,165 @@ async def create_ticket(
     ticket_data["org_unit_id"] = user.org_unit_id
     ticket_data["estado"] = "ABIERTO"
     ticket_data["fecha_creacion"] = datetime.utcnow().isoformat()
+    if TICKET_AUTO_ASSIGN and user.org_unit_id:
+        await asyncio.to_thread(ensure_assignment_scheduler_loaded)
+        ticket_data["asignado_a"] = ticket_assignment_scheduler.pick(user.org_unit_id)
+        if ticket_data["asignado_a"]:
+            # Asignado al crearse: el tiempo de respuesta SLA es cero
+            ticket_data["fecha_asignacion"] = ticket_data["fecha_creacion"]
     
     response = supabase.table("tickets").insert(ticket_data).execute()
+    created = response.data[0]
+    if ticket_assignment_scheduler.loaded:
+        ticket_assignment_scheduler.track(created)
+    ticket_event_hub.publish("ticket.created", created, created)
+
+    posibles_duplicados: List[Dict[str, Any]] = []
+    try:
+        await asyncio.to_thread(ensure_duplicate_index_loaded)
+        signature = ticket_duplicate_index.index_ticket(created)
+        matches = ticket_duplicate_index.query(
+            signature,
+            created.get("org_unit_id"),
+            global_scope=user.rol == "LIDER_TI",
+            exclude=created["id"],
+            solicitante_id=duplicate_requester_scope(user),
+        )
+        posibles_duplicados = fetch_duplicate_candidates(matches, user)
+    except Exception:
+        # La detección de duplicados es informativa: no debe impedir crear el ticket
+        logger.warning("No se pudo calcular duplicados para el ticket %s", created.get("id"), exc_info=True)
     
-    return {"data": response.data[0], "message": "Ticket creado exitosamente"}
+    return {
+        "data": created,
+        "posibles_duplicados": posibles_duplicados,
+        "message": "Ticket creado exitosamente",
+    }
+
+TICKET_DETAIL_SELECT = (
+    "*, solicitante:users!solicitante_id(nombre, email), asignado:users!asignado_a(nombre), device:devices(nombre, tipo)"
+)
+TICKET_STAFF_ROLES = ("TI", "LIDER_TI", "DIRECTOR")
+
+
+def fetch_ticket_comments_page(ticket_id: str, cursor: Optional[str], limit: int) -> Dict[str, Any]:
+    """Últimos `limit` comentarios (anteriores al cursor), en orden cronológico.
+    La primera página también trae el total de comentarios del ticket."""
+    columns = "*, usuario:users!usuario_id(nombre)"
+    if cursor:
+        query = supabase.table("ticket_comments").select(columns)
+    else:
+        query = supabase.table("ticket_comments").select(columns, count="exact")
+    query = apply_keyset_cursor(query.eq("ticket_id", ticket_id), "fecha", cursor)
+    response = query.order("fecha", desc=True).order("id", desc=True).limit(limit + 1).execute()
+    rows = handle_supabase_error(response, "No se pudieron obtener los comentarios") or []
+    page, next_cursor = paginate_rows(rows, limit, "fecha")
+    page.reverse()
+    total = None if cursor else getattr(response, "count", None)
+    return {"data": page, "next_cursor": next_cursor, "total": total}
+
+
+def fetch_ticket_record(ticket_id: str, columns: str) -> Optional[Dict[str, Any]]:
+    response = supabase.table("tickets").select(columns).eq("id", ticket_id).limit(1).execute()
+    rows = handle_supabase_error(response, "No se pudo obtener el ticket") or []
+    return rows[0] if rows else None
+
+
+def ensure_ticket_access(ticket: Optional[Dict[str, Any]], user: UserProfile) -> Dict[str, Any]:
+    if not ticket:
+        raise HTTPException(status_code=404, detail="Ticket no encontrado")
+    if user.rol not in TICKET_STAFF_ROLES and ticket.get("solicitante_id") != user.id:
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+    return ticket
+
+
+async def load_ticket_with_comments(
+    ticket_id: str,
+    user: UserProfile,
+    ticket_columns: str,
+    cursor: Optional[str],
+    limit: int,
+) -> tuple[Dict[str, Any], Dict[str, Any]]:
+    """El personal TI ve cualquier ticket, así que ticket y comentarios se piden en paralelo.
+    Para solicitantes primero se valida el acceso y luego se leen los comentarios."""
+    if user.rol in TICKET_STAFF_ROLES:
+        ticket, comments = await asyncio.gather(
+            asyncio.to_thread(fetch_ticket_record, ticket_id, ticket_columns),
+            asyncio.to_thread(fetch_ticket_comments_page, ticket_id, cursor, limit),
+        )
+        return ensure_ticket_access(ticket, user), comments
+
+    ticket = ensure_ticket_access(
+        await asyncio.to_thread(fetch_ticket_record, ticket_id, ticket_columns), user
+    )
+    comments = await asyncio.to_thread(fetch_ticket_comments_page, ticket_id, cursor, limit)
+    return ticket, comments
+
 
 @app.get("/tickets/{ticket_id}")
 async def get_ticket(
     ticket_id: str,
+    comments_limit: int = Query(COMMENTS_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
     user: UserProfile = Depends(get_current_user)
 ):
-    """Obtener detalle de ticket con comentarios"""
-    ticket = supabase.table("tickets").select(
-        "*, solicitante:users!solicitante_id(nombre, email), asignado:users!asignado_a(nombre), device:devices(nombre, tipo)"
-    ).eq("id", ticket_id).single().execute()
-    
-    if not ticket.data:
-        raise HTTPException(status_code=404, detail="Ticket no encontrado")
-    
-    # Verificar acceso
-    if user.rol not in ["TI", "LIDER_TI", "DIRECTOR"]:
-        if ticket.data["solicitante_id"] != user.id:
-            raise HTTPException(status_code=403, detail="Acceso denegado")
-    
-    # Comentarios
-    comments = supabase.table("ticket_comments").select(
-        "*, usuario:users!usuario_id(nombre)"
-    ).eq("ticket_id", ticket_id).order("fecha", desc=False).execute()
+    """Obtener detalle de ticket con la primera página de comentarios"""
+    ticket, comments = await load_ticket_with_comments(
+        ticket_id, user, TICKET_DETAIL_SELECT, None, comments_limit
+    )
     
     return {
-        "ticket": ticket.data,
-        "comments": comments.data
+        "ticket": ticket,
+        "comments": comments["data"],
+        "comments_total": comments["total"],
+        "comments_next_cursor": comments["next_cursor"],
+    }
+
+
+@app.get("/tickets/{ticket_id}/similar")
+async def list_similar_tickets(
+    ticket_id: str,
+    threshold: float = Query(DUPLICATE_SIMILARITY_THRESHOLD, ge=0.1, le=1.0),
+    user: UserProfile = Depends(get_current_user)
+):
+    """Tickets activos casi duplicados del mismo alcance (MinHash/LSH)"""
+    ticket = ensure_ticket_access(
+        fetch_ticket_record(ticket_id, "id, titulo, descripcion, estado, org_unit_id, solicitante_id"),
+        user,
+    )
+    await asyncio.to_thread(ensure_duplicate_index_loaded)
+
+    signature = ticket_duplicate_index.get_signature(ticket_id)
+    if signature is None:
+        signature = ticket_duplicate_index.signature(
+            ticket_shingles(ticket.get("titulo"), ticket.get("descripcion"))
+        )
+    matches = ticket_duplicate_index.query(
+        signature,
+        ticket.get("org_unit_id"),
+        global_scope=user.rol == "LIDER_TI",
+        exclude=ticket_id,
+        solicitante_id=duplicate_requester_scope(user),
+        threshold=threshold,
+    )
+    data = fetch_duplicate_candidates(matches, user)
+    return {"data": data, "count": len(data)}
+
+
+@app.get("/tickets/{ticket_id}/comments")
+async def list_ticket_comments(
+    ticket_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(COMMENTS_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    user: UserProfile = Depends(get_current_user)
+):
+    """Comentarios anteriores de un ticket (paginados hacia atrás)"""
+    _, comments = await load_ticket_with_comments(
+        ticket_id, user, "id, solicitante_id", cursor, limit
+    )
+    return {
+        "data": comments["data"],
+        "count": len(comments["data"]),
+        "next_cursor": comments["next_cursor"],
     }
 
 @app.put("/tickets/{ticket_id}")
@@ -1492,9 +4003,75 @@ async def update_ticket(
             user.id,
             {"final_status": updates.estado}
         )
+
+    sla_metrics.observe(response.data[0])
+    if ticket_assignment_scheduler.loaded:
+        ticket_assignment_scheduler.track(response.data[0])
+    if ticket_duplicate_index.loaded and response.data[0].get("estado") not in TICKET_ACTIVE_STATES:
+        ticket_duplicate_index.remove(ticket_id)
+    ticket_event_hub.publish("ticket.updated", response.data[0], update_data)
     
     return {"data": response.data[0], "message": "Ticket actualizado"}
 
+
+@app.post("/tickets/bulk-update")
+async def bulk_update_tickets(
+    payload: TicketBulkUpdate,
+    user: UserProfile = Depends(require_role(["TI", "LIDER_TI"]))
+):
+    """Aplicar el mismo cambio a varios tickets (un solo UPDATE y un bloque de auditoría)"""
+    update_data = {k: v for k, v in payload.updates.model_dump().items() if v is not None}
+    if not update_data:
+        raise HTTPException(status_code=400, detail="No se proporcionaron cambios para actualizar")
+
+    ticket_ids = list(dict.fromkeys(payload.ticket_ids))
+    query = supabase.table("tickets").update(update_data).in_("id", ticket_ids)
+    org_unit_id = resolve_org_scope(user)
+    if org_unit_id:
+        query = query.eq("org_unit_id", org_unit_id)
+    response = query.execute()
+    updated_rows = handle_supabase_error(response, "No se pudieron actualizar los tickets") or []
+    updated_by_id = {row["id"]: row for row in updated_rows}
+
+    results = [
+        {"ticket_id": ticket_id, "status": "updated", "data": updated_by_id[ticket_id]}
+        if ticket_id in updated_by_id
+        else {"ticket_id": ticket_id, "status": "not_found"}
+        for ticket_id in ticket_ids
+    ]
+
+    audit_block = None
+    if updated_rows:
+        audit_data = await register_audit_event(
+            "BULK_UPDATE_TICKETS",
+            str(uuid4()),
+            user.id,
+            {
+                "ticket_ids": [row["id"] for row in updated_rows],
+                "changes": update_data,
+                "final_status": payload.updates.estado
+                if payload.updates.estado in ["RESUELTO", "CERRADO"]
+                else None,
+            },
+        )
+        audit_block = audit_data["block_number"]
+
+    for row in updated_rows:
+        sla_metrics.observe(row)
+        if ticket_assignment_scheduler.loaded:
+            ticket_assignment_scheduler.track(row)
+        if ticket_duplicate_index.loaded and row.get("estado") not in TICKET_ACTIVE_STATES:
+            ticket_duplicate_index.remove(row["id"])
+        ticket_event_hub.publish("ticket.updated", row, update_data)
+
+    return {
+        "data": results,
+        "updated": len(updated_rows),
+        "not_found": len(ticket_ids) - len(updated_rows),
+        "audit_block": audit_block,
+        "message": f"{len(updated_rows)} tickets actualizados",
+    }
+
 @app.post("/tickets/{ticket_id}/comments")
 async def add_comment(
     ticket_id: str,
@@ -1511,44 +4088,283 @@ async def add_comment(
     }
     
     response = supabase.table("ticket_comments").insert(comment_data).execute()
+
+    ticket_scope = fetch_ticket_record(ticket_id, "id, org_unit_id, solicitante_id")
+    if ticket_scope:
+        ticket_event_hub.publish("comment.created", ticket_scope, response.data[0])
     
     return {"data": response.data[0], "message": "Comentario agregado"}
 
+# --- ATTACHMENTS ---
+
+@app.post("/attachments/uploads", status_code=201)
+async def create_attachment_upload(
+    upload: AttachmentUploadCreate,
+    user: UserProfile = Depends(get_current_user)
+):
+    """Iniciar una subida por fragmentos ligada a un ticket o comentario"""
+    if upload.tamanio_bytes > ATTACHMENT_MAX_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"El archivo supera el máximo de {ATTACHMENT_MAX_BYTES} bytes",
+        )
+    ensure_ticket_access(fetch_ticket_record(upload.ticket_id, "id, org_unit_id, solicitante_id"), user)
+    await asyncio.to_thread(attachment_storage.purge_expired)
+
+    entidad_tipo, entidad_id = "ticket", upload.ticket_id
+    if upload.comment_id:
+        response = (
+            supabase.table("ticket_comments")
+            .select("id")
+            .eq("id", upload.comment_id)
+            .eq("ticket_id", upload.ticket_id)
+            .limit(1)
+            .execute()
+        )
+        if not handle_supabase_error(response, "No se pudo obtener el comentario"):
+            raise HTTPException(status_code=404, detail="Comentario no encontrado")
+        entidad_tipo, entidad_id = "ticket_comment", upload.comment_id
+
+    upload_id = uuid4().hex
+    manifest = {
+        "nombre": upload.nombre,
+        "tipo_mime": upload.tipo_mime,
+        "tamanio_bytes": upload.tamanio_bytes,
+        "entidad_tipo": entidad_tipo,
+        "entidad_id": entidad_id,
+        "subido_por": user.id,
+        "creado_en": time.time(),
+    }
+    await asyncio.to_thread(attachment_storage.create, upload_id, manifest)
+    return {"data": upload_session_payload(upload_id, {**manifest, "offset": 0})}
+
+
+@app.get("/attachments/uploads/{upload_id}")
+async def get_attachment_upload(upload_id: str, user: UserProfile = Depends(get_current_user)):
+    """Consultar el byte desde el que debe reanudarse la subida"""
+    manifest = await load_upload_session(upload_id, user)
+    return {"data": upload_session_payload(upload_id, manifest)}
+
+
+@app.put("/attachments/uploads/{upload_id}")
+async def upload_attachment_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    user: UserProfile = Depends(get_current_user)
+):
+    """Recibir un fragmento en ``offset``; al completar el archivo se registra en attachments.
+    Si el registro falla, la sesión se conserva y basta repetir el PUT final."""
+    manifest = await load_upload_session(upload_id, user)
+
+    async with attachment_storage.lock(upload_id):
+        current = await asyncio.to_thread(attachment_storage.offset, upload_id)
+        if offset != current:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail={"message": "El offset no coincide con lo recibido", "offset": current},
+            )
+        received = await attachment_storage.append(upload_id, current, request.stream(), manifest["tamanio_bytes"])
+        manifest["offset"] = received
+        if received < manifest["tamanio_bytes"]:
+            return {"data": upload_session_payload(upload_id, manifest), "completo": False}
+
+        key = attachment_object_key(manifest, upload_id)
+        await asyncio.to_thread(attachment_storage.publish, upload_id, key, manifest["tipo_mime"])
+        try:
+            response = supabase.table("attachments").insert({
+                "nombre": manifest["nombre"],
+                "tipo_mime": manifest["tipo_mime"],
+                "tamanio_bytes": received,
+                "storage_path": key,
+                "entidad_tipo": manifest["entidad_tipo"],
+                "entidad_id": manifest["entidad_id"],
+                "subido_por": user.id,
+            }).execute()
+            rows = handle_supabase_error(response, "No se pudo registrar el adjunto", require_data=True)
+        except Exception:
+            # Sin fila en attachments el objeto quedaría huérfano en el almacenamiento
+            await asyncio.to_thread(attachment_storage.unpublish, key)
+            raise
+
+        await asyncio.to_thread(attachment_storage.discard, upload_id)
+
+    return {"data": rows[0], "completo": True, "message": "Adjunto subido exitosamente"}
+
+
+@app.delete("/attachments/uploads/{upload_id}", status_code=204)
+async def cancel_attachment_upload(upload_id: str, user: UserProfile = Depends(get_current_user)):
+    """Cancelar una subida en curso"""
+    await load_upload_session(upload_id, user)
+    await asyncio.to_thread(attachment_storage.discard, upload_id)
+    return Response(status_code=204)
+
+
+@app.get("/attachments/{attachment_id}")
+async def get_attachment(attachment_id: str, user: UserProfile = Depends(get_current_user)):
+    """Obtener un adjunto con una URL firmada de corta duración (el bucket es privado)"""
+    response = supabase.table("attachments").select("*").eq("id", attachment_id).limit(1).execute()
+    rows = handle_supabase_error(response, "No se pudo obtener el adjunto") or []
+    if not rows:
+        raise HTTPException(status_code=404, detail="Adjunto no encontrado")
+    attachment = rows[0]
+
+    ticket_id = attachment.get("entidad_id")
+    if attachment.get("entidad_tipo") == "ticket_comment":
+        comment_response = (
+            supabase.table("ticket_comments").select("ticket_id").eq("id", ticket_id).limit(1).execute()
+        )
+        comments = handle_supabase_error(comment_response, "No se pudo obtener el comentario") or []
+        ticket_id = comments[0]["ticket_id"] if comments else None
+    elif attachment.get("entidad_tipo") != "ticket":
+        raise HTTPException(status_code=404, detail="Adjunto no encontrado")
+    ticket = fetch_ticket_record(ticket_id, "id, org_unit_id, solicitante_id") if ticket_id else None
+    ensure_ticket_access(ticket, user)
+
+    if attachment.get("storage_path"):
+        attachment["url"] = await asyncio.to_thread(
+            attachment_storage.signed_url, attachment["storage_path"], ATTACHMENT_SIGNED_URL_SECONDS
+        )
+    return {"data": attachment, "expires_in": ATTACHMENT_SIGNED_URL_SECONDS}
+
 # --- DASHBOARD ---
 
 @app.get("/dashboard/metrics")
 async def get_metrics(user: UserProfile = Depends(get_current_user)):
-    """Obtener métricas del dashboard"""
-    # Dispositivos
-    devices_query = supabase.table("devices").select("estado", count="exact")
-    if user.rol != "LIDER_TI":
-        devices_query = devices_query.eq("org_unit_id", user.org_unit_id)
-    devices = devices_query.execute()
-    
-    # Tickets
-    tickets_query = supabase.table("tickets").select("estado, prioridad", count="exact")
-    if user.rol != "LIDER_TI":
-        tickets_query = tickets_query.eq("org_unit_id", user.org_unit_id)
-    tickets = tickets_query.execute()
-    
-    # Backups
-    backups = supabase.table("backups").select("id", count="exact").execute()
-    
+    """Obtener métricas del dashboard (contadores mantenidos por triggers)"""
+    return await asyncio.to_thread(dashboard_metrics_for, user)
+
+
+@app.get("/dashboard/metrics/org-units")
+async def get_org_unit_breakdown(user: UserProfile = Depends(require_role(["LIDER_TI"]))):
+    """Métricas del dashboard de todas las org units en una sola consulta agrupada"""
+    cached = org_breakdown_cache.get(None)
+    if cached is not None:
+        return {**cached, "cached": True}
+
+    response = supabase.rpc("get_org_unit_breakdown", {}).execute()
+    rows = handle_supabase_error(response, "No se pudo obtener el desglose por unidad") or []
+    result = {
+        "data": [
+            {"org_unit_id": row["org_unit_id"], "nombre": row["nombre"], **build_dashboard_metrics(row.get("metricas") or {})}
+            for row in rows
+        ],
+        "generado_en": datetime.utcnow().isoformat(),
+    }
+    org_breakdown_cache.set(None, result)
+    return {**result, "cached": False}
+
+
+@app.get("/dashboard/series")
+async def get_metric_series(
+    metricas: List[Literal[METRIC_SERIES]] = Query(["tickets_creados"]),
+    granularidad: Literal["hour", "day"] = "day",
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    user: UserProfile = Depends(get_current_user),
+):
+    """Series por hora o día leídas solo de metric_rollups"""
+    step = SERIES_STEPS[granularidad]
+    hasta_bucket = truncate_bucket(hasta or datetime.utcnow(), granularidad) + step
+    desde_bucket = (
+        truncate_bucket(desde, granularidad)
+        if desde
+        else hasta_bucket - step * SERIES_DEFAULT_BUCKETS[granularidad]
+    )
+    if desde_bucket >= hasta_bucket:
+        raise HTTPException(status_code=400, detail="El rango de fechas es inválido")
+    if (hasta_bucket - desde_bucket) / step > SERIES_MAX_BUCKETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"El rango excede {SERIES_MAX_BUCKETS} intervalos; use una granularidad mayor",
+        )
+
+    metricas = list(dict.fromkeys(metricas))
+    org_unit_id = resolve_org_scope(user)
+    rows: List[Dict[str, Any]] = []
+    if user.rol == "LIDER_TI" or org_unit_id:
+        response = supabase.rpc(
+            "get_metric_series",
+            {
+                "p_org_unit_id": org_unit_id,
+                "p_metricas": metricas,
+                "p_granularidad": granularidad,
+                "p_desde": desde_bucket.isoformat() + "Z",
+                "p_hasta": hasta_bucket.isoformat() + "Z",
+            },
+        ).execute()
+        rows = handle_supabase_error(response, "No se pudieron obtener las series") or []
+
     return {
-        "dispositivos": {
-            "total": devices.count,
-            "activos": len([d for d in devices.data if d["estado"] == "ACTIVO"]),
-            "reparacion": len([d for d in devices.data if d["estado"] == "REPARACIÓN"])
-        },
-        "tickets": {
-            "total": tickets.count,
-            "abiertos": len([t for t in tickets.data if t["estado"] == "ABIERTO"]),
-            "en_proceso": len([t for t in tickets.data if t["estado"] == "EN_PROCESO"])
-        },
-        "backups": {
-            "total": backups.count
-        }
+        "data": build_metric_series(rows, metricas, granularidad, desde_bucket, hasta_bucket),
+        "granularidad": granularidad,
+        "desde": desde_bucket.isoformat() + "Z",
+        "hasta": hasta_bucket.isoformat() + "Z",
+    }
+
+
+@app.post("/admin/dashboard/series/backfill")
+async def admin_backfill_metric_series(user: UserProfile = Depends(require_global_admin())):
+    """Recalcular metric_rollups desde tickets, backups y device_logs."""
+    response = supabase.rpc("rebuild_metric_rollups", {}).execute()
+    rows = handle_supabase_error(response, "No se pudieron recalcular las series")
+    return {"data": {"buckets": rows}, "message": "Series recalculadas"}
+
+
+@app.post("/admin/dashboard/reconcile")
+async def admin_reconcile_dashboard(
+    reparar: bool = False,
+    user: UserProfile = Depends(require_global_admin()),
+):
+    """Comparar dashboard_counters con un recálculo completo; con reparar=true se reconstruyen."""
+    report = await asyncio.to_thread(fetch_dashboard_drift)
+    if report:
+        logger.warning("Deriva en contadores del dashboard: %s", report)
+    reparado = False
+    if report and reparar:
+        await asyncio.to_thread(rebuild_dashboard_counters)
+        reparado = True
+    return {"data": report, "con_deriva": len(report), "reparado": reparado}
+
+# --- HOME ---
+
+async def timed_section(func, *args) -> tuple[Any, float, Optional[Dict[str, Any]]]:
+    """Ejecuta una sección en un hilo y mide su duración; los errores no tumban el resto."""
+    started = time.perf_counter()
+    try:
+        result, error = await asyncio.to_thread(func, *args), None
+    except HTTPException as exc:
+        result, error = None, {"status": exc.status_code, "detail": exc.detail}
+    except Exception:
+        logger.exception("Falló la sección %s de /home", getattr(func, "__name__", func))
+        result, error = None, {"status": status.HTTP_500_INTERNAL_SERVER_ERROR, "detail": "Error interno"}
+    return result, round((time.perf_counter() - started) * 1000, 2), error
+
+
+@app.get("/home")
+async def get_home(
+    tickets_limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    user: UserProfile = Depends(get_current_user),
+):
+    """Datos de arranque del dashboard en una sola llamada (perfil, permisos, métricas y tickets)"""
+    started = time.perf_counter()
+    sections = {
+        "permissions": (resolve_inventory_permission, user),
+        "metrics": (dashboard_metrics_for, user),
+        "tickets": (fetch_tickets_page, user, None, None, None, None, tickets_limit),
     }
+    results = await asyncio.gather(*(timed_section(*spec) for spec in sections.values()))
+
+    payload: Dict[str, Any] = {"profile": user.model_dump()}
+    timings: Dict[str, float] = {}
+    errors: Dict[str, Any] = {}
+    for name, (result, elapsed_ms, error) in zip(sections, results):
+        payload[name] = result
+        timings[name] = elapsed_ms
+        if error:
+            errors[name] = error
+    timings["total"] = round((time.perf_counter() - started) * 1000, 2)
+    return {**payload, "timings_ms": timings, "errors": errors}
 
 # --- AUDIT CHAIN ---
 
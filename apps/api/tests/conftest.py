@@ -3,6 +3,8 @@ import sys
 from pathlib import Path
 from types import SimpleNamespace
 
+import pytest
+
 supabase_stub = SimpleNamespace(
     create_client=lambda _url, _key: SimpleNamespace(),
     Client=SimpleNamespace,
@@ -16,3 +18,73 @@ if str(ROOT_DIR) not in sys.path:
 os.environ.setdefault("SUPABASE_URL", "http://test.local")
 os.environ.setdefault("SUPABASE_SERVICE_ROLE", "test-key")
 os.environ.setdefault("JWT_SECRET", "secret")
+
+
+class RecordingQuery:
+    """Query builder falso: registra cada llamada y devuelve filas fijas."""
+
+    def __init__(self, table, rows, calls):
+        self.table = table
+        self._rows = rows
+        self.calls = calls
+
+    def __getattr__(self, name):
+        def method(*args, **kwargs):
+            self.calls.append((self.table, name, args, kwargs))
+            return self
+
+        return method
+
+    def execute(self):
+        self.calls.append((self.table, "execute", (), {}))
+        rows = self._rows.get(self.table, []) if isinstance(self._rows, dict) else self._rows
+        return SimpleNamespace(data=rows, count=len(rows) if isinstance(rows, list) else None)
+
+
+class RecordingSupabase:
+    def __init__(self, rows):
+        self._rows = rows
+        self.calls = []
+
+    def table(self, name):
+        return RecordingQuery(name, self._rows, self.calls)
+
+    def rpc(self, name, params=None):
+        self.calls.append(("rpc", name, (params,), {}))
+        return RecordingQuery(f"rpc:{name}", self._rows, self.calls)
+
+    def called(self, method):
+        return [call for call in self.calls if call[1] == method]
+
+
+@pytest.fixture
+def recording_supabase(monkeypatch):
+    from apps.api.app import main
+
+    def install(rows=None):
+        fake = RecordingSupabase(rows if rows is not None else [])
+        monkeypatch.setattr(main, "supabase", fake)
+        return fake
+
+    return install
+
+
+@pytest.fixture
+def as_user():
+    from fastapi.testclient import TestClient
+
+    from apps.api.app import main
+
+    def build(rol="TI", org_unit_id="org-1", user_id="user-1"):
+        user = main.UserProfile(
+            id=user_id,
+            nombre="Test User",
+            email="user@example.com",
+            rol=rol,
+            org_unit_id=org_unit_id,
+        )
+        main.app.dependency_overrides[main.get_current_user] = lambda: user
+        return TestClient(main.app)
+
+    yield build
+    main.app.dependency_overrides.clear()
@@ -0,0 +1,155 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from apps.api.app import main
+
+TICKET = {"id": "t1", "org_unit_id": "org-1", "solicitante_id": "user-1"}
+
+
+def install_storage(monkeypatch, tmp_path):
+    storage = main.LocalAttachmentStorage(str(tmp_path / "files"))
+    monkeypatch.setattr(main, "attachment_storage", storage)
+    return storage
+
+
+def start_upload(client, size, **extra):
+    response = client.post(
+        "/attachments/uploads",
+        json={"nombre": "Foto daño.png", "tipo_mime": "image/png", "tamanio_bytes": size, "ticket_id": "t1", **extra},
+    )
+    assert response.status_code == 201
+    return response.json()["data"]["upload_id"]
+
+
+async def body(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def test_chunked_upload_resumes_and_registers_attachment(monkeypatch, tmp_path, recording_supabase, as_user):
+    install_storage(monkeypatch, tmp_path)
+    fake = recording_supabase({"tickets": [TICKET], "attachments": [{"id": "att-1"}]})
+    client = as_user()
+    upload_id = start_upload(client, 10)
+
+    first = client.put(f"/attachments/uploads/{upload_id}", params={"offset": 0}, content=b"hello")
+    assert first.json()["completo"] is False
+
+    stale = client.put(f"/attachments/uploads/{upload_id}", params={"offset": 0}, content=b"hello")
+    assert stale.status_code == 409
+    assert stale.json()["detail"]["offset"] == 5
+    assert client.get(f"/attachments/uploads/{upload_id}").json()["data"]["offset"] == 5
+
+    last = client.put(f"/attachments/uploads/{upload_id}", params={"offset": 5}, content=b"world")
+
+    assert last.status_code == 200
+    assert last.json() == {"data": {"id": "att-1"}, "completo": True, "message": "Adjunto subido exitosamente"}
+    inserted = [call for call in fake.called("insert") if call[0] == "attachments"][0][2][0]
+    assert inserted["entidad_tipo"] == "ticket"
+    assert inserted["tamanio_bytes"] == 10
+    assert inserted["storage_path"] == f"ticket/t1/{upload_id}-Foto-dano.png"
+    assert "url" not in inserted
+    stored = tmp_path / "files" / "ticket" / "t1" / f"{upload_id}-Foto-dano.png"
+    assert stored.read_bytes() == b"helloworld"
+    assert client.get(f"/attachments/uploads/{upload_id}").status_code == 404
+    assert not (tmp_path / "files" / "uploads" / upload_id).exists()
+
+
+def test_upload_resumes_on_another_instance(monkeypatch, tmp_path, recording_supabase, as_user):
+    install_storage(monkeypatch, tmp_path)
+    recording_supabase({"tickets": [TICKET], "attachments": [{"id": "att-1"}]})
+    client = as_user()
+    upload_id = start_upload(client, 10)
+    client.put(f"/attachments/uploads/{upload_id}", params={"offset": 0}, content=b"hello")
+
+    # Otra función serverless: sin estado en memoria, mismo almacenamiento compartido
+    install_storage(monkeypatch, tmp_path)
+    response = client.put(f"/attachments/uploads/{upload_id}", params={"offset": 5}, content=b"world")
+
+    assert response.json()["completo"] is True
+    assert (tmp_path / "files" / "ticket" / "t1" / f"{upload_id}-Foto-dano.png").read_bytes() == b"helloworld"
+
+
+def test_concurrent_chunk_at_same_offset_conflicts(tmp_path):
+    storage = main.LocalAttachmentStorage(str(tmp_path))
+    upload_id = "a" * 32
+    storage.create(upload_id, {"tamanio_bytes": 10, "creado_en": main.time.time()})
+
+    assert asyncio.run(storage.append(upload_id, 0, body(b"hel", b"lo"), 10)) == 5
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(storage.append(upload_id, 0, body(b"hello"), 10))
+
+    assert exc.value.status_code == 409
+    assert exc.value.detail["offset"] == 5
+    assert storage.load(upload_id)["offset"] == 5
+
+
+def test_chunk_larger_than_declared_size_is_rejected(monkeypatch, tmp_path, recording_supabase, as_user):
+    storage = install_storage(monkeypatch, tmp_path)
+    recording_supabase({"tickets": [TICKET]})
+    client = as_user()
+    upload_id = start_upload(client, 4)
+
+    response = client.put(f"/attachments/uploads/{upload_id}", params={"offset": 0}, content=b"too long")
+
+    assert response.status_code == 413
+    assert storage.offset(upload_id) == 0
+
+
+def test_upload_session_is_private_to_uploader(monkeypatch, tmp_path, recording_supabase, as_user):
+    install_storage(monkeypatch, tmp_path)
+    recording_supabase({"tickets": [TICKET]})
+    upload_id = start_upload(as_user(), 4)
+
+    response = as_user(user_id="user-2").get(f"/attachments/uploads/{upload_id}")
+
+    assert response.status_code == 404
+
+
+def test_failed_attachment_insert_keeps_session_for_retry(monkeypatch, tmp_path, recording_supabase, as_user):
+    storage = install_storage(monkeypatch, tmp_path)
+    recording_supabase({"tickets": [TICKET], "attachments": []})
+    client = as_user()
+    upload_id = start_upload(client, 5)
+
+    response = client.put(f"/attachments/uploads/{upload_id}", params={"offset": 0}, content=b"hello")
+
+    assert response.status_code == 502
+    assert not list((tmp_path / "files").rglob("*.png"))
+    assert storage.load(upload_id)["offset"] == 5
+
+    recording_supabase({"tickets": [TICKET], "attachments": [{"id": "att-1"}]})
+    retry = client.put(f"/attachments/uploads/{upload_id}", params={"offset": 5})
+
+    assert retry.json()["completo"] is True
+    assert storage.load(upload_id) is None
+
+
+def test_get_attachment_returns_signed_url_for_allowed_users(monkeypatch, tmp_path, recording_supabase, as_user):
+    install_storage(monkeypatch, tmp_path)
+    row = {"id": "att-1", "entidad_tipo": "ticket", "entidad_id": "t1", "storage_path": "ticket/t1/x.png", "url": None}
+    recording_supabase({"tickets": [TICKET], "attachments": [row]})
+
+    response = as_user().get("/attachments/att-1")
+
+    assert response.status_code == 200
+    assert response.json()["data"]["url"].endswith("/ticket/t1/x.png")
+    assert response.json()["expires_in"] == main.ATTACHMENT_SIGNED_URL_SECONDS
+    assert as_user(rol="DOCENTE", user_id="user-2").get("/attachments/att-1").status_code == 403
+
+
+def test_purge_expired_drops_abandoned_uploads(monkeypatch, tmp_path, recording_supabase, as_user):
+    storage = install_storage(monkeypatch, tmp_path)
+    recording_supabase({"tickets": [TICKET]})
+    stale_id = start_upload(as_user(), 4)
+    now = main.time.time() + storage.ttl_seconds + 1
+    fresh_id = "b" * 32
+    storage.create(fresh_id, {"tamanio_bytes": 4, "subido_por": "user-1", "creado_en": now})
+    storage._last_purge = 0.0
+
+    assert storage.purge_expired(now=now) == 1
+    assert storage.load(stale_id) is None
+    assert storage.load(fresh_id) is not None
+    assert storage.purge_expired(now=now + 1) == 0
@@ -0,0 +1,190 @@
+import pytest
+from fastapi import HTTPException
+
+from apps.api.app import main
+
+
+def test_list_backups_scopes_filters_and_paginates(recording_supabase, as_user):
+    rows = [
+        {"id": f"b{index}", "fecha_backup": f"2025-01-0{9 - index}T00:00:00+00:00"}
+        for index in range(3)
+    ]
+    fake = recording_supabase({"backups": rows})
+
+    response = as_user().get(
+        "/backups",
+        params={"limit": 2, "exitoso": "false", "tipo": "COMPLETA", "desde": "2025-01-01T00:00:00"},
+    )
+
+    assert response.status_code == 200
+    payload = response.json()
+    assert [item["id"] for item in payload["data"]] == ["b0", "b1"]
+    assert payload["next_cursor"] == main.encode_cursor("2025-01-08T00:00:00+00:00", "b1")
+
+    select = fake.called("select")[0][2][0]
+    assert "descripcion" not in select and "!inner" in select
+    filters = {(call[1], call[2][0]): call[2][1] for call in fake.calls if call[1] in ("eq", "gte")}
+    assert filters[("eq", "device.org_unit_id")] == "org-1"
+    assert filters[("eq", "exitoso")] is False
+    assert filters[("eq", "tipo")] == "COMPLETA"
+    assert filters[("gte", "fecha_backup")] == "2025-01-01T00:00:00"
+    assert fake.called("limit")[0][2] == (3,)
+
+
+ROW_ID = "3f6c2a1e-8a4b-4c1d-9e2f-0a1b2c3d4e5f"
+
+
+def test_list_backups_applies_cursor(recording_supabase, as_user):
+    fake = recording_supabase({"backups": []})
+    cursor = main.encode_cursor("2025-01-08T00:00:00Z", ROW_ID)
+
+    response = as_user(rol="LIDER_TI").get("/backups", params={"cursor": cursor})
+
+    assert response.json() == {"data": [], "count": 0, "next_cursor": None}
+    assert fake.called("or_")[0][2][0] == (
+        'fecha_backup.lt."2025-01-08T00:00:00+00:00",'
+        f'and(fecha_backup.eq."2025-01-08T00:00:00+00:00",id.lt.{ROW_ID})'
+    )
+    assert not [call for call in fake.called("eq") if call[2][0] == "device.org_unit_id"]
+
+
+@pytest.mark.parametrize(
+    "value, row_id",
+    [
+        ('2025-01-08",id.gt.0),or(id.neq.x', ROW_ID),
+        ("2025-01-08T00:00:00+00:00", "b1),or(id.neq.x"),
+    ],
+)
+def test_list_backups_rejects_tampered_cursor(recording_supabase, as_user, value, row_id):
+    fake = recording_supabase({"backups": []})
+
+    response = as_user(rol="LIDER_TI").get(
+        "/backups", params={"cursor": main.encode_cursor(value, row_id)}
+    )
+
+    assert response.status_code == 400
+    assert not fake.called("or_")
+
+
+def test_decode_cursor_rejects_garbage():
+    with pytest.raises(HTTPException) as exc:
+        main.decode_cursor("no-es-un-cursor", 2)
+
+    assert exc.value.status_code == 400
+
+
+@pytest.mark.parametrize(
+    "raw, expected",
+    [
+        ("Diaria", 24.0),
+        ("SEMANAL", 168.0),
+        ("cada 3 días", 72.0),
+        ("12h", 12.0),
+        ("Mensual (primer lunes)", 720.0),
+        ("cuando se pueda", None),
+        (None, None),
+    ],
+)
+def test_parse_backup_frequency_hours(raw, expected):
+    assert main.parse_backup_frequency_hours(raw) == expected
+
+
+def compliance_row(device_id, ultimo_backup, frecuencia):
+    return main.build_compliance_row(
+        {
+            "device_id": device_id,
+            "nombre": device_id,
+            "tipo": "PC",
+            "org_unit_id": "org-1",
+            "ultimo_backup": ultimo_backup,
+            "frecuencia": frecuencia,
+        }
+    )
+
+
+def test_compute_backup_compliance_classifies_fleet():
+    now = main._timestamp_seconds("2025-01-10T00:00:00+00:00")
+    rows = [
+        compliance_row("al-dia", "2025-01-09T18:00:00+00:00", "Diaria"),
+        compliance_row("en-riesgo", "2025-01-09T02:00:00", "Diaria"),
+        compliance_row("vencido", "2025-01-01T00:00:00+00:00", "Semanal"),
+        compliance_row("sin-backup", None, "Diaria"),
+        compliance_row("sin-frecuencia", "2025-01-09T00:00:00+00:00", "a veces"),
+    ]
+
+    results = main.compute_backup_compliance(rows, now=now)
+
+    assert {item["device_id"]: item["estado"] for item in results} == {
+        "al-dia": "AL_DIA",
+        "en-riesgo": "EN_RIESGO",
+        "vencido": "VENCIDO",
+        "sin-backup": "SIN_BACKUP",
+        "sin-frecuencia": "SIN_FRECUENCIA",
+    }
+    assert results[2]["proximo_backup"] == "2025-01-08T00:00:00"
+
+
+def test_compliance_cache_records_backup_incrementally():
+    cache = main.BackupComplianceCache(ttl_seconds=60)
+    cache.set("org-1", {"dev-1": compliance_row("dev-1", None, None)})
+
+    cache.record_backup("dev-1", "2025-01-09T00:00:00", "Diaria")
+
+    row = cache.get("org-1")["dev-1"]
+    assert row["intervalo_horas"] == 24.0
+    assert row["ultimo_backup_ts"] == main._timestamp_seconds("2025-01-09T00:00:00+00:00")
+
+
+def test_create_backup_failure_leaves_compliance_cache_untouched(recording_supabase, as_user, monkeypatch):
+    recording_supabase({"backups": []})
+    cache = main.BackupComplianceCache(ttl_seconds=60)
+    cache.set(None, {"dev-1": compliance_row("dev-1", None, None)})
+    monkeypatch.setattr(main, "backup_compliance_cache", cache)
+
+    response = as_user(rol="LIDER_TI").post(
+        "/backups",
+        json={"device_id": "dev-1", "tipo": "COMPLETA", "almacenamiento": "NUBE", "frecuencia": "Diaria"},
+    )
+
+    assert response.status_code == 502
+    assert cache.get(None)["dev-1"]["ultimo_backup"] is None
+
+
+def test_create_backups_batch_inserts_once_and_audits_once(recording_supabase, as_user):
+    fake = recording_supabase(
+        {
+            "devices": [{"id": "dev-1"}, {"id": "dev-2"}],
+            "backups": [
+                {"id": "b1", "device_id": "dev-1", "fecha_backup": "2025-01-09T00:00:00"},
+                {"id": "b2", "device_id": "dev-2", "fecha_backup": "2025-01-09T00:00:00"},
+            ],
+        }
+    )
+    entry = {"tipo": "COMPLETA", "almacenamiento": "NUBE", "frecuencia": "Diaria"}
+
+    response = as_user().post(
+        "/backups/batch",
+        json={
+            "backups": [
+                {**entry, "device_id": "dev-1"},
+                {**entry, "device_id": "desconocido"},
+                {**entry, "device_id": "dev-2"},
+            ]
+        },
+    )
+
+    assert response.status_code == 201
+    payload = response.json()
+    assert [item["status"] for item in payload["data"]] == ["created", "error", "created"]
+    assert payload["data"][2]["data"]["id"] == "b2"
+    assert (payload["created"], payload["failed"]) == (2, 1)
+
+    inserts = {call[0]: call[2][0] for call in fake.called("insert")}
+    assert [row["device_id"] for row in inserts["backups"]] == ["dev-1", "dev-2"]
+    assert all(row["proximo_backup"] for row in inserts["backups"])
+    assert len(inserts["device_logs"]) == 2
+    assert len([call for call in fake.called("insert") if call[0] == "audit_chain"]) == 1
+    block = inserts["audit_chain"]
+    assert (block["action"], block["entity_id"]) == ("BACKUP_BATCH", payload["batch_id"])
+    assert block["metadata"]["batch_id"] == payload["batch_id"]
+    assert block["metadata"]["device_ids"] == ["dev-1", "dev-2"]
@@ -0,0 +1,191 @@
+from apps.api.app import main
+
+
+def test_dashboard_metrics_uses_single_scoped_rpc(recording_supabase, as_user):
+    fake = recording_supabase({
+        "rpc:get_dashboard_counters": {
+            "dispositivos": {"total": 12, "activos": 9, "reparacion": 2, "retirados": 1},
+            "tickets": {"total": "5", "abiertos": 3, "en_proceso": 1, "resueltos": 1, "cerrados": 0,
+                        "tiempo_promedio_respuesta": "42.456", "tiempo_promedio_resolucion": None},
+            "backups": {"total": 30},
+        }
+    })
+
+    response = as_user().get("/dashboard/metrics")
+
+    assert response.status_code == 200
+    payload = response.json()
+    assert payload["dispositivos"] == {"total": 12, "activos": 9, "reparacion": 2, "retirados": 1}
+    assert payload["tickets"]["total"] == 5
+    assert payload["tickets"]["tiempo_promedio_respuesta"] == 42.5
+    assert payload["backups"] == {"total": 30}
+    assert fake.calls[0] == ("rpc", "get_dashboard_counters", ({"p_org_unit_id": "org-1"},), {})
+    assert fake.called("select") == []
+
+
+def test_dashboard_metrics_is_global_for_lider_ti(recording_supabase, as_user):
+    fake = recording_supabase({"rpc:get_dashboard_counters": {}})
+
+    response = as_user(rol="LIDER_TI", org_unit_id=None).get("/dashboard/metrics")
+
+    assert response.json()["backups"] == {"total": 0}
+    assert fake.calls[0][2] == ({"p_org_unit_id": None},)
+
+
+def test_dashboard_metrics_without_org_unit_returns_zeros(recording_supabase, as_user):
+    fake = recording_supabase({})
+
+    response = as_user(org_unit_id=None).get("/dashboard/metrics")
+
+    assert response.json() == main.build_dashboard_metrics({})
+    assert fake.calls == []
+
+
+COUNTERS = {
+    "rpc:get_dashboard_counters": {
+        "dispositivos": {"total": 2, "activos": 2},
+        "tickets": {"total": 1, "abiertos": 1},
+        "backups": {"total": 4},
+    }
+}
+
+
+def test_reconcile_reports_drift_without_repairing(recording_supabase, as_user):
+    fake = recording_supabase({
+        "rpc:get_dashboard_counter_drift": [
+            {"org_unit_id": "org-1", "seccion": "tickets", "contador": "abiertos", "esperado": 3, "actual": 2},
+            {"org_unit_id": "org-1", "seccion": "backups", "contador": "total", "esperado": 4, "actual": "5"},
+        ]
+    })
+
+    response = as_user(rol="LIDER_TI").post("/admin/dashboard/reconcile")
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "data": [{"org_unit_id": "org-1", "deriva": {"tickets.abiertos": 1, "backups.total": -1}}],
+        "con_deriva": 1,
+        "reparado": False,
+    }
+    assert fake.called("rebuild_dashboard_counters") == []
+
+
+def test_reconcile_repairs_counters_on_request(recording_supabase, as_user):
+    fake = recording_supabase({
+        "rpc:get_dashboard_counter_drift": [
+            {"org_unit_id": None, "seccion": "tickets", "contador": "total", "esperado": 1, "actual": 0},
+        ],
+        "rpc:rebuild_dashboard_counters": 12,
+    })
+
+    response = as_user(rol="LIDER_TI").post("/admin/dashboard/reconcile", params={"reparar": True})
+
+    assert response.json()["reparado"] is True
+    assert len(fake.called("rebuild_dashboard_counters")) == 1
+    assert as_user(rol="TI").post("/admin/dashboard/reconcile").status_code == 403
+
+
+def test_metric_series_reads_rollups_and_fills_gaps(recording_supabase, as_user):
+    fake = recording_supabase({
+        "rpc:get_metric_series": [
+            {"metrica": "tickets_creados", "bucket": "2025-02-02T00:00:00+00:00", "total": 4},
+            {"metrica": "backups", "bucket": "2025-02-03T00:00:00+00:00", "total": "2"},
+        ]
+    })
+
+    response = as_user().get(
+        "/dashboard/series",
+        params={"metricas": ["tickets_creados", "backups"], "desde": "2025-02-01T10:00:00", "hasta": "2025-02-03T08:00:00"},
+    )
+
+    assert response.status_code == 200
+    payload = response.json()
+    assert payload["desde"] == "2025-02-01T00:00:00Z"
+    assert payload["hasta"] == "2025-02-04T00:00:00Z"
+    assert [point["total"] for point in payload["data"]["tickets_creados"]] == [0, 4, 0]
+    assert [point["total"] for point in payload["data"]["backups"]] == [0, 0, 2]
+    params = fake.calls[0][2][0]
+    assert params["p_org_unit_id"] == "org-1"
+    assert params["p_granularidad"] == "day"
+
+
+def test_metric_series_rejects_too_many_buckets(recording_supabase, as_user):
+    fake = recording_supabase([])
+
+    response = as_user().get(
+        "/dashboard/series",
+        params={"granularidad": "hour", "desde": "2024-01-01T00:00:00", "hasta": "2025-01-01T00:00:00"},
+    )
+
+    assert response.status_code == 400
+    assert fake.calls == []
+
+
+def test_org_unit_breakdown_uses_one_rpc_and_caches(monkeypatch, recording_supabase, as_user):
+    monkeypatch.setattr(main, "org_breakdown_cache", main.OrgScopedCache(60))
+    fake = recording_supabase({
+        "rpc:get_org_unit_breakdown": [
+            {"org_unit_id": "org-1", "nombre": "Sede Norte", "metricas": {"dispositivos": {"total": 3, "activos": 3}}},
+            {"org_unit_id": "org-2", "nombre": "Sede Sur", "metricas": {"backups": {"total": 7}}},
+        ]
+    })
+    client = as_user(rol="LIDER_TI")
+
+    first = client.get("/dashboard/metrics/org-units").json()
+    second = client.get("/dashboard/metrics/org-units").json()
+
+    assert [row["nombre"] for row in first["data"]] == ["Sede Norte", "Sede Sur"]
+    assert first["data"][0]["dispositivos"]["activos"] == 3
+    assert first["data"][1]["backups"] == {"total": 7}
+    assert (first["cached"], second["cached"]) == (False, True)
+    assert len(fake.called("get_org_unit_breakdown")) == 1
+
+
+def test_org_unit_breakdown_is_restricted_to_lider_ti(recording_supabase, as_user):
+    recording_supabase({})
+
+    assert as_user(rol="TI").get("/dashboard/metrics/org-units").status_code == 403
+
+
+def test_home_bundles_sections_with_timings(recording_supabase, as_user):
+    fake = recording_supabase({"tickets": [{"id": "t1", "fecha_creacion": "2025-02-01T08:00:00+00:00"}], **COUNTERS})
+
+    response = as_user().get("/home", params={"tickets_limit": 5})
+
+    assert response.status_code == 200
+    payload = response.json()
+    assert payload["profile"]["id"] == "user-1"
+    assert payload["permissions"] == {"can_manage": True, "source": "role"}
+    assert payload["metrics"]["backups"] == {"total": 4}
+    assert [ticket["id"] for ticket in payload["tickets"]["data"]] == ["t1"]
+    assert set(payload["timings_ms"]) == {"permissions", "metrics", "tickets", "total"}
+    assert payload["errors"] == {}
+    assert fake.called("limit")[0][2] == (6,)
+
+
+def test_home_reports_failed_section_without_failing(monkeypatch, recording_supabase, as_user):
+    recording_supabase(COUNTERS)
+
+    def broken(*_args):
+        raise main.HTTPException(status_code=502, detail="No se pudieron obtener los tickets")
+
+    monkeypatch.setattr(main, "fetch_tickets_page", broken)
+
+    payload = as_user().get("/home").json()
+
+    assert payload["tickets"] is None
+    assert payload["errors"] == {"tickets": {"status": 502, "detail": "No se pudieron obtener los tickets"}}
+    assert payload["metrics"]["tickets"]["total"] == 1
+
+
+def test_home_reports_unexpected_section_errors(monkeypatch, recording_supabase, as_user):
+    recording_supabase(COUNTERS)
+
+    def broken(*_args):
+        raise KeyError("fecha_creacion")
+
+    monkeypatch.setattr(main, "fetch_tickets_page", broken)
+
+    response = as_user().get("/home")
+
+    assert response.status_code == 200
+    assert response.json()["errors"] == {"tickets": {"status": 500, "detail": "Error interno"}}
@@ -0,0 +1,49 @@
+import pytest
+
+from apps.api.app import main
+
+GB = 1024 ** 3
+
+
+@pytest.mark.parametrize(
+    "raw, expected",
+    [
+        ("8GB", 8 * GB),
+        ("512 GB SSD", 512 * GB),
+        ("1TB", 1024 * GB),
+        ("1,5 TB HDD", int(1.5 * 1024 * GB)),
+        ("8192 MB", 8 * GB),
+        ("16", 16 * GB),
+        ("16 G", 16 * GB),
+        ("DDR4 8GB", 8 * GB),
+        ("N/A", None),
+        ("", None),
+        (None, None),
+    ],
+)
+def test_parse_capacity_bytes(raw, expected):
+    assert main.parse_capacity_bytes(raw) == expected
+
+
+@pytest.mark.parametrize(
+    "raw, expected",
+    [
+        ("2.4GHz", 2400),
+        ("3,1 GHz", 3100),
+        ("3200 MHz", 3200),
+        ("2.4", 2400),
+        ("1800", 1800),
+        ("i5-8250U @ 1.60GHz", 1600),
+        ("desconocida", None),
+    ],
+)
+def test_parse_speed_mhz(raw, expected):
+    assert main.parse_speed_mhz(raw) == expected
+
+
+def test_normalize_spec_metrics_uses_free_text_fields():
+    metrics = main.normalize_spec_metrics(
+        {"ram_capacidad": "8GB", "disco_capacidad": "256 GB", "cpu_velocidad": "2.4GHz"}
+    )
+
+    assert metrics == {"ram_bytes": 8 * GB, "disco_bytes": 256 * GB, "cpu_mhz": 2400}
@@ -0,0 +1,65 @@
+import numpy as np
+
+from apps.api.app import main
+
+GB = 1024 ** 3
+
+
+def build_columns():
+    return {
+        "tipo": np.asarray(["PC", "PC", "LAPTOP", "IMPRESORA"], dtype=object),
+        "estado": np.asarray(["ACTIVO", "REPARACIÓN", "ACTIVO", "ACTIVO"], dtype=object),
+        "ubicacion": np.asarray(["Sede Norte", "Sede Norte", "Sede Sur", "Sin ubicación"], dtype=object),
+        "fecha_ingreso": np.asarray(["2024-01-01", "2018-06-01", "2023-01-01", "NaT"], dtype="datetime64[D]"),
+        "ram_bytes": np.asarray([8 * GB, 4 * GB, 16 * GB, np.nan]),
+        "disco_bytes": np.asarray([256 * GB, 500 * GB, 512 * GB, np.nan]),
+        "cpu_mhz": np.asarray([2400, 1800, 3000, np.nan]),
+    }
+
+
+def test_compute_fleet_analytics_groups_and_histograms():
+    result = main.compute_fleet_analytics(build_columns(), today=np.datetime64("2025-01-01"))
+
+    assert result["total"] == 4
+    assert result["por_tipo"] == {"IMPRESORA": 1, "LAPTOP": 1, "PC": 2}
+    assert result["por_tipo_estado"]["PC"] == {"ACTIVO": 1, "REPARACIÓN": 1}
+    assert result["por_ubicacion"]["Sede Norte"] == 2
+    assert result["antiguedad"]["sin_fecha"] == 1
+    assert result["antiguedad"]["histograma_anios"]["0-1"] == 0
+    assert result["antiguedad"]["histograma_anios"]["1-2"] == 1
+    assert result["antiguedad"]["histograma_anios"]["2-3"] == 1
+    assert result["antiguedad"]["histograma_anios"]["5-7"] == 1
+    assert result["specs"]["ram_niveles"] == {
+        "<4GB": 0,
+        "4-8GB": 1,
+        "8-16GB": 1,
+        "16-32GB": 1,
+        ">=32GB": 0,
+    }
+    assert result["specs"]["ram_percentiles_gb"]["p50"] == 8.0
+    assert result["specs"]["ram_sin_dato"] == 1
+
+
+def test_compute_fleet_analytics_handles_empty_scope():
+    empty = {
+        key: np.asarray([], dtype=value.dtype) for key, value in build_columns().items()
+    }
+
+    result = main.compute_fleet_analytics(empty)
+
+    assert result["total"] == 0
+    assert result["por_tipo"] == {}
+    assert result["specs"]["ram_percentiles_gb"] is None
+
+
+def test_org_scoped_cache_invalidation_drops_global_entry():
+    cache = main.OrgScopedCache(ttl_seconds=60)
+    cache.set("org-1", {"total": 1})
+    cache.set("org-2", {"total": 2})
+    cache.set(None, {"total": 3})
+
+    cache.invalidate("org-1")
+
+    assert cache.get("org-1") is None
+    assert cache.get(None) is None
+    assert cache.get("org-2") == {"total": 2}
@@ -0,0 +1,188 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from apps.api.app import main
+
+
+class PagedDevicesTable:
+    """Simula el keyset paging de Supabase sobre una lista ordenada por id."""
+
+    def __init__(self, rows):
+        self._rows = sorted(rows, key=lambda row: row["id"])
+        self._filters = []
+        self._limit = None
+        self.pages_served = 0
+
+    def select(self, *_args, **_kwargs):
+        self._filters = []
+        return self
+
+    def eq(self, column, value):
+        self._filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def gt(self, column, value):
+        self._filters.append(lambda row: row[column] > value)
+        return self
+
+    def order(self, *_args, **_kwargs):
+        return self
+
+    def limit(self, value):
+        self._limit = value
+        return self
+
+    def execute(self):
+        matches = [row for row in self._rows if all(check(row) for check in self._filters)]
+        self.pages_served += 1
+        return SimpleNamespace(data=matches[: self._limit])
+
+
+def test_search_devices_scopes_to_org_unit(recording_supabase, as_user):
+    rows = [{"id": "dev-1", "serial": "ABC123", "rank": 2.0}]
+    fake = recording_supabase(rows)
+
+    response = as_user().get("/inventory/devices/search", params={"q": " ABC123 "})
+
+    assert response.status_code == 200
+    assert response.json() == {"data": rows, "count": 1}
+    assert fake.called("search_devices") == [
+        ("rpc", "search_devices", ({"p_query": "ABC123", "p_org_unit_id": "org-1", "p_limit": 20},), {})
+    ]
+
+
+def test_search_devices_is_global_for_lider_ti(recording_supabase, as_user):
+    fake = recording_supabase([])
+
+    response = as_user(rol="LIDER_TI").get("/inventory/devices/search", params={"q": "lenovo", "limit": 5})
+
+    assert response.status_code == 200
+    params = fake.called("search_devices")[0][2][0]
+    assert params["p_org_unit_id"] is None
+    assert params["p_limit"] == 5
+
+
+def test_search_devices_without_org_unit_returns_empty(recording_supabase, as_user):
+    fake = recording_supabase([{"id": "dev-1"}])
+
+    response = as_user(org_unit_id=None).get("/inventory/devices/search", params={"q": "lenovo"})
+
+    assert response.json() == {"data": [], "count": 0}
+    assert fake.calls == []
+
+
+def test_create_device_stores_blank_serial_as_null(recording_supabase, as_user):
+    fake = recording_supabase({"devices": [{"id": "dev-1", "org_unit_id": "org-1", "estado": "ACTIVO"}]})
+
+    response = as_user().post(
+        "/inventory/devices",
+        json={"nombre": "PC 1", "tipo": "PC", "estado": "ACTIVO", "ubicacion": "Sede Norte", "serial": "   "},
+    )
+
+    assert response.status_code == 201
+    inserted = [call[2][0] for call in fake.called("insert") if call[0] == "devices"]
+    assert inserted[0]["serial"] is None
+
+
+class UniqueViolation(Exception):
+    code = main.UNIQUE_VIOLATION_CODE
+
+
+class RaisingQuery:
+    def __init__(self, error):
+        self.error = error
+
+    def execute(self):
+        raise self.error
+
+
+def test_execute_device_write_maps_duplicate_serial_to_conflict():
+    with pytest.raises(HTTPException) as exc:
+        main.execute_device_write(RaisingQuery(UniqueViolation("duplicate key")), "ABC123")
+
+    assert exc.value.status_code == 409
+    assert "ABC123" in exc.value.detail
+
+    with pytest.raises(RuntimeError):
+        main.execute_device_write(RaisingQuery(RuntimeError("timeout")), "ABC123")
+
+
+def test_export_devices_csv_pages_through_inventory(monkeypatch, as_user):
+    rows = [
+        {
+            "id": f"dev-{index}",
+            "nombre": f"PC {index}",
+            "tipo": "PC",
+            "estado": "ACTIVO",
+            "org_unit_id": "org-1",
+            "ubicacion": "Sede Norte",
+            "device_specs": [{"ram_capacidad": "8GB"}],
+        }
+        for index in range(5)
+    ]
+    rows.append({"id": "dev-x", "nombre": "Otra sede", "org_unit_id": "org-2"})
+    table = PagedDevicesTable(rows)
+    monkeypatch.setattr(main, "supabase", SimpleNamespace(table=lambda _name: table))
+    monkeypatch.setattr(main, "EXPORT_PAGE_SIZE", 2)
+
+    response = as_user().get("/inventory/devices/export")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    lines = response.content.decode("utf-8-sig").splitlines()
+    assert lines[0].startswith("ID,Nombre,Tipo,Estado")
+    assert len(lines) == 6
+    assert "Otra sede" not in response.text
+    assert lines[1].split(",")[14] == "8GB"
+    assert table.pages_served == 3
+
+
+def test_normalize_location_builds_display_and_path():
+    display, path = main.normalize_location("  Sede Norte /Bloque  B > Sala 204 ")
+
+    assert display == "Sede Norte / Bloque B / Sala 204"
+    assert path == "sede-norte/bloque-b/sala-204/"
+
+
+def test_normalize_location_strips_accents_and_empty_segments():
+    assert main.normalize_location("Edificio Administración // Dirección") == (
+        "Edificio Administración / Dirección",
+        "edificio-administracion/direccion/",
+    )
+    assert main.normalize_location("  ") == (None, None)
+    assert main.normalize_location_prefix("Sede Norte / Bloque B") == "sede-norte/bloque-b/"
+
+
+def test_build_location_tree_merges_estados_and_org_units():
+    rows = [
+        {"path": "sede-norte/", "nombre": "Sede Norte", "estado": "ACTIVO", "total": 3},
+        {"path": "sede-norte/", "nombre": "Sede Norte", "estado": "REPARACIÓN", "total": 1},
+        {"path": "sede-norte/bloque-b/", "nombre": "Bloque B", "estado": "ACTIVO", "total": 2},
+        {"path": "sede-norte/bloque-b/", "nombre": "Bloque B", "estado": "ACTIVO", "total": 1},
+        {"path": "sede-sur/", "nombre": "Sede Sur", "estado": "RETIRADO", "total": 0},
+    ]
+
+    tree = main.build_location_tree(rows)
+
+    assert [node["path"] for node in tree] == ["sede-norte/", "sede-norte/bloque-b/"]
+    assert tree[0]["por_estado"] == {"ACTIVO": 3, "REPARACIÓN": 1}
+    assert tree[1] == {
+        "path": "sede-norte/bloque-b/",
+        "nombre": "Bloque B",
+        "depth": 2,
+        "total": 3,
+        "por_estado": {"ACTIVO": 3},
+    }
+
+
+def test_export_devices_keeps_format_query_parameter(monkeypatch, as_user):
+    table = PagedDevicesTable([])
+    monkeypatch.setattr(main, "supabase", SimpleNamespace(table=lambda _name: table))
+    monkeypatch.setattr(main, "xlsxwriter", None)
+
+    response = as_user().get("/inventory/devices/export", params={"format": "xlsx"})
+
+    assert response.status_code == 501
+    assert as_user().get("/inventory/devices/export", params={"format": "pdf"}).status_code == 422
@@ -0,0 +1,58 @@
+import random
+
+from apps.api.app import main
+
+
+def test_quantile_sketch_stays_within_relative_accuracy():
+    rng = random.Random(7)
+    values = sorted(rng.lognormvariate(4, 1.2) for _ in range(5000))
+    sketch = main.QuantileSketch()
+    for value in values:
+        sketch.add(value)
+
+    for q in (0.5, 0.9, 0.99):
+        exact = values[int(q * (len(values) - 1))]
+        assert abs(sketch.quantile(q) - exact) / exact <= 0.011
+
+
+def test_quantile_sketch_merge_matches_single_sketch():
+    left, right, combined = main.QuantileSketch(), main.QuantileSketch(), main.QuantileSketch()
+    for value in range(1, 101):
+        (left if value % 2 else right).add(value)
+        combined.add(value)
+
+    left.merge(right)
+
+    assert left.count == 100
+    assert left.quantile(0.9) == combined.quantile(0.9)
+    assert main.QuantileSketch().quantile(0.5) is None
+
+
+def ticket(ticket_id, org="org-1", prioridad="ALTA", respuesta=None, resolucion=None, day="2025-03-10"):
+    return {
+        "id": ticket_id,
+        "org_unit_id": org,
+        "prioridad": prioridad,
+        "fecha_creacion": f"{day}T08:00:00+00:00",
+        "fecha_asignacion": f"{day}T09:00:00+00:00" if respuesta is not None else None,
+        "fecha_resolucion": f"{day}T12:00:00+00:00" if resolucion is not None else None,
+        "tiempo_respuesta_minutos": respuesta,
+        "tiempo_resolucion_minutos": resolucion,
+    }
+
+
+def test_sla_store_is_incremental_and_scoped():
+    store = main.SlaMetricsStore()
+    store.rebuild(iter([ticket("t1", respuesta=10, resolucion=100), ticket("t2", org="org-2", respuesta=50)]))
+
+    store.observe(ticket("t3", respuesta=30, resolucion=200))
+    store.observe(ticket("t3", respuesta=30, resolucion=200))
+    store.observe(ticket("t4", resolucion=300, day="2025-01-01"))
+
+    result = store.query("org-1", "2025-03-01", "2025-03-31")
+
+    assert list(result) == ["ALTA"]
+    assert result["ALTA"]["respuesta"]["count"] == 2
+    assert result["ALTA"]["resolucion"]["count"] == 2
+    assert 99 <= result["ALTA"]["resolucion"]["p50"] <= 101
+    assert store.query(None, "2025-03-01", "2025-03-31")["ALTA"]["respuesta"]["count"] == 3
@@ -0,0 +1,392 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+from apps.api.app import main
+
+
+def test_list_tickets_uses_summary_projection_and_cursor(recording_supabase, as_user):
+    rows = [
+        {"id": f"t{index}", "fecha_creacion": f"2025-02-0{9 - index}T08:00:00+00:00"}
+        for index in range(3)
+    ]
+    fake = recording_supabase({"tickets": rows})
+
+    response = as_user().get(
+        "/tickets", params={"limit": 2, "prioridad": "ALTA", "asignado_a": "user-9"}
+    )
+
+    payload = response.json()
+    assert [item["id"] for item in payload["data"]] == ["t0", "t1"]
+    assert payload["next_cursor"] == main.encode_cursor("2025-02-08T08:00:00+00:00", "t1")
+
+    select = fake.called("select")[0][2][0]
+    assert select.startswith(main.TICKET_SUMMARY_COLUMNS)
+    assert "solicitante:users" in select
+    eq_filters = {call[2][0]: call[2][1] for call in fake.called("eq")}
+    assert eq_filters == {"org_unit_id": "org-1", "prioridad": "ALTA", "asignado_a": "user-9"}
+
+
+def test_list_tickets_for_requester_is_limited_to_own_tickets(recording_supabase, as_user):
+    fake = recording_supabase({"tickets": []})
+
+    response = as_user(rol="DOCENTE", user_id="user-7").get("/tickets", params={"detalle": "true"})
+
+    assert response.status_code == 200
+    assert fake.called("select")[0][2][0] == "*"
+    assert {call[2][0]: call[2][1] for call in fake.called("eq")} == {"solicitante_id": "user-7"}
+
+
+def test_get_ticket_returns_latest_comments_in_chronological_order(recording_supabase, as_user):
+    comments = [
+        {"id": f"c{index}", "fecha": f"2025-02-0{9 - index}T10:00:00+00:00"}
+        for index in range(3)
+    ]
+    recording_supabase(
+        {"tickets": [{"id": "t1", "solicitante_id": "user-1"}], "ticket_comments": comments}
+    )
+
+    response = as_user().get("/tickets/t1", params={"comments_limit": 2})
+
+    payload = response.json()
+    assert payload["ticket"]["id"] == "t1"
+    assert [item["id"] for item in payload["comments"]] == ["c1", "c0"]
+    assert payload["comments_next_cursor"] == main.encode_cursor("2025-02-08T10:00:00+00:00", "c1")
+    assert payload["comments_total"] == 3
+
+
+def test_get_ticket_denies_other_requesters_before_reading_comments(recording_supabase, as_user):
+    fake = recording_supabase({"tickets": [{"id": "t1", "solicitante_id": "otro"}]})
+
+    response = as_user(rol="DOCENTE").get("/tickets/t1")
+
+    assert response.status_code == 403
+    assert not [call for call in fake.calls if call[0] == "ticket_comments"]
+
+
+def test_get_ticket_not_found(recording_supabase, as_user):
+    recording_supabase({"tickets": []})
+
+    assert as_user().get("/tickets/nope").status_code == 404
+
+
+def make_profile(rol="TI", org_unit_id="org-1", user_id="user-1"):
+    return main.UserProfile(
+        id=user_id, nombre="Test", email="t@example.com", rol=rol, org_unit_id=org_unit_id
+    )
+
+
+def test_ticket_event_hub_fans_out_by_scope():
+    hub = main.TicketEventHub(buffer_size=10)
+    staff = hub.subscribe(make_profile())
+    other_org = hub.subscribe(make_profile(org_unit_id="org-2"))
+    requester = hub.subscribe(make_profile(rol="DOCENTE", user_id="user-7"))
+
+    hub.publish("ticket.created", {"id": "t1", "org_unit_id": "org-1", "solicitante_id": "user-7"}, {})
+
+    assert staff.queue.qsize() == 1
+    assert other_org.queue.qsize() == 0
+    assert requester.queue.get_nowait()["ticket_id"] == "t1"
+
+
+def test_ticket_event_hub_replays_after_last_event_id():
+    hub = main.TicketEventHub(buffer_size=2)
+    user = make_profile(rol="LIDER_TI")
+    events = [
+        hub.publish("ticket.updated", {"id": f"t{index}", "org_unit_id": "org-1"}, {})
+        for index in range(4)
+    ]
+
+    assert [event["ticket_id"] for event in hub.replay(events[2]["id"], user)] == ["t3"]
+    assert [event["ticket_id"] for event in hub.replay(events[1]["id"], user)] == ["t2", "t3"]
+    assert hub.replay(events[3]["id"], user) == []
+    # t1 ya salió del buffer: no se puede reconstruir desde t0
+    assert hub.replay(events[0]["id"], user) is None
+    assert hub.replay("otro-proceso:1", user) is None
+    assert hub.replay(None, user) == []
+
+
+def test_stream_ticket_is_single_use_and_not_a_session_token(recording_supabase, as_user):
+    recording_supabase({"users": [{"id": "user-1", "nombre": "Ana", "email": "ana@example.com", "rol": "TI"}]})
+
+    response = as_user().post("/tickets/events/ticket")
+
+    assert response.status_code == 200
+    ticket = response.json()["ticket"]
+    request = SimpleNamespace(headers={})
+    user = asyncio.run(main.get_stream_user(request, ticket=ticket))
+    assert user.id == "user-1"
+
+    with pytest.raises(HTTPException) as reused:
+        asyncio.run(main.get_stream_user(request, ticket=ticket))
+    assert reused.value.status_code == 401
+
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=ticket)
+    with pytest.raises(HTTPException) as as_session:
+        asyncio.run(main.get_current_user(credentials))
+    assert as_session.value.status_code == 401
+
+    with pytest.raises(HTTPException) as session_as_ticket:
+        asyncio.run(main.get_stream_user(request, ticket=main.create_access_token("user-1")))
+    assert session_as_ticket.value.status_code == 401
+
+
+def test_format_sse_includes_event_id_and_type():
+    hub = main.TicketEventHub(buffer_size=2)
+    event = hub.publish("comment.created", {"id": "t1"}, {"comentario": "hola"})
+
+    message = main.format_sse(event)
+
+    assert message.startswith(f"id: {event['id']}\nevent: comment.created\ndata: ")
+    assert message.endswith("\n\n")
+
+
+def test_search_tickets_applies_list_scope(recording_supabase, as_user):
+    fake = recording_supabase([{"id": "t1", "rank": 0.4}])
+
+    response = as_user(rol="DOCENTE", user_id="user-7").get(
+        "/tickets/search", params={"q": "  impresión   atascada "}
+    )
+
+    assert response.json() == {"data": [{"id": "t1", "rank": 0.4}], "count": 1}
+    assert fake.called("search_tickets")[0][2][0] == {
+        "p_query": "impresion atascada",
+        "p_org_unit_id": None,
+        "p_solicitante_id": "user-7",
+        "p_limit": 20,
+    }
+
+
+def test_search_tickets_for_staff_scopes_by_org_unit(recording_supabase, as_user):
+    fake = recording_supabase([])
+
+    as_user(rol="DIRECTOR").get("/tickets/search", params={"q": "wifi"})
+
+    params = fake.called("search_tickets")[0][2][0]
+    assert (params["p_org_unit_id"], params["p_solicitante_id"]) == ("org-1", None)
+
+
+def test_bulk_update_tickets_runs_one_update_and_one_audit(recording_supabase, as_user):
+    fake = recording_supabase(
+        {
+            "tickets": [
+                {"id": "t1", "org_unit_id": "org-1", "estado": "CERRADO"},
+                {"id": "t3", "org_unit_id": "org-1", "estado": "CERRADO"},
+            ]
+        }
+    )
+
+    response = as_user().post(
+        "/tickets/bulk-update",
+        json={"ticket_ids": ["t1", "t2", "t3", "t1"], "updates": {"estado": "CERRADO"}},
+    )
+
+    assert response.status_code == 200
+    payload = response.json()
+    assert [(item["ticket_id"], item["status"]) for item in payload["data"]] == [
+        ("t1", "updated"),
+        ("t2", "not_found"),
+        ("t3", "updated"),
+    ]
+    assert len([call for call in fake.called("update") if call[0] == "tickets"]) == 1
+    assert fake.called("in_")[0][2] == ("id", ["t1", "t2", "t3"])
+    audit_inserts = [call for call in fake.called("insert") if call[0] == "audit_chain"]
+    assert len(audit_inserts) == 1
+    assert audit_inserts[0][2][0]["metadata"]["ticket_ids"] == ["t1", "t3"]
+
+
+def test_bulk_update_tickets_requires_changes(recording_supabase, as_user):
+    recording_supabase({})
+
+    response = as_user().post("/tickets/bulk-update", json={"ticket_ids": ["t1"], "updates": {}})
+
+    assert response.status_code == 400
+
+
+def test_minhash_index_finds_near_duplicates_in_same_org():
+    index = main.TicketMinHashIndex()
+    base = {"titulo": "Impresora no imprime", "descripcion": "La impresora de la sala 204 no imprime desde ayer"}
+    index.index_ticket({"id": "t1", "org_unit_id": "org-1", **base})
+    index.index_ticket({"id": "t2", "org_unit_id": "org-2", **base})
+    index.index_ticket(
+        {"id": "t3", "org_unit_id": "org-1", "titulo": "Cambio de clave", "descripcion": "Olvidé mi contraseña del correo"}
+    )
+
+    signature = index.signature(
+        main.ticket_shingles("Impresora no imprime", "La impresora de la sala 204 no imprime desde hoy")
+    )
+    matches = index.query(signature, "org-1")
+
+    assert [ticket_id for ticket_id, _ in matches] == ["t1"]
+    assert matches[0][1] >= 0.5
+
+
+def test_minhash_index_drops_closed_tickets():
+    index = main.TicketMinHashIndex()
+    ticket = {"id": "t1", "org_unit_id": "org-1", "titulo": "Proyector", "descripcion": "El proyector no enciende"}
+    signature = index.index_ticket(ticket)
+    assert index.query(signature, "org-1") == [("t1", 1.0)]
+
+    index.index_ticket({**ticket, "estado": "CERRADO"})
+
+    assert index.query(signature, "org-1") == []
+    assert index.get_signature("t1") is None
+
+
+def test_minhash_signature_matches_exact_arithmetic():
+    index = main.TicketMinHashIndex(num_perm=8, bands=2)
+    shingles = {"impresora", "no imprime", "sala 204"}
+
+    prime = main.MINHASH_PRIME
+    a = [int(value) for value in index._a]
+    b = [int(value) for value in index._b]
+    expected = [
+        min((a[i] * (main.zlib.crc32(shingle.encode()) % prime) + b[i]) % prime for shingle in shingles)
+        for i in range(8)
+    ]
+
+    assert [int(value) for value in index.signature(shingles)] == expected
+
+
+def test_minhash_index_filters_by_requester():
+    index = main.TicketMinHashIndex()
+    base = {"org_unit_id": "org-1", "titulo": "Proyector", "descripcion": "El proyector no enciende"}
+    index.index_ticket({"id": "t1", "solicitante_id": "user-1", **base})
+    signature = index.index_ticket({"id": "t2", "solicitante_id": "user-2", **base})
+
+    assert index.query(signature, "org-1", exclude="t2", solicitante_id="user-2") == []
+    assert index.query(signature, "org-1", exclude="t2") == [("t1", 1.0)]
+
+
+def test_minhash_index_only_crosses_org_units_with_global_scope():
+    index = main.TicketMinHashIndex()
+    base = {"titulo": "Proyector", "descripcion": "El proyector no enciende"}
+    index.index_ticket({"id": "t1", "org_unit_id": "org-1", **base})
+    signature = index.index_ticket({"id": "t2", "org_unit_id": None, **base})
+
+    assert index.query(signature, None, exclude="t2") == []
+    assert index.query(signature, None, global_scope=True, exclude="t2") == [("t1", 1.0)]
+
+
+def test_minhash_index_ignores_stopword_only_tickets():
+    index = main.TicketMinHashIndex()
+    index.index_ticket({"id": "t1", "org_unit_id": "org-1", "titulo": "de la", "descripcion": "el y"})
+    signature = index.index_ticket({"id": "t2", "org_unit_id": "org-1", "titulo": "que", "descripcion": "de los"})
+
+    assert index.get_signature("t1") is None
+    assert index.query(signature, "org-1") == []
+
+
+def test_list_similar_tickets_hides_other_requesters(monkeypatch, recording_supabase, as_user):
+    index = main.TicketMinHashIndex()
+    base = {"org_unit_id": "org-1", "titulo": "Proyector", "descripcion": "El proyector no enciende"}
+    index.index_ticket({"id": "t1", "solicitante_id": "otro", **base})
+    index.loaded = True
+    monkeypatch.setattr(main, "ticket_duplicate_index", index)
+    fake = recording_supabase({"tickets": [{"id": "t2", "solicitante_id": "user-1", **base}]})
+
+    response = as_user(rol="DOCENTE").get("/tickets/t2/similar")
+
+    assert response.json() == {"data": [], "count": 0}
+    assert not [call for call in fake.called("in_") if call[0] == "tickets"]
+
+
+def test_create_ticket_survives_duplicate_detection_errors(monkeypatch, recording_supabase, as_user):
+    def broken(*_args, **_kwargs):
+        raise RuntimeError("índice caído")
+
+    monkeypatch.setattr(main, "ensure_duplicate_index_loaded", broken)
+    recording_supabase({"tickets": [{"id": "t9", "org_unit_id": "org-1", "estado": "ABIERTO"}]})
+
+    response = as_user(rol="DOCENTE").post(
+        "/tickets", json={"titulo": "Sin red", "descripcion": "No hay internet", "prioridad": "ALTA"}
+    )
+
+    assert response.status_code == 201
+    assert response.json()["posibles_duplicados"] == []
+
+
+def test_ticket_shingles_ignore_accents_and_stopwords():
+    assert main.ticket_shingles("Conexión", "de la red") == {"conexion", "red", "conexion red"}
+
+
+def test_assignment_scheduler_picks_least_loaded_and_releases_on_close():
+    scheduler = main.TicketAssignmentScheduler()
+    scheduler.set_staff("org-1", ["ana", "beto"])
+
+    scheduler.track({"id": "t1", "org_unit_id": "org-1", "asignado_a": "ana", "prioridad": "CRITICA"})
+    assert scheduler.pick("org-1") == "beto"
+
+    scheduler.track({"id": "t2", "org_unit_id": "org-1", "asignado_a": "beto", "prioridad": "BAJA"})
+    scheduler.track({"id": "t1", "org_unit_id": "org-1", "asignado_a": "ana", "prioridad": "CRITICA", "estado": "CERRADO"})
+
+    assert scheduler.pick("org-1") == "ana"
+    assert scheduler.workload("org-1") == [{"usuario_id": "ana", "carga": 0}, {"usuario_id": "beto", "carga": 1}]
+    assert scheduler.pick("org-2") is None
+
+
+def test_assignment_scheduler_plans_rebalance_of_open_tickets():
+    scheduler = main.TicketAssignmentScheduler()
+    scheduler.set_staff("org-1", ["ana", "beto"])
+    open_tickets = [
+        {"id": f"t{index}", "org_unit_id": "org-1", "asignado_a": "ana", "prioridad": "ALTA"}
+        for index in range(4)
+    ]
+    for ticket in open_tickets:
+        scheduler.track(ticket)
+
+    moves = scheduler.plan_rebalance("org-1", open_tickets)
+
+    assert len(moves) == 2
+    assert {move["hacia"] for move in moves} == {"beto"}
+    assert scheduler.workload("org-1")[0] == {"usuario_id": "beto", "carga": 0}
+
+
+def test_assignment_scheduler_roster_refresh_keeps_workload():
+    scheduler = main.TicketAssignmentScheduler()
+    scheduler.set_roster({"org-1": ["ana", "beto"], "org-2": ["caro"]})
+    scheduler.track({"id": "t1", "org_unit_id": "org-1", "asignado_a": "ana", "prioridad": "ALTA"})
+    assert not scheduler.roster_stale(60)
+
+    scheduler.set_roster({"org-1": ["ana", "dani"]})
+
+    assert scheduler.workload("org-1") == [{"usuario_id": "dani", "carga": 0}, {"usuario_id": "ana", "carga": 4}]
+    assert scheduler.pick("org-2") is None
+    scheduler.invalidate_roster()
+    assert scheduler.roster_stale(60)
+
+
+def test_create_ticket_does_not_auto_assign_by_default(monkeypatch, recording_supabase, as_user):
+    monkeypatch.setattr(main.ticket_duplicate_index, "loaded", True)
+    fake = recording_supabase({"tickets": [{"id": "t9", "org_unit_id": "org-1", "prioridad": "ALTA"}]})
+
+    response = as_user(rol="DOCENTE").post(
+        "/tickets", json={"titulo": "Sin red", "descripcion": "No hay internet", "prioridad": "ALTA"}
+    )
+
+    assert response.status_code == 201
+    assert "asignado_a" not in fake.called("insert")[0][2][0]
+    assert not [call for call in fake.calls if call[0] == "users"]
+
+
+def test_create_ticket_auto_assigns_least_loaded_staff(monkeypatch, recording_supabase, as_user):
+    scheduler = main.TicketAssignmentScheduler()
+    scheduler.set_roster({"org-1": ["ana"]})
+    scheduler.loaded = True
+    monkeypatch.setattr(main, "ticket_assignment_scheduler", scheduler)
+    monkeypatch.setattr(main, "TICKET_AUTO_ASSIGN", True)
+    monkeypatch.setattr(main.ticket_duplicate_index, "loaded", True)
+    fake = recording_supabase({"tickets": [{"id": "t9", "org_unit_id": "org-1", "asignado_a": "ana", "prioridad": "ALTA"}]})
+
+    response = as_user(rol="DOCENTE").post(
+        "/tickets", json={"titulo": "Sin red", "descripcion": "No hay internet", "prioridad": "ALTA"}
+    )
+
+    assert response.status_code == 201
+    inserted = fake.called("insert")[0][2][0]
+    assert inserted["asignado_a"] == "ana"
+    assert inserted["fecha_asignacion"] == inserted["fecha_creacion"]
+    assert scheduler.workload("org-1") == [{"usuario_id": "ana", "carga": 4}]
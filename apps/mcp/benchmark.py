@@ -0,0 +1,31 @@
+# apps/mcp/benchmark.py
+"""
+Benchmark offline del MCP Server con el backend simulado.
+
+Uso:
+    MCP_SIMULATED_LATENCY_MS=1500 MCP_MAX_CONCURRENCY=8 python benchmark.py 40
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+os.environ.setdefault("MCP_BACKEND", "simulated")
+
+import server  # noqa: E402
+
+
+async def run(total: int) -> None:
+    started = time.perf_counter()
+    await asyncio.gather(*(server.classify_ticket(f"Ticket de prueba {index}") for index in range(total)))
+    elapsed = time.perf_counter() - started
+
+    metrics = server.llm.snapshot()
+    print(f"{total} llamadas en {elapsed:.2f}s ({total / elapsed:.1f} llamadas/s)")
+    print(f"Concurrencia máxima: {metrics['max_concurrency']}")
+    print(metrics["tools"]["classify_ticket"])
+
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 40))
@@ -5,19 +5,49 @@ Proporciona herramientas de triage automático y resúmenes de tickets
 """
 
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
-from typing import List, Optional, Literal
-import openai
+from typing import Any, Callable, Dict, List, Optional, Literal
+from collections import OrderedDict, deque
+import asyncio
+import hashlib
+import logging
 import os
+import random
+import re
+import time
 from datetime import datetime
 import json
+try:
+    import openai  # type: ignore
+except ImportError:  # pragma: no cover - el backend simulado no necesita openai
+    openai = None  # type: ignore[assignment]
 
 # Configuración
+MCP_BACKEND = os.getenv("MCP_BACKEND", "openai")  # "openai" o "simulated" (benchmarks sin red)
+MCP_MODEL = os.getenv("MCP_MODEL", "gpt-4-turbo-preview")
+MCP_MAX_CONCURRENCY = int(os.getenv("MCP_MAX_CONCURRENCY", "8"))
+MCP_TIMEOUT_SECONDS = float(os.getenv("MCP_TIMEOUT_SECONDS", "60"))  # tope por llamada: espera en cola + intentos
+MCP_MAX_RETRIES = int(os.getenv("MCP_MAX_RETRIES", "2"))  # solo ante errores de conexión
+MCP_SIMULATED_LATENCY_MS = float(os.getenv("MCP_SIMULATED_LATENCY_MS", "1500"))
+MCP_LATENCY_WINDOW = 500
+MCP_BATCH_MAX_ITEMS = int(os.getenv("MCP_BATCH_MAX_ITEMS", "500"))
+MCP_BATCH_TOKEN_BUDGET = int(os.getenv("MCP_BATCH_TOKEN_BUDGET", "3000"))  # tokens de entrada por prompt
+MCP_BATCH_MAX_PER_PROMPT = int(os.getenv("MCP_BATCH_MAX_PER_PROMPT", "25"))  # acota el tamaño de la respuesta
+MCP_BATCH_MAX_CHARS = 1500  # descripciones más largas se recortan
+MCP_CACHE_MAX_ENTRIES = int(os.getenv("MCP_CACHE_MAX_ENTRIES", "1000"))
+MCP_CACHE_TTL_SECONDS = float(os.getenv("MCP_CACHE_TTL_SECONDS", str(24 * 3600)))
+MCP_CACHE_DIR = os.getenv("MCP_CACHE_DIR")  # opcional: persiste el caché entre reinicios
+MCP_PRICE_INPUT_PER_1K = float(os.getenv("MCP_PRICE_INPUT_PER_1K", "0.01"))
+MCP_PRICE_OUTPUT_PER_1K = float(os.getenv("MCP_PRICE_OUTPUT_PER_1K", "0.03"))
+
+logger = logging.getLogger("gemelli.mcp")
+
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
+if MCP_BACKEND == "openai" and not OPENAI_API_KEY:
     raise ValueError("OPENAI_API_KEY no configurada")
-
-openai.api_key = OPENAI_API_KEY
+if MCP_BACKEND == "openai" and openai is None:
+    raise ValueError("El paquete openai no está instalado")
 
 app = FastAPI(
     title="Gemelli IT MCP Server",
@@ -25,6 +55,411 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# ==================== LLM BACKEND ====================
+
+# Errores que cuentan como "el modelo no respondió a tiempo" (504)
+TIMEOUT_ERRORS = (asyncio.TimeoutError,) + ((openai.APITimeoutError,) if openai is not None else ())
+
+
+class OpenAIBackend:
+    """Cliente asíncrono de OpenAI: no bloquea el event loop mientras espera la respuesta.
+
+    Cada intento dispone de todo el MCP_TIMEOUT_SECONDS (el gateway corta la
+    llamada completa en ese mismo plazo). Solo se reintenta cuando falla la
+    conexión, que falla rápido: un modelo lento no se vuelve a pedir."""
+
+    def __init__(self) -> None:
+        self._client = openai.AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            timeout=MCP_TIMEOUT_SECONDS,
+            max_retries=0,
+        )
+
+    async def complete(self, tool: str, messages: List[dict], temperature: float) -> tuple[str, Dict[str, int]]:
+        for attempt in range(MCP_MAX_RETRIES + 1):
+            try:
+                response = await self._client.chat.completions.create(
+                    model=MCP_MODEL,
+                    messages=messages,
+                    temperature=temperature,
+                    response_format={"type": "json_object"},
+                )
+                break
+            except openai.APIConnectionError as exc:
+                # APITimeoutError hereda de APIConnectionError: un timeout no se reintenta
+                if isinstance(exc, openai.APITimeoutError) or attempt == MCP_MAX_RETRIES:
+                    raise
+                await asyncio.sleep(0.5 * 2 ** attempt)
+        usage = response.usage
+        tokens = {
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        }
+        return response.choices[0].message.content, tokens
+
+
+class SimulatedBackend:
+    """Backend de pruebas: simula la latencia del modelo y devuelve JSON fijo por herramienta."""
+
+    RESPONSES: Dict[str, Dict[str, Any]] = {
+        "summarize_and_triage": {
+            "resumen": "Respuesta simulada",
+            "causa_probable": "Simulación",
+            "pasos_siguientes": ["Revisar el equipo"],
+            "prioridad_sugerida": "MEDIA",
+            "requiere_escalamiento": False,
+            "tiempo_estimado_minutos": 30,
+            "categoria": "OTRO",
+        },
+        "suggest_solution": {"diagnostico": "Simulación", "pasos": [], "prevencion": "", "recursos": []},
+        "classify_ticket": {
+            "categoria_principal": "OTRO",
+            "categorias_secundarias": [],
+            "nivel_urgencia": "MEDIO",
+            "requiere_presencial": False,
+        },
+        "generate_report": {"resumen_ejecutivo": "Reporte simulado"},
+    }
+
+    def __init__(self, latency_ms: float) -> None:
+        self.latency_ms = latency_ms
+
+    async def complete(self, tool: str, messages: List[dict], temperature: float) -> tuple[str, Dict[str, int]]:
+        jitter = random.uniform(0.8, 1.2)
+        await asyncio.sleep(self.latency_ms * jitter / 1000)
+        if tool == "classify_tickets_batch":
+            ids = re.findall(r'"id": "(\d+)"', messages[-1]["content"])
+            content = json.dumps({
+                "clasificaciones": [{"id": item_id, **self.RESPONSES["classify_ticket"]} for item_id in ids]
+            })
+        else:
+            content = json.dumps(self.RESPONSES.get(tool, {}))
+        # ~4 caracteres por token, suficiente para estimar costos en benchmarks
+        prompt_tokens = sum(len(message["content"]) for message in messages) // 4
+        return content, {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4}
+
+
+class CallMetrics:
+    """Latencias recientes y contadores por herramienta."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.latencies_ms: deque = deque(maxlen=MCP_LATENCY_WINDOW)
+        self.queue_ms: deque = deque(maxlen=MCP_LATENCY_WINDOW)
+
+    def snapshot(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies_ms)
+
+        def percentile(q: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 1)
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "latency_ms_p50": percentile(0.50),
+            "latency_ms_p95": percentile(0.95),
+            "queue_ms_avg": round(sum(self.queue_ms) / len(self.queue_ms), 1) if self.queue_ms else None,
+        }
+
+
+def completion_cost(usage: Dict[str, int]) -> float:
+    return (
+        usage.get("prompt_tokens", 0) / 1000 * MCP_PRICE_INPUT_PER_1K
+        + usage.get("completion_tokens", 0) / 1000 * MCP_PRICE_OUTPUT_PER_1K
+    )
+
+
+class ResponseCache:
+    """Caché direccionado por contenido: la clave es el hash de (herramienta,
+    modelo, prompts, temperatura). LRU + TTL en memoria y, si se configura
+    ``directory``, un archivo JSON por clave que sobrevive reinicios. El disco
+    se lee y escribe fuera del event loop y se poda con el mismo TTL y tope."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float, directory: Optional[str] = None) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.directory = directory
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._writes_since_prune = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.latency_ms_saved = 0.0
+        self.tokens_saved = 0
+        self.cost_usd_saved = 0.0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self.prune_disk()
+
+    @staticmethod
+    def key(tool: str, model: str, system: str, prompt: str, temperature: float) -> str:
+        raw = json.dumps([tool, model, system, prompt, temperature], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _fresh(self, entry: Dict[str, Any]) -> bool:
+        return time.time() - entry["stored_at"] <= self.ttl_seconds
+
+    def _load_from_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(key), encoding="utf-8") as handle:
+                entry = json.load(handle)
+        except (FileNotFoundError, ValueError):
+            return None
+        if not self._fresh(entry):
+            self._remove_from_disk(key)
+            return None
+        return entry
+
+    def _remove_from_disk(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _write_to_disk(self, key: str, entry: Dict[str, Any]) -> None:
+        tmp_path = f"{self._path(key)}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            json.dump(entry, handle, ensure_ascii=False)
+        os.replace(tmp_path, self._path(key))
+        # Podar el directorio cada ~10% del tope de escrituras
+        self._writes_since_prune += 1
+        if self._writes_since_prune >= max(1, self.max_entries // 10):
+            self.prune_disk()
+
+    def prune_disk(self) -> int:
+        """Borra los archivos vencidos y, si sobran, los más antiguos hasta ``max_entries``."""
+        self._writes_since_prune = 0
+        now = time.time()
+        files = []
+        removed = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                modified = os.path.getmtime(path)
+            except FileNotFoundError:
+                continue
+            # .tmp huérfanos de escrituras interrumpidas y entradas vencidas
+            if not name.endswith(".json") or now - modified > self.ttl_seconds:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+                continue
+            files.append((modified, path))
+
+        files.sort()
+        for _, path in files[:max(0, len(files) - self.max_entries)]:
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is not None and not self._fresh(entry):
+            del self._entries[key]
+            if self.directory:
+                await asyncio.to_thread(self._remove_from_disk, key)
+            entry = None
+        if entry is None and self.directory:
+            entry = await asyncio.to_thread(self._load_from_disk, key)
+            if entry is not None:
+                self.disk_hits += 1
+                self._remember(key, entry)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self.latency_ms_saved += entry["latency_ms"]
+        self.tokens_saved += sum(entry["usage"].values())
+        self.cost_usd_saved += completion_cost(entry["usage"])
+        return entry["value"]
+
+    def _remember(self, key: str, entry: Dict[str, Any]) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def discard(self, key: str) -> None:
+        self._entries.pop(key, None)
+        if self.directory:
+            await asyncio.to_thread(self._remove_from_disk, key)
+
+    async def set(self, key: str, value: dict, latency_ms: float, usage: Dict[str, int]) -> None:
+        entry = {"stored_at": time.time(), "value": value, "latency_ms": latency_ms, "usage": usage}
+        self._remember(key, entry)
+        if self.directory:
+            await asyncio.to_thread(self._write_to_disk, key, entry)
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "disk": bool(self.directory),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "latency_ms_saved": round(self.latency_ms_saved, 1),
+            "tokens_saved": self.tokens_saved,
+            "cost_usd_saved": round(self.cost_usd_saved, 4),
+        }
+
+
+class LLMGateway:
+    """Limita las llamadas concurrentes al modelo, aplica timeout y mide latencias."""
+
+    def __init__(
+        self,
+        backend,
+        max_concurrency: int,
+        timeout_seconds: float,
+        cache: Optional[ResponseCache] = None,
+    ) -> None:
+        self.backend = backend
+        self.cache = cache
+        self._pending: Dict[str, asyncio.Future] = {}
+        self.coalesced = 0
+        self.timeout_seconds = timeout_seconds
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.metrics: Dict[str, CallMetrics] = {}
+
+    async def complete_json(
+        self,
+        tool: str,
+        system: str,
+        prompt: str,
+        temperature: float,
+        parse: Optional[Callable[[dict], Any]] = None,
+    ) -> Any:
+        """Respuesta JSON del modelo; las llamadas idénticas se sirven del caché
+        y las idénticas concurrentes comparten una sola completion.
+
+        ``parse`` valida la respuesta y devuelve el valor de la herramienta: si
+        falla, la respuesta no se guarda en el caché ni se comparte."""
+        parse = parse or (lambda value: value)
+        if self.cache is None:
+            value, _, _ = await self._call(tool, system, prompt, temperature)
+            return parse(value)
+
+        key = self.cache.key(tool, MCP_MODEL, system, prompt, temperature)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            try:
+                return parse(cached)
+            except Exception:
+                # Entrada guardada antes de que la herramienta validara: se descarta
+                await self.cache.discard(key)
+        # Se consulta después del caché: otra solicitud pudo empezar mientras se leía el disco
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return parse(await asyncio.shield(pending))
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            value, latency_ms, usage = await self._call(tool, system, prompt, temperature)
+            result = parse(value)
+            future.set_result(value)
+            try:
+                await self.cache.set(key, value, latency_ms, usage)
+            except OSError:
+                logger.warning("No se pudo guardar la respuesta en el caché en disco", exc_info=True)
+            return result
+        except Exception as exc:
+            if not future.done():
+                future.set_exception(exc)
+            raise
+        finally:
+            self._pending.pop(key, None)
+            if not future.done():
+                # Cancelada la solicitud que llamaba al modelo: las que esperaban no deben colgarse
+                future.set_exception(HTTPException(status_code=503, detail="La consulta al modelo fue cancelada"))
+            if future.done() and not future.cancelled():
+                future.exception()  # evita el aviso de excepción no recuperada si nadie más espera
+
+    async def _call(self, tool: str, system: str, prompt: str, temperature: float) -> tuple[dict, float, Dict[str, int]]:
+        """Un solo plazo cubre la espera por un cupo del semáforo y la llamada al modelo."""
+        metrics = self.metrics.setdefault(tool, CallMetrics())
+        try:
+            content, latency_ms, usage = await asyncio.wait_for(
+                self._call_with_slot(tool, metrics, system, prompt, temperature),
+                timeout=self.timeout_seconds,
+            )
+        except TIMEOUT_ERRORS:
+            metrics.timeouts += 1
+            raise HTTPException(status_code=504, detail="El modelo no respondió a tiempo")
+        return json.loads(content), latency_ms, usage
+
+    async def _call_with_slot(
+        self, tool: str, metrics: CallMetrics, system: str, prompt: str, temperature: float
+    ) -> tuple[str, float, Dict[str, int]]:
+        queued_at = time.perf_counter()
+        async with self._semaphore:
+            started = time.perf_counter()
+            metrics.queue_ms.append((started - queued_at) * 1000)
+            metrics.calls += 1
+            self.in_flight += 1
+            try:
+                content, usage = await self.backend.complete(
+                    tool,
+                    [{"role": "system", "content": system}, {"role": "user", "content": prompt}],
+                    temperature,
+                )
+            except TIMEOUT_ERRORS:
+                raise  # _call lo cuenta como timeout
+            except Exception:
+                metrics.errors += 1
+                raise
+            finally:
+                self.in_flight -= 1
+                latency_ms = (time.perf_counter() - started) * 1000
+                metrics.latencies_ms.append(latency_ms)
+        return content, latency_ms, usage
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "backend": MCP_BACKEND,
+            "model": MCP_MODEL,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "tools": {tool: metrics.snapshot() for tool, metrics in self.metrics.items()},
+            "cache": {**self.cache.snapshot(), "coalesced": self.coalesced} if self.cache else None,
+        }
+
+
+def build_backend():
+    if MCP_BACKEND == "simulated":
+        return SimulatedBackend(MCP_SIMULATED_LATENCY_MS)
+    return OpenAIBackend()
+
+
+llm = LLMGateway(
+    build_backend(),
+    MCP_MAX_CONCURRENCY,
+    MCP_TIMEOUT_SECONDS,
+    cache=ResponseCache(MCP_CACHE_MAX_ENTRIES, MCP_CACHE_TTL_SECONDS, MCP_CACHE_DIR) if MCP_CACHE_MAX_ENTRIES > 0 else None,
+)
+
 # ==================== MODELS ====================
 
 class TicketMessage(BaseModel):
@@ -58,6 +493,10 @@ class KnowledgeBaseQuery(BaseModel):
     problema: str
     contexto: Optional[str] = None
 
+class BatchClassifyRequest(BaseModel):
+    """Descripciones de tickets a clasificar en lote"""
+    descripciones: List[str] = Field(min_length=1, max_length=MCP_BATCH_MAX_ITEMS)
+
 # ==================== MCP TOOLS ====================
 
 @app.post("/tools/summarize_and_triage", response_model=TriageResult)
@@ -72,38 +511,19 @@ async def summarize_and_triage(thread: TicketThread) -> TriageResult:
         # Construir prompt con el contexto completo
         prompt = _build_triage_prompt(thread)
         
-        # Llamar a OpenAI
-        response = openai.chat.completions.create(
-            model="gpt-4-turbo-preview",
-            messages=[
-                {
-                    "role": "system",
-                    "content": """Eres un experto en soporte técnico TI para instituciones educativas.
+        # Llamar al modelo
+        return await llm.complete_json(
+            "summarize_and_triage",
+            """Eres un experto en soporte técnico TI para instituciones educativas.
                     Analiza tickets de helpdesk y proporciona análisis estructurados.
-                    Responde SIEMPRE en formato JSON válido con las claves exactas solicitadas."""
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
+                    Responde SIEMPRE en formato JSON válido con las claves exactas solicitadas.""",
+            prompt,
             temperature=0.3,
-            response_format={"type": "json_object"}
-        )
-        
-        # Parsear respuesta
-        result = json.loads(response.choices[0].message.content)
-        
-        return TriageResult(
-            resumen=result.get("resumen", "Sin resumen disponible"),
-            causa_probable=result.get("causa_probable", "Causa desconocida"),
-            pasos_siguientes=result.get("pasos_siguientes", ["Investigar más a fondo"]),
-            prioridad_sugerida=result.get("prioridad_sugerida", "MEDIA"),
-            requiere_escalamiento=result.get("requiere_escalamiento", False),
-            tiempo_estimado_minutos=result.get("tiempo_estimado_minutos"),
-            categoria=result.get("categoria", "General")
+            parse=_parse_triage_result,
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -132,25 +552,16 @@ async def suggest_solution(query: KnowledgeBaseQuery) -> dict:
         Responde en formato JSON con claves: diagnostico, pasos, prevencion, recursos
         """
         
-        response = openai.chat.completions.create(
-            model="gpt-4-turbo-preview",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Eres un experto técnico en TI educativa. Proporciona soluciones prácticas y probadas."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
+        result = await llm.complete_json(
+            "suggest_solution",
+            "Eres un experto técnico en TI educativa. Proporciona soluciones prácticas y probadas.",
+            prompt,
             temperature=0.4,
-            response_format={"type": "json_object"}
         )
-        
-        result = json.loads(response.choices[0].message.content)
         return result
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -183,18 +594,15 @@ async def classify_ticket(descripcion: str) -> dict:
         - requiere_presencial: boolean
         """
         
-        response = openai.chat.completions.create(
-            model="gpt-4-turbo-preview",
-            messages=[
-                {"role": "system", "content": "Eres un clasificador experto de tickets de soporte TI."},
-                {"role": "user", "content": prompt}
-            ],
+        return await llm.complete_json(
+            "classify_ticket",
+            "Eres un clasificador experto de tickets de soporte TI.",
+            prompt,
             temperature=0.2,
-            response_format={"type": "json_object"}
         )
         
-        return json.loads(response.choices[0].message.content)
-        
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -222,29 +630,152 @@ async def generate_report(tickets_data: dict) -> dict:
         Responde en formato JSON estructurado.
         """
         
-        response = openai.chat.completions.create(
-            model="gpt-4-turbo-preview",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Eres un analista de datos de TI. Genera reportes concisos y accionables."
-                },
-                {"role": "user", "content": prompt}
-            ],
+        return await llm.complete_json(
+            "generate_report",
+            "Eres un analista de datos de TI. Genera reportes concisos y accionables.",
+            prompt,
             temperature=0.3,
-            response_format={"type": "json_object"}
         )
         
-        return json.loads(response.choices[0].message.content)
-        
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error al generar reporte: {str(e)}"
         )
 
+@app.post("/tools/classify_tickets_batch")
+async def classify_tickets_batch(request: BatchClassifyRequest) -> dict:
+    """
+    Clasifica muchos tickets agrupándolos en pocos prompts dentro de un
+    presupuesto de tokens; los grupos se procesan en paralelo y el resultado
+    conserva el orden de entrada
+    """
+    descripciones = [descripcion[:MCP_BATCH_MAX_CHARS] for descripcion in request.descripciones]
+    truncados = {
+        index for index, descripcion in enumerate(request.descripciones) if len(descripcion) > MCP_BATCH_MAX_CHARS
+    }
+    chunks = _pack_batch(descripciones)
+
+    async def run_chunk(chunk: List[int]) -> Dict[int, dict]:
+        result = await llm.complete_json(
+            "classify_tickets_batch",
+            "Eres un clasificador experto de tickets de soporte TI.",
+            _build_batch_classify_prompt([(index, descripciones[index]) for index in chunk]),
+            temperature=0.2,
+        )
+        by_index: Dict[int, dict] = {}
+        for item in result.get("clasificaciones", []):
+            if not isinstance(item, dict):
+                continue
+            item = dict(item)  # el resultado puede venir del caché: no modificarlo
+            try:
+                index = int(item.pop("id"))
+            except (KeyError, TypeError, ValueError):
+                continue
+            if index in chunk:
+                by_index[index] = item
+        return by_index
+
+    chunk_results = await asyncio.gather(*(run_chunk(chunk) for chunk in chunks), return_exceptions=True)
+
+    classified: Dict[int, dict] = {}
+    failed: Dict[int, str] = {}
+    for chunk, outcome in zip(chunks, chunk_results):
+        if isinstance(outcome, Exception):
+            detail = outcome.detail if isinstance(outcome, HTTPException) else str(outcome)
+            failed.update({index: detail for index in chunk})
+        else:
+            classified.update(outcome)
+
+    # Si el modelo omitió algún ticket de un grupo, se clasifica individualmente
+    missing = [index for index in range(len(descripciones)) if index not in classified and index not in failed]
+    fallback = await asyncio.gather(
+        *(classify_ticket(descripciones[index]) for index in missing), return_exceptions=True
+    )
+    for index, outcome in zip(missing, fallback):
+        if isinstance(outcome, Exception):
+            failed[index] = outcome.detail if isinstance(outcome, HTTPException) else str(outcome)
+        else:
+            classified[index] = outcome
+
+    data = [
+        {"index": index, **classified[index]} if index in classified else {"index": index, "error": failed[index]}
+        for index in range(len(descripciones))
+    ]
+    # Se clasificó solo el inicio de la descripción: el consumidor debe saberlo
+    for index in truncados:
+        data[index]["truncado"] = True
+    return {
+        "data": data,
+        "count": len(data),
+        "prompts": len(chunks),
+        "individuales": len(missing),
+        "errores": len(failed),
+        "truncados": len(truncados),
+    }
+
 # ==================== HELPER FUNCTIONS ====================
 
+def _parse_triage_result(result: dict) -> TriageResult:
+    """Valida la respuesta del modelo (p. ej. una prioridad fuera de BAJA..CRITICA)"""
+    return TriageResult(
+        resumen=result.get("resumen", "Sin resumen disponible"),
+        causa_probable=result.get("causa_probable", "Causa desconocida"),
+        pasos_siguientes=result.get("pasos_siguientes", ["Investigar más a fondo"]),
+        prioridad_sugerida=result.get("prioridad_sugerida", "MEDIA"),
+        requiere_escalamiento=result.get("requiere_escalamiento", False),
+        tiempo_estimado_minutos=result.get("tiempo_estimado_minutos"),
+        categoria=result.get("categoria", "General")
+    )
+
+def _estimate_tokens(text: str) -> int:
+    """Estimación conservadora (~4 caracteres por token) sin depender de un tokenizador"""
+    return len(text) // 4 + 1
+
+
+def _pack_batch(descripciones: List[str]) -> List[List[int]]:
+    """Agrupa índices consecutivos sin exceder el presupuesto de tokens ni el máximo por prompt"""
+    budget = MCP_BATCH_TOKEN_BUDGET - _estimate_tokens(_build_batch_classify_prompt([]))
+    chunks: List[List[int]] = []
+    current: List[int] = []
+    used = 0
+    for index, descripcion in enumerate(descripciones):
+        cost = _estimate_tokens(descripcion) + 10  # id y separadores JSON
+        if current and (used + cost > budget or len(current) >= MCP_BATCH_MAX_PER_PROMPT):
+            chunks.append(current)
+            current, used = [], 0
+        current.append(index)
+        used += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _build_batch_classify_prompt(items: List[tuple]) -> str:
+    """Prompt estructurado con varios tickets identificados por su índice"""
+    tickets = json.dumps(
+        [{"id": str(index), "ticket": descripcion} for index, descripcion in items],
+        ensure_ascii=False,
+        indent=0,
+    )
+    return f"""
+    Clasifica cada uno de los siguientes tickets de forma independiente:
+
+    {tickets}
+
+    Categorías disponibles: HARDWARE, SOFTWARE, RED, ACCESO, IMPRESORA, OTRO
+
+    Responde en JSON con la clave "clasificaciones": una lista con un objeto por ticket con:
+    - id: el mismo id del ticket
+    - categoria_principal: la categoría más relevante
+    - categorias_secundarias: lista de otras categorías relevantes
+    - nivel_urgencia: BAJO, MEDIO, ALTO, CRITICO
+    - requiere_presencial: boolean
+    """
+
+
 def _build_triage_prompt(thread: TicketThread) -> str:
     """Construye el prompt para el análisis de triage"""
     
@@ -306,6 +837,7 @@ async def root():
             "summarize_and_triage",
             "suggest_solution",
             "classify_ticket",
+            "classify_tickets_batch",
             "generate_report"
         ]
     }
@@ -315,7 +847,8 @@ async def health():
     return {
         "status": "healthy",
         "timestamp": datetime.utcnow().isoformat(),
-        "openai_configured": bool(OPENAI_API_KEY)
+        "openai_configured": bool(OPENAI_API_KEY),
+        "llm": llm.snapshot()
     }
 
 @app.get("/tools")
@@ -341,6 +874,12 @@ async def list_tools():
                 "input": "str (descripcion)",
                 "output": "dict"
             },
+            {
+                "name": "classify_tickets_batch",
+                "description": "Clasifica muchos tickets en pocos prompts, conservando el orden",
+                "input": "BatchClassifyRequest",
+                "output": "dict"
+            },
             {
                 "name": "generate_report",
                 "description": "Genera reportes analíticos de múltiples tickets",
@@ -354,20 +893,26 @@ async def list_tools():
 
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
-    return {
-        "error": exc.detail,
-        "status_code": exc.status_code,
-        "timestamp": datetime.utcnow().isoformat()
-    }
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={
+            "error": exc.detail,
+            "status_code": exc.status_code,
+            "timestamp": datetime.utcnow().isoformat()
+        },
+    )
 
 @app.exception_handler(Exception)
 async def general_exception_handler(request, exc):
-    return {
-        "error": "Error interno del servidor",
-        "detail": str(exc),
-        "status_code": 500,
-        "timestamp": datetime.utcnow().isoformat()
-    }
+    return JSONResponse(
+        status_code=500,
+        content={
+            "error": "Error interno del servidor",
+            "detail": str(exc),
+            "status_code": 500,
+            "timestamp": datetime.utcnow().isoformat()
+        },
+    )
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,48 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+os.environ["MCP_BACKEND"] = "simulated"
+os.environ.setdefault("MCP_SIMULATED_LATENCY_MS", "1")
+os.environ.pop("MCP_CACHE_DIR", None)
+
+MCP_DIR = Path(__file__).resolve().parents[1]
+if str(MCP_DIR) not in sys.path:
+    sys.path.insert(0, str(MCP_DIR))
+
+
+class ScriptedBackend:
+    """Backend falso: devuelve el JSON de ``respond(tool, prompt)`` tras ``delay`` segundos."""
+
+    def __init__(self, respond, delay=0.0):
+        self.respond = respond
+        self.delay = delay
+        self.prompts = []
+
+    async def complete(self, tool, messages, temperature):
+        import asyncio
+        import json
+
+        prompt = messages[-1]["content"]
+        self.prompts.append(prompt)
+        await asyncio.sleep(self.delay)
+        return json.dumps(self.respond(tool, prompt)), {"prompt_tokens": 10, "completion_tokens": 5}
+
+
+@pytest.fixture
+def scripted_backend():
+    return ScriptedBackend
+
+
+@pytest.fixture
+def install_gateway(monkeypatch):
+    import server
+
+    def install(backend, *, timeout_seconds=5.0, cache=None):
+        gateway = server.LLMGateway(backend, 4, timeout_seconds, cache=cache)
+        monkeypatch.setattr(server, "llm", gateway)
+        return gateway
+
+    return install
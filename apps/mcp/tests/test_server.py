@@ -0,0 +1,230 @@
+import asyncio
+import re
+
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+
+import server
+
+
+def test_model_timeout_returns_504_json(install_gateway, scripted_backend):
+    install_gateway(scripted_backend(lambda tool, prompt: {}, delay=0.5), timeout_seconds=0.05)
+
+    response = TestClient(server.app).post("/tools/classify_ticket", params={"descripcion": "Sin red"})
+
+    assert response.status_code == 504
+    assert response.json()["error"] == "El modelo no respondió a tiempo"
+    assert server.llm.metrics["classify_ticket"].timeouts == 1
+
+
+def test_waiting_for_a_slot_counts_against_the_deadline(scripted_backend):
+    backend = scripted_backend(lambda tool, prompt: {})
+    gateway = server.LLMGateway(backend, 1, 0.05)
+
+    async def scenario():
+        async with gateway._semaphore:  # otra llamada ocupa el único cupo
+            return await asyncio.gather(
+                gateway.complete_json("classify_ticket", "sys", "Sin red", 0.2), return_exceptions=True
+            )
+
+    (outcome,) = asyncio.run(scenario())
+
+    assert isinstance(outcome, server.HTTPException) and outcome.status_code == 504
+    assert backend.prompts == []
+    assert gateway.metrics["classify_ticket"].timeouts == 1
+    assert gateway.in_flight == 0
+
+
+def test_unexpected_errors_return_500_json(install_gateway, scripted_backend):
+    def broken(tool, prompt):
+        raise RuntimeError("sin conexión")
+
+    install_gateway(scripted_backend(broken))
+
+    response = TestClient(server.app).post("/tools/classify_ticket", params={"descripcion": "Sin red"})
+
+    assert response.status_code == 500
+    assert response.json()["status_code"] == 500
+
+
+def classify_result(tool, prompt):
+    return {"categoria_principal": "RED"}
+
+
+def test_cache_serves_identical_calls_and_counts_hits(install_gateway, scripted_backend):
+    backend = scripted_backend(classify_result)
+    gateway = install_gateway(backend, cache=server.ResponseCache(10, 60))
+
+    async def scenario():
+        first = await gateway.complete_json("classify_ticket", "sys", "Sin red", 0.2)
+        second = await gateway.complete_json("classify_ticket", "sys", "Sin red", 0.2)
+        other = await gateway.complete_json("classify_ticket", "sys", "Sin impresora", 0.2)
+        return first, second, other
+
+    first, second, _ = asyncio.run(scenario())
+
+    assert first == second == {"categoria_principal": "RED"}
+    assert len(backend.prompts) == 2
+    snapshot = gateway.cache.snapshot()
+    assert (snapshot["hits"], snapshot["misses"]) == (1, 2)
+
+
+def test_cache_evicts_least_recently_used_and_expires(monkeypatch):
+    cache = server.ResponseCache(2, 60)
+
+    async def scenario():
+        await cache.set("a", {"v": 1}, 10.0, {})
+        await cache.set("b", {"v": 2}, 10.0, {})
+        assert await cache.get("a") == {"v": 1}
+        await cache.set("c", {"v": 3}, 10.0, {})
+        evicted = await cache.get("b")
+
+        now = server.time.time()
+        monkeypatch.setattr(server.time, "time", lambda: now + 61)
+        expired = await cache.get("a")
+        return evicted, expired
+
+    assert asyncio.run(scenario()) == (None, None)
+    assert cache.snapshot()["entries"] == 1
+
+
+def test_disk_cache_survives_restart_and_is_pruned(tmp_path):
+    async def scenario():
+        cache = server.ResponseCache(2, 60, str(tmp_path))
+        for key in ("a", "b", "c"):
+            await cache.set(key, {"key": key}, 10.0, {"prompt_tokens": 1})
+        cache.prune_disk()
+        restarted = server.ResponseCache(2, 60, str(tmp_path))
+        return await restarted.get("c"), restarted
+
+    value, restarted = asyncio.run(scenario())
+
+    assert value == {"key": "c"}
+    assert restarted.disk_hits == 1
+    assert len(list(tmp_path.glob("*.json"))) == 2
+
+
+def test_concurrent_identical_calls_share_one_completion(install_gateway, scripted_backend):
+    backend = scripted_backend(classify_result, delay=0.05)
+    gateway = install_gateway(backend, cache=server.ResponseCache(10, 60))
+
+    async def scenario():
+        return await asyncio.gather(
+            *(gateway.complete_json("classify_ticket", "sys", "Sin red", 0.2) for _ in range(5))
+        )
+
+    results = asyncio.run(scenario())
+
+    assert results == [{"categoria_principal": "RED"}] * 5
+    assert len(backend.prompts) == 1
+    assert gateway.coalesced == 4
+
+
+def test_cancelled_leader_does_not_hang_waiting_callers(install_gateway, scripted_backend):
+    gateway = install_gateway(scripted_backend(classify_result, delay=1.0), cache=server.ResponseCache(10, 60))
+
+    async def scenario():
+        leader = asyncio.create_task(gateway.complete_json("classify_ticket", "sys", "Sin red", 0.2))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(gateway.complete_json("classify_ticket", "sys", "Sin red", 0.2))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await asyncio.wait_for(asyncio.gather(follower, return_exceptions=True), timeout=0.5)
+
+    (outcome,) = asyncio.run(scenario())
+
+    assert isinstance(outcome, server.HTTPException)
+    assert outcome.status_code == 503
+
+
+THREAD = {
+    "ticket_id": "t1",
+    "titulo": "Sin red",
+    "descripcion": "No hay internet en la sala",
+    "prioridad": "MEDIA",
+    "estado": "ABIERTO",
+    "mensajes": [],
+}
+
+
+def test_invalid_triage_response_is_not_cached(install_gateway, scripted_backend):
+    replies = iter([{"prioridad_sugerida": "URGENTE"}, {"prioridad_sugerida": "ALTA"}])
+    backend = scripted_backend(lambda tool, prompt: next(replies))
+    gateway = install_gateway(backend, cache=server.ResponseCache(10, 60))
+    client = TestClient(server.app)
+
+    rejected = client.post("/tools/summarize_and_triage", json=THREAD)
+    retried = client.post("/tools/summarize_and_triage", json=THREAD)
+    cached = client.post("/tools/summarize_and_triage", json=THREAD)
+
+    assert rejected.status_code == 500
+    assert retried.json()["prioridad_sugerida"] == cached.json()["prioridad_sugerida"] == "ALTA"
+    assert len(backend.prompts) == 2
+    assert gateway.cache.snapshot()["entries"] == 1
+
+
+def test_coalesced_callers_share_validation_failure(install_gateway, scripted_backend):
+    backend = scripted_backend(lambda tool, prompt: {"prioridad_sugerida": "URGENTE"}, delay=0.05)
+    gateway = install_gateway(backend, cache=server.ResponseCache(10, 60))
+
+    async def scenario():
+        return await asyncio.gather(
+            *(
+                gateway.complete_json("summarize_and_triage", "sys", "Sin red", 0.3, parse=server._parse_triage_result)
+                for _ in range(3)
+            ),
+            return_exceptions=True,
+        )
+
+    outcomes = asyncio.run(scenario())
+
+    assert all(isinstance(outcome, ValidationError) for outcome in outcomes)
+    assert len(backend.prompts) == 1
+    assert gateway.cache.snapshot()["entries"] == 0
+
+
+def batch_ids(prompt):
+    return re.findall(r'"id": "(\d+)"', prompt)
+
+
+def test_batch_preserves_order_and_classifies_omitted_items_individually(install_gateway, scripted_backend):
+    def respond(tool, prompt):
+        if tool == "classify_ticket":
+            return {"categoria_principal": "OTRO"}
+        # el modelo omite el primer ticket del grupo y devuelve el resto en desorden
+        ids = batch_ids(prompt)[1:]
+        return {"clasificaciones": [{"id": item_id, "categoria_principal": f"C{item_id}"} for item_id in reversed(ids)]}
+
+    install_gateway(scripted_backend(respond))
+    client = TestClient(server.app)
+
+    response = client.post("/tools/classify_tickets_batch", json={"descripciones": ["a", "b", "c"]})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [item["index"] for item in body["data"]] == [0, 1, 2]
+    assert [item["categoria_principal"] for item in body["data"]] == ["OTRO", "C1", "C2"]
+    assert body["individuales"] == 1
+    assert body["errores"] == 0
+
+
+def test_batch_ignores_malformed_items_and_flags_truncated_descriptions(install_gateway, scripted_backend):
+    def respond(tool, prompt):
+        if tool == "classify_ticket":
+            return {"categoria_principal": "OTRO"}
+        return {"clasificaciones": ["basura", None, {"id": "x"}, {"id": "1", "categoria_principal": "RED"}]}
+
+    backend = scripted_backend(respond)
+    install_gateway(backend)
+    client = TestClient(server.app)
+    largo = "x" * (server.MCP_BATCH_MAX_CHARS + 50)
+
+    response = client.post("/tools/classify_tickets_batch", json={"descripciones": [largo, "Sin red"]})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["data"][0] == {"index": 0, "categoria_principal": "OTRO", "truncado": True}
+    assert body["data"][1] == {"index": 1, "categoria_principal": "RED"}
+    assert body["truncados"] == 1
+    assert body["individuales"] == 1
+    assert "x" * (server.MCP_BATCH_MAX_CHARS + 1) not in backend.prompts[0]
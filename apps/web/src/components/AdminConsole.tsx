@@ -11,7 +11,7 @@ import {
   Users,
 } from 'lucide-react';
 
-import { auth } from '../lib/api';
+import { home } from '../lib/api';
 import { normalizeRole } from '../lib/roles';
 import AdminUserManager from './AdminUserManager';
 import InventoryPermissionManager from './InventoryPermissionManager';
@@ -53,7 +53,7 @@ const AdminConsole: React.FC = () => {
 
     const loadProfile = async () => {
       try {
-        const data = await auth.getProfile();
+        const data = await home.getProfile();
         if (!isActive) {
           return;
         }
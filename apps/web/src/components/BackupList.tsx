@@ -54,12 +54,15 @@ const formatDate = (value: string) => {
 const BackupList: React.FC = () => {
   const [items, setItems] = useState<BackupRecord[]>([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     const loadBackups = async () => {
       try {
         const response = await backups.list();
         setItems(response.data || []);
+        setNextCursor(response.next_cursor ?? null);
       } catch (error) {
         console.error('Error al cargar backups:', error);
       } finally {
@@ -70,6 +73,20 @@ const BackupList: React.FC = () => {
     loadBackups();
   }, []);
 
+  const loadMore = async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const response = await backups.list({ cursor: nextCursor });
+      setItems((current) => [...current, ...(response.data || [])]);
+      setNextCursor(response.next_cursor ?? null);
+    } catch (error) {
+      console.error('Error al cargar más backups:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const sortedItems = useMemo(
     () => [...items].sort((a, b) => b.fecha_backup.localeCompare(a.fecha_backup)),
     [items]
@@ -142,6 +159,14 @@ const BackupList: React.FC = () => {
           </div>
         </div>
       ))}
+
+      {nextCursor && (
+        <div className="flex justify-center">
+          <button onClick={loadMore} disabled={loadingMore} className="btn-secondary">
+            {loadingMore ? 'Cargando...' : 'Cargar más'}
+          </button>
+        </div>
+      )}
     </div>
   );
 };
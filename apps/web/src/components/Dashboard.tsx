@@ -15,6 +15,7 @@ import {
   ShieldCheck
 } from 'lucide-react';
 import { LineChart, Line, BarChart, Bar, PieChart, Pie, Cell, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer } from 'recharts';
+import { home } from '../lib/api';
 
 interface DashboardProps {
   userId: string;
@@ -47,13 +48,12 @@ const Dashboard: React.FC<DashboardProps> = ({ userId, userRole }) => {
 
   const fetchMetrics = async () => {
     try {
-      const response = await fetch('/api/dashboard/metrics', {
-        headers: {
-          'Authorization': `Bearer ${localStorage.getItem('token')}`
-        }
-      });
-      const data = await response.json();
-      setMetrics(data);
+      // /home agrupa perfil, permisos, métricas y tickets recientes en una sola llamada
+      const data = await home.load();
+      setMetrics(data.metrics);
+      if (data.errors && Object.keys(data.errors).length > 0) {
+        console.error('Secciones del dashboard con error:', data.errors);
+      }
     } catch (error) {
       console.error('Error fetching metrics:', error);
     } finally {
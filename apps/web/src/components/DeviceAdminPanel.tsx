@@ -9,7 +9,7 @@ import {
   XCircle,
 } from 'lucide-react';
 
-import { auth, devices } from '../lib/api';
+import { devices, home } from '../lib/api';
 import InventoryPermissionManager from './InventoryPermissionManager';
 
 interface Device {
@@ -84,7 +84,7 @@ const DeviceAdminPanel: React.FC = () => {
   useEffect(() => {
     const initialize = async () => {
       try {
-        const userProfile = await auth.getProfile();
+        const userProfile = await home.getProfile();
         setProfile(userProfile);
       } catch (error) {
         console.error('No se pudo obtener el perfil del usuario:', error);
@@ -93,7 +93,7 @@ const DeviceAdminPanel: React.FC = () => {
       }
     };
 
-    finitialize();
+    initialize();
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, []);
 
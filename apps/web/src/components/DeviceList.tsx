@@ -10,7 +10,7 @@ import {
   Plus,
   Shield,
 } from 'lucide-react';
-import { auth, devices } from '../lib/api';
+import { devices, home } from '../lib/api';
 import { canManageInventory as canManageInventoryFromProfile } from '../lib/access/index';
 
 interface Device {
@@ -40,8 +40,9 @@ const DeviceList: React.FC = () => {
   useEffect(() => {
     const fetchProfile = async () => {
       try {
-        const profile = await auth.getProfile();
-        setCanCreateDevices(canManageInventoryFromProfile(profile));
+        const data = await home.load();
+        // /home resuelve el permiso en el backend (rol o permiso especial por correo)
+        setCanCreateDevices(data.permissions?.can_manage ?? canManageInventoryFromProfile(data.profile));
       } catch (error) {
         console.error('No se pudo obtener el perfil del usuario:', error);
       }
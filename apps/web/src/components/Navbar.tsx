@@ -2,7 +2,7 @@
 import React, { useEffect, useMemo, useState } from 'react';
 import { Activity, Menu, X, LogOut, User } from 'lucide-react';
 import { tryGetSupabaseClient, logout } from '../lib/supabase';
-import { auth } from '../lib/api';
+import { home } from '../lib/api';
 import { normalizeRole } from '../lib/roles';
 interface UserProfile {
   id: string;
@@ -64,7 +64,7 @@ const Navbar: React.FC = () => {
 
     const fetchProfile = async () => {
       try {
-        const data = await auth.getProfile();
+        const data = await home.getProfile();
         if (!isActive) {
           return;
         }
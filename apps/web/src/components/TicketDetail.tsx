@@ -32,6 +32,9 @@ const TicketDetail: React.FC = () => {
   const [newComment, setNewComment] = useState('');
   const [loading, setLoading] = useState(true);
   const [submitting, setSubmitting] = useState(false);
+  const [commentsTotal, setCommentsTotal] = useState<number | null>(null);
+  const [commentsCursor, setCommentsCursor] = useState<string | null>(null);
+  const [loadingOlder, setLoadingOlder] = useState(false);
 
   useEffect(() => {
     const ticketId = window.location.pathname.split('/').pop();
@@ -45,6 +48,8 @@ const TicketDetail: React.FC = () => {
       const response = await tickets.get(id);
       setTicket(response.ticket);
       setComments(response.comments || []);
+      setCommentsTotal(response.comments_total ?? null);
+      setCommentsCursor(response.comments_next_cursor ?? null);
     } catch (error) {
       console.error('Error al cargar ticket:', error);
     } finally {
@@ -52,6 +57,21 @@ const TicketDetail: React.FC = () => {
     }
   };
 
+  const loadOlderComments = async () => {
+    if (!ticket || !commentsCursor || loadingOlder) return;
+    setLoadingOlder(true);
+    try {
+      const response = await tickets.listComments(ticket.id, commentsCursor);
+      // Las páginas siguientes son más antiguas: van antes de las ya cargadas
+      setComments((current) => [...(response.data || []), ...current]);
+      setCommentsCursor(response.next_cursor ?? null);
+    } catch (error) {
+      console.error('Error al cargar comentarios anteriores:', error);
+    } finally {
+      setLoadingOlder(false);
+    }
+  };
+
   const handleSubmitComment = async (e: React.FormEvent) => {
     e.preventDefault();
     if (!ticket || !newComment.trim()) return;
@@ -153,10 +173,22 @@ const TicketDetail: React.FC = () => {
       {/* Comentarios */}
       <div className="card">
         <h2 className="text-xl font-semibold text-gray-900 mb-6">
-          Comentarios ({comments.length})
+          Comentarios ({commentsTotal ?? comments.length})
         </h2>
 
         <div className="space-y-4 mb-6">
+          {commentsCursor && (
+            <div className="flex justify-center">
+              <button
+                type="button"
+                onClick={loadOlderComments}
+                disabled={loadingOlder}
+                className="btn-secondary"
+              >
+                {loadingOlder ? 'Cargando...' : 'Ver comentarios anteriores'}
+              </button>
+            </div>
+          )}
           {comments.map((comment) => (
             <div
               key={comment.id}
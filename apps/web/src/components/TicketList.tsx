@@ -1,12 +1,13 @@
 // src/components/TicketList.tsx
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { AlertCircle, Plus, Clock, CheckCircle, XCircle } from 'lucide-react';
-import { tickets } from '../lib/api';
+import { home, tickets } from '../lib/api';
 
 interface Ticket {
   id: string;
   titulo: string;
-  descripcion: string;
+  descripcion?: string;
+  descripcion_resumen?: string;
   prioridad: string;
   estado: string;
   fecha_creacion: string;
@@ -21,18 +22,27 @@ const TicketList: React.FC = () => {
   const [loading, setLoading] = useState(true);
   const [filterEstado, setFilterEstado] = useState('');
   const [showCreateModal, setShowCreateModal] = useState(false);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  // La primera carga sin filtros reutiliza la página que Navbar ya pidió a /home
+  const firstLoad = useRef(true);
 
   useEffect(() => {
     fetchTickets();
   }, [filterEstado]);
 
-  const fetchTickets = async () => {
+  const fetchTickets = async (cursor?: string) => {
     try {
       const params: any = {};
       if (filterEstado) params.estado = filterEstado;
+      if (cursor) params.cursor = cursor;
       
-      const response = await tickets.list(params);
-      setTicketList(response.data || []);
+      const fromHome = firstLoad.current && !filterEstado && !cursor;
+      firstLoad.current = false;
+      const response = (fromHome && (await home.getTickets().catch(() => null))) || (await tickets.list(params));
+      const page = response.data || [];
+      setTicketList((current) => (cursor ? [...current, ...page] : page));
+      setNextCursor(response.next_cursor ?? null);
     } catch (error) {
       console.error('Error al cargar tickets:', error);
     } finally {
@@ -40,6 +50,13 @@ const TicketList: React.FC = () => {
     }
   };
 
+  const loadMore = async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    await fetchTickets(nextCursor);
+    setLoadingMore(false);
+  };
+
   const getPrioridadBadge = (prioridad: string) => {
     switch (prioridad) {
       case 'CRITICA':
@@ -185,7 +202,7 @@ const TicketList: React.FC = () => {
                         {ticket.titulo}
                       </h3>
                       <p className="text-sm text-gray-600 line-clamp-2">
-                        {ticket.descripcion}
+                        {ticket.descripcion_resumen ?? ticket.descripcion}
                       </p>
                     </div>
                   </div>
@@ -206,6 +223,14 @@ const TicketList: React.FC = () => {
               </div>
             </a>
           ))}
+
+          {nextCursor && (
+            <div className="flex justify-center">
+              <button onClick={loadMore} disabled={loadingMore} className="btn-secondary">
+                {loadingMore ? 'Cargando...' : 'Cargar más'}
+              </button>
+            </div>
+          )}
         </div>
       )}
     </div>
@@ -412,7 +412,14 @@ export const inventoryPermissions = {
 
 // Tickets
 export const tickets = {
-  list: async (params?: { estado?: string }) => {
+  list: async (params?: {
+    estado?: string;
+    prioridad?: string;
+    asignado_a?: string;
+    cursor?: string;
+    limit?: number;
+    detalle?: boolean;
+  }) => {
     const query = new URLSearchParams(params as any).toString();
     return fetchAPI(`/tickets${query ? `?${query}` : ''}`);
   },
@@ -420,6 +427,10 @@ export const tickets = {
   get: async (id: string) => {
     return fetchAPI(`/tickets/${id}`);
   },
+
+  listComments: async (id: string, cursor: string) => {
+    return fetchAPI(`/tickets/${id}/comments?cursor=${encodeURIComponent(cursor)}`);
+  },
   
   create: async (data: any) => {
     return fetchAPI('/tickets', {
@@ -448,13 +459,58 @@ export const dashboard = {
   getMetrics: async () => {
     return fetchAPI('/dashboard/metrics');
   },
+  // Perfil, permisos, métricas y tickets recientes en una sola llamada
+  getHome: async (ticketsLimit = HOME_TICKETS_LIMIT) => {
+    return fetchAPI(`/home?tickets_limit=${ticketsLimit}`);
+  },
+};
+
+// Datos de arranque compartidos: Navbar y el componente de cada página
+// hidratan por separado, pero juntos hacen una sola llamada a /home.
+// Mismo tamaño de página que /tickets para reutilizar la primera página.
+const HOME_TICKETS_LIMIT = 50;
+let homeRequest: Promise<any> | null = null;
+
+export const home = {
+  load: () => {
+    if (!homeRequest) {
+      homeRequest = dashboard.getHome().catch((error) => {
+        homeRequest = null;
+        throw error;
+      });
+    }
+    return homeRequest;
+  },
+
+  invalidate: () => {
+    homeRequest = null;
+  },
+
+  getProfile: async () => {
+    try {
+      return (await home.load()).profile;
+    } catch (error) {
+      const message = error instanceof Error ? error.message : String(error);
+      if (!isApiNotReachableError(message)) {
+        throw error;
+      }
+
+      return getProfileViaSupabase();
+    }
+  },
+
+  // Primera página de tickets sin filtros; null si /home no pudo traerla
+  getTickets: async () => {
+    const data = await home.load();
+    return data.errors?.tickets ? null : data.tickets;
+  },
 };
 
 // Backups
 export const backups = {
-  list: async (deviceId?: string) => {
-    const query = deviceId ? `?device_id=${deviceId}` : '';
-    return fetchAPI(`/backups${query}`);
+  list: async (params?: { device_id?: string; cursor?: string; limit?: number }) => {
+    const query = new URLSearchParams(params as any).toString();
+    return fetchAPI(`/backups${query ? `?${query}` : ''}`);
   },
 };
 
@@ -3,6 +3,21 @@
 
 -- Enable UUID extension
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+-- Búsqueda por similitud (trigramas)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+-- Búsqueda de texto completo sin tildes
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+-- Configuración en español que ignora tildes ("impresion" encuentra "impresión")
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'spanish_unaccent') THEN
+        CREATE TEXT SEARCH CONFIGURATION public.spanish_unaccent (COPY = spanish);
+        ALTER TEXT SEARCH CONFIGURATION public.spanish_unaccent
+            ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem;
+    END IF;
+END
+$$;
 
 -- ==================== ENUMS ====================
 
@@ -75,6 +90,10 @@ CREATE TABLE devices (
     actualizado_en TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Ruta normalizada de ubicacion: 'sede-norte/bloque-b/sala-204/' (ver normalize_location)
+ALTER TABLE devices
+    ADD COLUMN IF NOT EXISTS ubicacion_path TEXT;
+
 -- Especificaciones de Dispositivos
 CREATE TABLE device_specs (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -95,6 +114,12 @@ CREATE TABLE device_specs (
     UNIQUE(device_id)
 );
 
+-- Valores normalizados desde los campos libres (ver parse_capacity_bytes / parse_speed_mhz)
+ALTER TABLE device_specs
+    ADD COLUMN IF NOT EXISTS ram_bytes BIGINT,
+    ADD COLUMN IF NOT EXISTS disco_bytes BIGINT,
+    ADD COLUMN IF NOT EXISTS cpu_mhz INTEGER;
+
 -- Logs de Dispositivos (Historial)
 CREATE TABLE device_logs (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -141,6 +166,18 @@ CREATE TABLE tickets (
     tiempo_resolucion_minutos INTEGER
 );
 
+-- Vista previa de la descripción para listados (evita traer el texto completo)
+ALTER TABLE tickets
+    ADD COLUMN IF NOT EXISTS descripcion_resumen VARCHAR(200)
+    GENERATED ALWAYS AS (LEFT(descripcion, 200)) STORED;
+
+ALTER TABLE tickets
+    ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('public.spanish_unaccent', COALESCE(titulo, '')), 'A')
+        || setweight(to_tsvector('public.spanish_unaccent', COALESCE(descripcion, '')), 'B')
+    ) STORED;
+
 -- Comentarios de Tickets
 CREATE TABLE ticket_comments (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -152,6 +189,10 @@ CREATE TABLE ticket_comments (
     fecha TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+ALTER TABLE ticket_comments
+    ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+    GENERATED ALWAYS AS (to_tsvector('public.spanish_unaccent', COALESCE(comentario, ''))) STORED;
+
 -- Auditoría con Cadena de Hash (reemplazo de blockchain)
 CREATE TABLE audit_chain (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -168,6 +209,43 @@ CREATE TABLE audit_chain (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Conteos precalculados por nodo de ubicación (sede → bloque → sala) y estado.
+-- Se mantienen con el trigger maintain_location_rollups sobre devices.
+CREATE TABLE location_rollups (
+    org_unit_id UUID REFERENCES org_units(id) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    nombre VARCHAR(300),
+    depth INTEGER NOT NULL,
+    estado device_status NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    actualizado_en TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    UNIQUE NULLS NOT DISTINCT (org_unit_id, path, estado)
+);
+
+-- Series temporales por org unit: conteos por hora y por día de tickets,
+-- backups y logs de dispositivos. Se mantienen con triggers y se recalculan
+-- con rebuild_metric_rollups.
+CREATE TABLE metric_rollups (
+    org_unit_id UUID REFERENCES org_units(id) ON DELETE CASCADE,
+    metrica VARCHAR(50) NOT NULL,
+    granularidad VARCHAR(10) NOT NULL CHECK (granularidad IN ('hour', 'day')),
+    bucket TIMESTAMP WITH TIME ZONE NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    UNIQUE NULLS NOT DISTINCT (org_unit_id, metrica, granularidad, bucket)
+);
+
+-- Contadores del dashboard por org unit y dimensión (sección + contador).
+-- Los triggers los ajustan en la misma transacción de cada escritura, así que
+-- son exactos con cualquier número de instancias; get_dashboard_counter_drift
+-- los compara con un recálculo completo y rebuild_dashboard_counters los repara.
+CREATE TABLE dashboard_counters (
+    org_unit_id UUID REFERENCES org_units(id) ON DELETE CASCADE,
+    seccion VARCHAR(20) NOT NULL,
+    contador VARCHAR(30) NOT NULL,
+    total BIGINT NOT NULL DEFAULT 0,
+    UNIQUE NULLS NOT DISTINCT (org_unit_id, seccion, contador)
+);
+
 -- Archivos Adjuntos
 CREATE TABLE attachments (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -181,21 +259,55 @@ CREATE TABLE attachments (
     creado_en TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Ruta del objeto en el bucket privado: la API emite URLs firmadas al leer
+ALTER TABLE attachments
+    ADD COLUMN IF NOT EXISTS storage_path TEXT;
+
+ALTER TABLE attachments
+    ALTER COLUMN url DROP NOT NULL;
+
+-- Bucket privado de adjuntos (ATTACHMENT_BUCKET); también guarda las subidas en curso
+INSERT INTO storage.buckets (id, name, public)
+VALUES ('attachments', 'attachments', FALSE)
+ON CONFLICT (id) DO UPDATE SET public = FALSE;
+
 -- ==================== INDEXES ====================
 
 CREATE INDEX idx_devices_org_unit ON devices(org_unit_id);
 CREATE INDEX idx_devices_estado ON devices(estado);
 CREATE INDEX idx_devices_usuario ON devices(usuario_actual_id);
+CREATE UNIQUE INDEX idx_devices_serial_unique ON devices(serial) WHERE serial IS NOT NULL;
+CREATE INDEX idx_devices_nombre_trgm ON devices USING GIN (nombre gin_trgm_ops);
+CREATE INDEX idx_devices_serial_trgm ON devices USING GIN (serial gin_trgm_ops);
+CREATE INDEX idx_devices_marca_trgm ON devices USING GIN (marca gin_trgm_ops);
+CREATE INDEX idx_devices_modelo_trgm ON devices USING GIN (modelo gin_trgm_ops);
+CREATE INDEX idx_devices_ubicacion_trgm ON devices USING GIN (ubicacion gin_trgm_ops);
+CREATE INDEX idx_devices_ubicacion_path ON devices(ubicacion_path text_pattern_ops);
+CREATE INDEX idx_devices_org_ubicacion_path ON devices(org_unit_id, ubicacion_path text_pattern_ops);
+CREATE INDEX idx_location_rollups_path ON location_rollups(path text_pattern_ops);
+CREATE INDEX idx_metric_rollups_series ON metric_rollups(metrica, granularidad, bucket);
+CREATE INDEX idx_device_specs_ram_bytes ON device_specs(ram_bytes) WHERE ram_bytes IS NOT NULL;
+CREATE INDEX idx_device_specs_disco_bytes ON device_specs(disco_bytes) WHERE disco_bytes IS NOT NULL;
+CREATE INDEX idx_device_specs_cpu_mhz ON device_specs(cpu_mhz) WHERE cpu_mhz IS NOT NULL;
 CREATE INDEX idx_device_logs_device ON device_logs(device_id);
 CREATE INDEX idx_device_logs_fecha ON device_logs(fecha DESC);
 CREATE INDEX idx_backups_device ON backups(device_id);
 CREATE INDEX idx_backups_fecha ON backups(fecha_backup DESC);
+CREATE INDEX idx_backups_fecha_id ON backups(fecha_backup DESC, id DESC);
+CREATE INDEX idx_backups_device_fecha ON backups(device_id, fecha_backup DESC);
 CREATE INDEX idx_tickets_org_unit ON tickets(org_unit_id);
 CREATE INDEX idx_tickets_solicitante ON tickets(solicitante_id);
 CREATE INDEX idx_tickets_asignado ON tickets(asignado_a);
 CREATE INDEX idx_tickets_estado ON tickets(estado);
 CREATE INDEX idx_tickets_fecha ON tickets(fecha_creacion DESC);
+CREATE INDEX idx_tickets_org_fecha_id ON tickets(org_unit_id, fecha_creacion DESC, id DESC);
+CREATE INDEX idx_tickets_solicitante_fecha_id ON tickets(solicitante_id, fecha_creacion DESC, id DESC);
+CREATE INDEX idx_tickets_prioridad ON tickets(prioridad);
 CREATE INDEX idx_ticket_comments_ticket ON ticket_comments(ticket_id);
+CREATE INDEX idx_tickets_search ON tickets USING GIN (search_vector);
+CREATE INDEX idx_ticket_comments_search ON ticket_comments USING GIN (search_vector);
+CREATE INDEX idx_ticket_comments_ticket_fecha_id ON ticket_comments(ticket_id, fecha DESC, id DESC);
+CREATE INDEX idx_attachments_entidad ON attachments(entidad_tipo, entidad_id);
 CREATE INDEX idx_audit_chain_entity ON audit_chain(entity_id);
 CREATE INDEX idx_audit_chain_hash ON audit_chain(hash);
 
@@ -247,6 +359,9 @@ ALTER TABLE tickets ENABLE ROW LEVEL SECURITY;
 ALTER TABLE ticket_comments ENABLE ROW LEVEL SECURITY;
 ALTER TABLE audit_chain ENABLE ROW LEVEL SECURITY;
 ALTER TABLE attachments ENABLE ROW LEVEL SECURITY;
+ALTER TABLE location_rollups ENABLE ROW LEVEL SECURITY;
+ALTER TABLE metric_rollups ENABLE ROW LEVEL SECURITY;
+ALTER TABLE dashboard_counters ENABLE ROW LEVEL SECURITY;
 
 -- Políticas para USERS
 CREATE POLICY "Los usuarios pueden ver su propio perfil"
@@ -416,6 +531,30 @@ CREATE POLICY "Solo el sistema puede insertar en audit_chain"
         OR current_user_has_role('LIDER_TI')
     );
 
+-- Políticas para LOCATION_ROLLUPS
+CREATE POLICY "Los usuarios ven rollups de ubicación de su org_unit"
+    ON location_rollups FOR SELECT
+    USING (
+        current_user_has_role('LIDER_TI')
+        OR org_unit_id = current_user_org_unit()
+    );
+
+-- Políticas para METRIC_ROLLUPS
+CREATE POLICY "Los usuarios ven series de su org_unit"
+    ON metric_rollups FOR SELECT
+    USING (
+        current_user_has_role('LIDER_TI')
+        OR org_unit_id = current_user_org_unit()
+    );
+
+-- Políticas para DASHBOARD_COUNTERS
+CREATE POLICY "Los usuarios ven contadores de su org_unit"
+    ON dashboard_counters FOR SELECT
+    USING (
+        current_user_has_role('LIDER_TI')
+        OR org_unit_id = current_user_org_unit()
+    );
+
 -- Políticas para ATTACHMENTS
 CREATE POLICY "Los usuarios ven attachments relacionados a recursos que pueden ver"
     ON attachments FOR SELECT
@@ -448,14 +587,28 @@ CREATE TRIGGER update_device_specs_updated_at BEFORE UPDATE ON device_specs
 -- Calcular tiempos de respuesta y resolución en tickets
 CREATE OR REPLACE FUNCTION calculate_ticket_times()
 RETURNS TRIGGER AS $$
+DECLARE
+    -- En INSERT no hay fila previa: los tickets creados ya asignados también cuentan
+    v_old_asignado UUID := CASE WHEN TG_OP = 'UPDATE' THEN OLD.asignado_a END;
+    v_old_fecha_asignacion TIMESTAMP WITH TIME ZONE := CASE WHEN TG_OP = 'UPDATE' THEN OLD.fecha_asignacion END;
+    v_old_fecha_resolucion TIMESTAMP WITH TIME ZONE := CASE WHEN TG_OP = 'UPDATE' THEN OLD.fecha_resolucion END;
 BEGIN
+    -- Fechas de asignación/resolución al primer cambio, si la API no las envía
+    IF NEW.asignado_a IS NOT NULL AND v_old_asignado IS NULL AND NEW.fecha_asignacion IS NULL THEN
+        NEW.fecha_asignacion = NOW();
+    END IF;
+
+    IF NEW.estado IN ('RESUELTO', 'CERRADO') AND NEW.fecha_resolucion IS NULL THEN
+        NEW.fecha_resolucion = NOW();
+    END IF;
+
     -- Tiempo de respuesta (desde creación hasta asignación)
-    IF NEW.fecha_asignacion IS NOT NULL AND OLD.fecha_asignacion IS NULL THEN
+    IF NEW.fecha_asignacion IS NOT NULL AND v_old_fecha_asignacion IS NULL THEN
         NEW.tiempo_respuesta_minutos = EXTRACT(EPOCH FROM (NEW.fecha_asignacion - NEW.fecha_creacion)) / 60;
     END IF;
     
     -- Tiempo de resolución (desde creación hasta resolución)
-    IF NEW.fecha_resolucion IS NOT NULL AND OLD.fecha_resolucion IS NULL THEN
+    IF NEW.fecha_resolucion IS NOT NULL AND v_old_fecha_resolucion IS NULL THEN
         NEW.tiempo_resolucion_minutos = EXTRACT(EPOCH FROM (NEW.fecha_resolucion - NEW.fecha_creacion)) / 60;
     END IF;
     
@@ -463,12 +616,523 @@ BEGIN
 END;
 $$ language 'plpgsql';
 
-CREATE TRIGGER calculate_ticket_times_trigger BEFORE UPDATE ON tickets
+CREATE TRIGGER calculate_ticket_times_trigger BEFORE INSERT OR UPDATE ON tickets
     FOR EACH ROW EXECUTE FUNCTION calculate_ticket_times();
 
+-- Mantener location_rollups: cada dispositivo suma en todos los ancestros de su ruta
+CREATE OR REPLACE FUNCTION apply_location_rollup(
+    p_org_unit_id UUID,
+    p_path TEXT,
+    p_ubicacion TEXT,
+    p_estado device_status,
+    p_delta INTEGER
+)
+RETURNS VOID AS $$
+DECLARE
+    v_keys TEXT[];
+    v_names TEXT[];
+    v_prefix TEXT := '';
+    i INTEGER;
+BEGIN
+    IF p_path IS NULL OR p_path = '' THEN
+        RETURN;
+    END IF;
+
+    v_keys := string_to_array(rtrim(p_path, '/'), '/');
+    v_names := string_to_array(COALESCE(p_ubicacion, ''), ' / ');
+
+    FOR i IN 1..array_length(v_keys, 1) LOOP
+        v_prefix := v_prefix || v_keys[i] || '/';
+        INSERT INTO location_rollups (org_unit_id, path, nombre, depth, estado, total)
+        VALUES (
+            p_org_unit_id,
+            v_prefix,
+            CASE WHEN array_length(v_names, 1) = array_length(v_keys, 1) THEN v_names[i] ELSE v_keys[i] END,
+            i,
+            p_estado,
+            GREATEST(p_delta, 0)
+        )
+        ON CONFLICT (org_unit_id, path, estado) DO UPDATE
+            SET total = GREATEST(location_rollups.total + p_delta, 0),
+                actualizado_en = NOW();
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION maintain_location_rollups()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        IF TG_OP = 'DELETE'
+           OR OLD.ubicacion_path IS DISTINCT FROM NEW.ubicacion_path
+           OR OLD.estado IS DISTINCT FROM NEW.estado
+           OR OLD.org_unit_id IS DISTINCT FROM NEW.org_unit_id THEN
+            PERFORM apply_location_rollup(OLD.org_unit_id, OLD.ubicacion_path, OLD.ubicacion, OLD.estado, -1);
+        ELSE
+            RETURN NEW;
+        END IF;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM apply_location_rollup(NEW.org_unit_id, NEW.ubicacion_path, NEW.ubicacion, NEW.estado, 1);
+        RETURN NEW;
+    END IF;
+
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER maintain_location_rollups_trigger AFTER INSERT OR UPDATE OR DELETE ON devices
+    FOR EACH ROW EXECUTE FUNCTION maintain_location_rollups();
+
+-- Recalcular location_rollups desde cero (después de normalizar ubicaciones existentes)
+CREATE OR REPLACE FUNCTION rebuild_location_rollups()
+RETURNS VOID AS $$
+DECLARE
+    r RECORD;
+BEGIN
+    DELETE FROM location_rollups;
+    FOR r IN
+        SELECT org_unit_id, ubicacion_path, ubicacion, estado
+        FROM devices
+        WHERE ubicacion_path IS NOT NULL
+    LOOP
+        PERFORM apply_location_rollup(r.org_unit_id, r.ubicacion_path, r.ubicacion, r.estado, 1);
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Mantener metric_rollups: cada evento suma en su bucket horario y diario (UTC)
+CREATE OR REPLACE FUNCTION apply_metric_rollup(
+    p_org_unit_id UUID,
+    p_metrica TEXT,
+    p_fecha TIMESTAMP WITH TIME ZONE,
+    p_delta INTEGER
+)
+RETURNS VOID AS $$
+DECLARE
+    v_granularidad TEXT;
+BEGIN
+    IF p_fecha IS NULL THEN
+        RETURN;
+    END IF;
+
+    FOREACH v_granularidad IN ARRAY ARRAY['hour', 'day'] LOOP
+        INSERT INTO metric_rollups (org_unit_id, metrica, granularidad, bucket, total)
+        VALUES (
+            p_org_unit_id,
+            p_metrica,
+            v_granularidad,
+            date_trunc(v_granularidad, p_fecha, 'UTC'),
+            GREATEST(p_delta, 0)
+        )
+        ON CONFLICT (org_unit_id, metrica, granularidad, bucket) DO UPDATE
+            SET total = GREATEST(metric_rollups.total + p_delta, 0);
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION maintain_ticket_metric_rollups()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM apply_metric_rollup(NEW.org_unit_id, 'tickets_creados', NEW.fecha_creacion, 1);
+        RETURN NEW;
+    END IF;
+
+    IF TG_OP = 'DELETE' THEN
+        PERFORM apply_metric_rollup(OLD.org_unit_id, 'tickets_creados', OLD.fecha_creacion, -1);
+        PERFORM apply_metric_rollup(OLD.org_unit_id, 'tickets_resueltos', OLD.fecha_resolucion, -1);
+        RETURN OLD;
+    END IF;
+
+    IF OLD.fecha_resolucion IS DISTINCT FROM NEW.fecha_resolucion THEN
+        PERFORM apply_metric_rollup(OLD.org_unit_id, 'tickets_resueltos', OLD.fecha_resolucion, -1);
+        PERFORM apply_metric_rollup(NEW.org_unit_id, 'tickets_resueltos', NEW.fecha_resolucion, 1);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER maintain_ticket_metric_rollups_trigger AFTER INSERT OR UPDATE OR DELETE ON tickets
+    FOR EACH ROW EXECUTE FUNCTION maintain_ticket_metric_rollups();
+
+-- Backups y logs toman la org unit de su dispositivo
+CREATE OR REPLACE FUNCTION maintain_device_event_rollups()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_row RECORD;
+    v_delta INTEGER;
+    v_org_unit_id UUID;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        v_row := NEW;
+        v_delta := 1;
+    ELSE
+        v_row := OLD;
+        v_delta := -1;
+    END IF;
+
+    SELECT org_unit_id INTO v_org_unit_id FROM devices WHERE id = v_row.device_id;
+
+    IF TG_TABLE_NAME = 'backups' THEN
+        PERFORM apply_metric_rollup(v_org_unit_id, 'backups', v_row.fecha_backup, v_delta);
+        IF NOT COALESCE(v_row.exitoso, TRUE) THEN
+            PERFORM apply_metric_rollup(v_org_unit_id, 'backups_fallidos', v_row.fecha_backup, v_delta);
+        END IF;
+    ELSE
+        PERFORM apply_metric_rollup(v_org_unit_id, 'device_logs', v_row.fecha, v_delta);
+    END IF;
+
+    RETURN v_row;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER maintain_backup_metric_rollups_trigger AFTER INSERT OR DELETE ON backups
+    FOR EACH ROW EXECUTE FUNCTION maintain_device_event_rollups();
+
+CREATE TRIGGER maintain_device_log_metric_rollups_trigger AFTER INSERT OR DELETE ON device_logs
+    FOR EACH ROW EXECUTE FUNCTION maintain_device_event_rollups();
+
+-- Recalcular metric_rollups desde cero con agregaciones por conjunto (backfill)
+CREATE OR REPLACE FUNCTION rebuild_metric_rollups()
+RETURNS BIGINT AS $$
+DECLARE
+    v_rows BIGINT;
+BEGIN
+    DELETE FROM metric_rollups;
+
+    INSERT INTO metric_rollups (org_unit_id, metrica, granularidad, bucket, total)
+    SELECT e.org_unit_id, e.metrica, g.granularidad, date_trunc(g.granularidad, e.fecha, 'UTC'), COUNT(*)
+    FROM (
+        SELECT org_unit_id, 'tickets_creados' AS metrica, fecha_creacion AS fecha FROM tickets
+        UNION ALL
+        SELECT org_unit_id, 'tickets_resueltos', fecha_resolucion FROM tickets
+        WHERE fecha_resolucion IS NOT NULL
+        UNION ALL
+        SELECT d.org_unit_id, 'backups', b.fecha_backup FROM backups b LEFT JOIN devices d ON d.id = b.device_id
+        UNION ALL
+        SELECT d.org_unit_id, 'backups_fallidos', b.fecha_backup FROM backups b LEFT JOIN devices d ON d.id = b.device_id
+        WHERE NOT COALESCE(b.exitoso, TRUE)
+        UNION ALL
+        SELECT d.org_unit_id, 'device_logs', l.fecha FROM device_logs l LEFT JOIN devices d ON d.id = l.device_id
+    ) e
+    CROSS JOIN (VALUES ('hour'), ('day')) AS g(granularidad)
+    WHERE e.fecha IS NOT NULL
+    GROUP BY 1, 2, 3, 4;
+
+    GET DIAGNOSTICS v_rows = ROW_COUNT;
+    RETURN v_rows;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Mantener dashboard_counters: cada fila aporta a total, a su estado y (en
+-- tickets) a su prioridad y a las sumas de tiempos; un UPDATE resta el aporte
+-- anterior y suma el nuevo.
+CREATE OR REPLACE FUNCTION dashboard_estado_counter(p_estado TEXT)
+RETURNS TEXT AS $$
+    SELECT CASE p_estado
+        WHEN 'ACTIVO' THEN 'activos'
+        WHEN 'REPARACIÓN' THEN 'reparacion'
+        WHEN 'RETIRADO' THEN 'retirados'
+        WHEN 'ABIERTO' THEN 'abiertos'
+        WHEN 'EN_PROCESO' THEN 'en_proceso'
+        WHEN 'RESUELTO' THEN 'resueltos'
+        WHEN 'CERRADO' THEN 'cerrados'
+    END;
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION dashboard_prioridad_counter(p_prioridad TEXT)
+RETURNS TEXT AS $$
+    SELECT CASE WHEN p_prioridad IN ('BAJA', 'MEDIA', 'ALTA', 'CRITICA')
+        THEN 'prioridad_' || lower(p_prioridad)
+    END;
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION apply_dashboard_counter(
+    p_org_unit_id UUID,
+    p_seccion TEXT,
+    p_contador TEXT,
+    p_delta BIGINT
+)
+RETURNS VOID AS $$
+BEGIN
+    IF p_contador IS NULL OR p_delta = 0 THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO dashboard_counters (org_unit_id, seccion, contador, total)
+    VALUES (p_org_unit_id, p_seccion, p_contador, p_delta)
+    ON CONFLICT (org_unit_id, seccion, contador) DO UPDATE
+        SET total = dashboard_counters.total + p_delta;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION apply_ticket_dashboard_counters(p_row tickets, p_sign INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    PERFORM apply_dashboard_counter(p_row.org_unit_id, 'tickets', 'total', p_sign);
+    PERFORM apply_dashboard_counter(p_row.org_unit_id, 'tickets', dashboard_estado_counter(p_row.estado), p_sign);
+    PERFORM apply_dashboard_counter(
+        p_row.org_unit_id, 'tickets', dashboard_prioridad_counter(p_row.prioridad), p_sign
+    );
+    IF p_row.tiempo_respuesta_minutos IS NOT NULL THEN
+        PERFORM apply_dashboard_counter(
+            p_row.org_unit_id, 'tickets', 'tiempo_respuesta_suma', p_sign * p_row.tiempo_respuesta_minutos
+        );
+        PERFORM apply_dashboard_counter(p_row.org_unit_id, 'tickets', 'tiempo_respuesta_n', p_sign);
+    END IF;
+    IF p_row.tiempo_resolucion_minutos IS NOT NULL THEN
+        PERFORM apply_dashboard_counter(
+            p_row.org_unit_id, 'tickets', 'tiempo_resolucion_suma', p_sign * p_row.tiempo_resolucion_minutos
+        );
+        PERFORM apply_dashboard_counter(p_row.org_unit_id, 'tickets', 'tiempo_resolucion_n', p_sign);
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION maintain_ticket_dashboard_counters()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND (OLD.org_unit_id, OLD.estado, OLD.prioridad,
+            OLD.tiempo_respuesta_minutos, OLD.tiempo_resolucion_minutos)
+        IS NOT DISTINCT FROM (NEW.org_unit_id, NEW.estado, NEW.prioridad,
+            NEW.tiempo_respuesta_minutos, NEW.tiempo_resolucion_minutos) THEN
+        RETURN NEW;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM apply_ticket_dashboard_counters(OLD, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM apply_ticket_dashboard_counters(NEW, 1);
+        RETURN NEW;
+    END IF;
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER maintain_ticket_dashboard_counters_trigger AFTER INSERT OR UPDATE OR DELETE ON tickets
+    FOR EACH ROW EXECUTE FUNCTION maintain_ticket_dashboard_counters();
+
+CREATE OR REPLACE FUNCTION maintain_device_dashboard_counters()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_backups BIGINT;
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM apply_dashboard_counter(OLD.org_unit_id, 'dispositivos', 'total', -1);
+        PERFORM apply_dashboard_counter(OLD.org_unit_id, 'dispositivos', dashboard_estado_counter(OLD.estado), -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM apply_dashboard_counter(NEW.org_unit_id, 'dispositivos', 'total', 1);
+        PERFORM apply_dashboard_counter(NEW.org_unit_id, 'dispositivos', dashboard_estado_counter(NEW.estado), 1);
+    END IF;
+
+    -- Los backups cuentan en la org unit de su dispositivo: un traslado los mueve
+    IF TG_OP = 'UPDATE' AND OLD.org_unit_id IS DISTINCT FROM NEW.org_unit_id THEN
+        SELECT COUNT(*) INTO v_backups FROM backups WHERE device_id = NEW.id;
+        PERFORM apply_dashboard_counter(OLD.org_unit_id, 'backups', 'total', -v_backups);
+        PERFORM apply_dashboard_counter(NEW.org_unit_id, 'backups', 'total', v_backups);
+    END IF;
+
+    IF TG_OP = 'DELETE' THEN
+        RETURN OLD;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER maintain_device_dashboard_counters_trigger
+    AFTER INSERT OR DELETE OR UPDATE OF org_unit_id, estado ON devices
+    FOR EACH ROW EXECUTE FUNCTION maintain_device_dashboard_counters();
+
+CREATE OR REPLACE FUNCTION maintain_backup_dashboard_counters()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_row RECORD;
+    v_org_unit_id UUID;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        v_row := NEW;
+    ELSE
+        v_row := OLD;
+    END IF;
+
+    SELECT org_unit_id INTO v_org_unit_id FROM devices WHERE id = v_row.device_id;
+    PERFORM apply_dashboard_counter(
+        v_org_unit_id, 'backups', 'total', CASE WHEN TG_OP = 'INSERT' THEN 1 ELSE -1 END
+    );
+    RETURN v_row;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER maintain_backup_dashboard_counters_trigger AFTER INSERT OR DELETE ON backups
+    FOR EACH ROW EXECUTE FUNCTION maintain_backup_dashboard_counters();
+
+-- Contadores recalculados desde cero (base de la verificación de deriva y del backfill)
+CREATE OR REPLACE FUNCTION compute_dashboard_counters()
+RETURNS TABLE (org_unit_id UUID, seccion TEXT, contador TEXT, total BIGINT) AS $$
+    SELECT c.org_unit_id, c.seccion, c.contador, SUM(c.valor)::BIGINT
+    FROM (
+        SELECT d.org_unit_id, 'dispositivos' AS seccion, 'total' AS contador, 1::BIGINT AS valor FROM devices d
+        UNION ALL
+        SELECT d.org_unit_id, 'dispositivos', dashboard_estado_counter(d.estado), 1 FROM devices d
+        UNION ALL
+        SELECT t.org_unit_id, 'tickets', 'total', 1 FROM tickets t
+        UNION ALL
+        SELECT t.org_unit_id, 'tickets', dashboard_estado_counter(t.estado), 1 FROM tickets t
+        UNION ALL
+        SELECT t.org_unit_id, 'tickets', dashboard_prioridad_counter(t.prioridad), 1 FROM tickets t
+        UNION ALL
+        SELECT t.org_unit_id, 'tickets', 'tiempo_respuesta_suma', t.tiempo_respuesta_minutos FROM tickets t
+        WHERE t.tiempo_respuesta_minutos IS NOT NULL
+        UNION ALL
+        SELECT t.org_unit_id, 'tickets', 'tiempo_respuesta_n', 1 FROM tickets t
+        WHERE t.tiempo_respuesta_minutos IS NOT NULL
+        UNION ALL
+        SELECT t.org_unit_id, 'tickets', 'tiempo_resolucion_suma', t.tiempo_resolucion_minutos FROM tickets t
+        WHERE t.tiempo_resolucion_minutos IS NOT NULL
+        UNION ALL
+        SELECT t.org_unit_id, 'tickets', 'tiempo_resolucion_n', 1 FROM tickets t
+        WHERE t.tiempo_resolucion_minutos IS NOT NULL
+        UNION ALL
+        SELECT dv.org_unit_id, 'backups', 'total', 1 FROM backups b LEFT JOIN devices dv ON dv.id = b.device_id
+    ) c
+    WHERE c.contador IS NOT NULL
+    GROUP BY 1, 2, 3;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION rebuild_dashboard_counters()
+RETURNS BIGINT AS $$
+DECLARE
+    v_rows BIGINT;
+BEGIN
+    DELETE FROM dashboard_counters;
+
+    INSERT INTO dashboard_counters (org_unit_id, seccion, contador, total)
+    SELECT c.org_unit_id, c.seccion, c.contador, c.total FROM compute_dashboard_counters() c;
+
+    GET DIAGNOSTICS v_rows = ROW_COUNT;
+    RETURN v_rows;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Diferencias entre el recálculo y los contadores mantenidos (vacío = sin deriva)
+CREATE OR REPLACE FUNCTION get_dashboard_counter_drift()
+RETURNS TABLE (org_unit_id UUID, seccion TEXT, contador TEXT, esperado BIGINT, actual BIGINT) AS $$
+    WITH esperado AS (
+        SELECT *, COALESCE(c.org_unit_id, '00000000-0000-0000-0000-000000000000'::UUID) AS clave
+        FROM compute_dashboard_counters() c
+    ),
+    actual AS (
+        SELECT *, COALESCE(a.org_unit_id, '00000000-0000-0000-0000-000000000000'::UUID) AS clave
+        FROM dashboard_counters a
+    )
+    SELECT
+        COALESCE(e.org_unit_id, a.org_unit_id),
+        COALESCE(e.seccion, a.seccion::TEXT),
+        COALESCE(e.contador, a.contador::TEXT),
+        COALESCE(e.total, 0),
+        COALESCE(a.total, 0)
+    FROM esperado e
+    FULL JOIN actual a
+        ON a.clave = e.clave AND a.seccion = e.seccion AND a.contador = e.contador
+    WHERE COALESCE(e.total, 0) <> COALESCE(a.total, 0);
+$$ LANGUAGE sql STABLE;
+
+-- Desglose por org unit para LIDER_TI: una sola consulta que agrupa cada
+-- tabla una vez y devuelve los contadores con la forma de get_dashboard_metrics.
+CREATE OR REPLACE FUNCTION get_org_unit_breakdown()
+RETURNS TABLE (org_unit_id UUID, nombre VARCHAR, metricas JSONB) AS $$
+    WITH d AS (
+        SELECT
+            devices.org_unit_id,
+            COUNT(*) AS total,
+            COUNT(*) FILTER (WHERE estado = 'ACTIVO') AS activos,
+            COUNT(*) FILTER (WHERE estado = 'REPARACIÓN') AS reparacion,
+            COUNT(*) FILTER (WHERE estado = 'RETIRADO') AS retirados
+        FROM devices
+        GROUP BY devices.org_unit_id
+    ),
+    t AS (
+        SELECT
+            tickets.org_unit_id,
+            COUNT(*) AS total,
+            COUNT(*) FILTER (WHERE estado = 'ABIERTO') AS abiertos,
+            COUNT(*) FILTER (WHERE estado = 'EN_PROCESO') AS en_proceso,
+            COUNT(*) FILTER (WHERE estado = 'RESUELTO') AS resueltos,
+            COUNT(*) FILTER (WHERE estado = 'CERRADO') AS cerrados,
+            COUNT(*) FILTER (WHERE prioridad = 'BAJA') AS prioridad_baja,
+            COUNT(*) FILTER (WHERE prioridad = 'MEDIA') AS prioridad_media,
+            COUNT(*) FILTER (WHERE prioridad = 'ALTA') AS prioridad_alta,
+            COUNT(*) FILTER (WHERE prioridad = 'CRITICA') AS prioridad_critica,
+            AVG(tiempo_respuesta_minutos) AS tiempo_promedio_respuesta,
+            AVG(tiempo_resolucion_minutos) AS tiempo_promedio_resolucion
+        FROM tickets
+        GROUP BY tickets.org_unit_id
+    ),
+    b AS (
+        SELECT dv.org_unit_id, COUNT(*) AS total
+        FROM backups
+        JOIN devices dv ON dv.id = backups.device_id
+        GROUP BY dv.org_unit_id
+    )
+    SELECT
+        o.id,
+        o.nombre,
+        jsonb_build_object(
+            'dispositivos', jsonb_build_object(
+                'total', COALESCE(d.total, 0),
+                'activos', COALESCE(d.activos, 0),
+                'reparacion', COALESCE(d.reparacion, 0),
+                'retirados', COALESCE(d.retirados, 0)
+            ),
+            'tickets', jsonb_build_object(
+                'total', COALESCE(t.total, 0),
+                'abiertos', COALESCE(t.abiertos, 0),
+                'en_proceso', COALESCE(t.en_proceso, 0),
+                'resueltos', COALESCE(t.resueltos, 0),
+                'cerrados', COALESCE(t.cerrados, 0),
+                'prioridad_baja', COALESCE(t.prioridad_baja, 0),
+                'prioridad_media', COALESCE(t.prioridad_media, 0),
+                'prioridad_alta', COALESCE(t.prioridad_alta, 0),
+                'prioridad_critica', COALESCE(t.prioridad_critica, 0),
+                'tiempo_promedio_respuesta', t.tiempo_promedio_respuesta,
+                'tiempo_promedio_resolucion', t.tiempo_promedio_resolucion
+            ),
+            'backups', jsonb_build_object('total', COALESCE(b.total, 0))
+        )
+    FROM org_units o
+    LEFT JOIN d ON d.org_unit_id = o.id
+    LEFT JOIN t ON t.org_unit_id = o.id
+    LEFT JOIN b ON b.org_unit_id = o.id
+    ORDER BY o.nombre;
+$$ LANGUAGE sql STABLE;
+
+-- Series agregadas para un rango (NULL = suma de todas las org units)
+CREATE OR REPLACE FUNCTION get_metric_series(
+    p_org_unit_id UUID,
+    p_metricas TEXT[],
+    p_granularidad TEXT,
+    p_desde TIMESTAMP WITH TIME ZONE,
+    p_hasta TIMESTAMP WITH TIME ZONE
+)
+RETURNS TABLE (metrica VARCHAR, bucket TIMESTAMP WITH TIME ZONE, total BIGINT) AS $$
+    SELECT r.metrica, r.bucket, SUM(r.total)::BIGINT
+    FROM metric_rollups r
+    WHERE r.metrica = ANY(p_metricas)
+      AND r.granularidad = p_granularidad
+      AND r.bucket >= p_desde
+      AND r.bucket < p_hasta
+      AND (p_org_unit_id IS NULL OR r.org_unit_id = p_org_unit_id)
+    GROUP BY r.metrica, r.bucket
+    ORDER BY r.metrica, r.bucket;
+$$ LANGUAGE sql STABLE;
+
 -- ==================== FUNCIONES ÚTILES ====================
 
--- Función para obtener estadísticas de dispositivos
+-- Función para obtener estadísticas de dispositivos (NULL = alcance global)
 CREATE OR REPLACE FUNCTION get_device_stats(p_org_unit_id UUID)
 RETURNS TABLE (
     total BIGINT,
@@ -484,11 +1148,11 @@ BEGIN
         COUNT(*) FILTER (WHERE estado = 'REPARACIÓN')::BIGINT as reparacion,
         COUNT(*) FILTER (WHERE estado = 'RETIRADO')::BIGINT as retirados
     FROM devices
-    WHERE org_unit_id = p_org_unit_id;
+    WHERE p_org_unit_id IS NULL OR org_unit_id = p_org_unit_id;
 END;
 $$ LANGUAGE plpgsql;
 
--- Función para obtener estadísticas de tickets
+-- Función para obtener estadísticas de tickets (NULL = alcance global)
 CREATE OR REPLACE FUNCTION get_ticket_stats(p_org_unit_id UUID)
 RETURNS TABLE (
     total BIGINT,
@@ -496,6 +1160,10 @@ RETURNS TABLE (
     en_proceso BIGINT,
     resueltos BIGINT,
     cerrados BIGINT,
+    prioridad_baja BIGINT,
+    prioridad_media BIGINT,
+    prioridad_alta BIGINT,
+    prioridad_critica BIGINT,
     tiempo_promedio_respuesta NUMERIC,
     tiempo_promedio_resolucion NUMERIC
 ) AS $$
@@ -507,13 +1175,243 @@ BEGIN
         COUNT(*) FILTER (WHERE estado = 'EN_PROCESO')::BIGINT as en_proceso,
         COUNT(*) FILTER (WHERE estado = 'RESUELTO')::BIGINT as resueltos,
         COUNT(*) FILTER (WHERE estado = 'CERRADO')::BIGINT as cerrados,
+        COUNT(*) FILTER (WHERE prioridad = 'BAJA')::BIGINT as prioridad_baja,
+        COUNT(*) FILTER (WHERE prioridad = 'MEDIA')::BIGINT as prioridad_media,
+        COUNT(*) FILTER (WHERE prioridad = 'ALTA')::BIGINT as prioridad_alta,
+        COUNT(*) FILTER (WHERE prioridad = 'CRITICA')::BIGINT as prioridad_critica,
         AVG(tiempo_respuesta_minutos) as tiempo_promedio_respuesta,
         AVG(tiempo_resolucion_minutos) as tiempo_promedio_resolucion
     FROM tickets
-    WHERE org_unit_id = p_org_unit_id;
+    WHERE p_org_unit_id IS NULL OR org_unit_id = p_org_unit_id;
 END;
 $$ LANGUAGE plpgsql;
 
+-- Métricas del dashboard en una sola llamada: contadores agrupados en el
+-- servidor para que la respuesta no crezca con el inventario ni el historial.
+-- Los backups se asignan a la org unit a través de su dispositivo.
+CREATE OR REPLACE FUNCTION get_dashboard_metrics(p_org_unit_id UUID)
+RETURNS JSONB AS $$
+    SELECT jsonb_build_object(
+        'dispositivos', (SELECT to_jsonb(d) FROM get_device_stats(p_org_unit_id) d),
+        'tickets', (SELECT to_jsonb(t) FROM get_ticket_stats(p_org_unit_id) t),
+        'backups', jsonb_build_object(
+            'total', (
+                SELECT COUNT(*)
+                FROM backups b
+                WHERE p_org_unit_id IS NULL
+                   OR b.device_id IN (SELECT id FROM devices WHERE org_unit_id = p_org_unit_id)
+            )
+        )
+    );
+$$ LANGUAGE sql STABLE;
+
+-- Métricas del dashboard leídas de dashboard_counters (misma forma que
+-- get_dashboard_metrics); NULL suma todas las org units.
+CREATE OR REPLACE FUNCTION get_dashboard_counters(p_org_unit_id UUID)
+RETURNS JSONB AS $$
+    WITH c AS (
+        SELECT seccion, contador, SUM(total) AS total
+        FROM dashboard_counters
+        WHERE p_org_unit_id IS NULL OR org_unit_id = p_org_unit_id
+        GROUP BY seccion, contador
+    ),
+    tiempos AS (
+        SELECT
+            SUM(total) FILTER (WHERE contador = 'tiempo_respuesta_suma')
+                / NULLIF(SUM(total) FILTER (WHERE contador = 'tiempo_respuesta_n'), 0) AS respuesta,
+            SUM(total) FILTER (WHERE contador = 'tiempo_resolucion_suma')
+                / NULLIF(SUM(total) FILTER (WHERE contador = 'tiempo_resolucion_n'), 0) AS resolucion
+        FROM c
+        WHERE seccion = 'tickets'
+    )
+    SELECT jsonb_build_object(
+        'dispositivos', COALESCE(
+            (SELECT jsonb_object_agg(contador, total) FROM c WHERE seccion = 'dispositivos'), '{}'::JSONB
+        ),
+        'tickets', COALESCE(
+            (SELECT jsonb_object_agg(contador, total) FROM c WHERE seccion = 'tickets'), '{}'::JSONB
+        ) || (
+            SELECT jsonb_build_object(
+                'tiempo_promedio_respuesta', respuesta,
+                'tiempo_promedio_resolucion', resolucion
+            )
+            FROM tiempos
+        ),
+        'backups', COALESCE(
+            (SELECT jsonb_object_agg(contador, total) FROM c WHERE seccion = 'backups'), '{}'::JSONB
+        )
+    );
+$$ LANGUAGE sql STABLE;
+
+-- Búsqueda de dispositivos por nombre, serial, marca, modelo y ubicación.
+-- Un serial exacto usa idx_devices_serial_unique y siempre queda primero;
+-- el resto se resuelve con los índices de trigramas y se ordena por similitud.
+-- p_org_unit_id NULL significa alcance global (LIDER_TI).
+CREATE OR REPLACE FUNCTION search_devices(
+    p_query TEXT,
+    p_org_unit_id UUID DEFAULT NULL,
+    p_limit INTEGER DEFAULT 20
+)
+RETURNS TABLE (
+    id UUID,
+    nombre VARCHAR,
+    tipo device_type,
+    estado device_status,
+    org_unit_id UUID,
+    ubicacion VARCHAR,
+    serial VARCHAR,
+    marca VARCHAR,
+    modelo VARCHAR,
+    rank REAL
+) AS $$
+DECLARE
+    -- % y _ del texto del usuario se buscan literalmente
+    v_pattern TEXT := '%' || replace(replace(replace(p_query, '\', '\\'), '%', '\%'), '_', '\_') || '%';
+BEGIN
+    RETURN QUERY
+    WITH exact AS (
+        SELECT d.id, 2.0::REAL AS rank
+        FROM devices d
+        WHERE d.serial = p_query
+          AND (p_org_unit_id IS NULL OR d.org_unit_id = p_org_unit_id)
+    ),
+    fuzzy AS (
+        SELECT d.id,
+               GREATEST(
+                   similarity(d.nombre, p_query),
+                   similarity(COALESCE(d.serial, ''), p_query),
+                   similarity(COALESCE(d.marca, ''), p_query),
+                   similarity(COALESCE(d.modelo, ''), p_query),
+                   similarity(COALESCE(d.ubicacion, ''), p_query)
+               ) AS rank
+        FROM devices d
+        WHERE (p_org_unit_id IS NULL OR d.org_unit_id = p_org_unit_id)
+          AND (
+              d.nombre ILIKE v_pattern ESCAPE '\'
+              OR d.serial ILIKE v_pattern ESCAPE '\'
+              OR d.marca ILIKE v_pattern ESCAPE '\'
+              OR d.modelo ILIKE v_pattern ESCAPE '\'
+              OR d.ubicacion ILIKE v_pattern ESCAPE '\'
+          )
+    ),
+    ranked AS (
+        SELECT r.id, MAX(r.rank) AS rank
+        FROM (SELECT * FROM exact UNION ALL SELECT * FROM fuzzy) r
+        GROUP BY r.id
+        ORDER BY MAX(r.rank) DESC
+        LIMIT p_limit
+    )
+    SELECT d.id, d.nombre, d.tipo, d.estado, d.org_unit_id, d.ubicacion,
+           d.serial, d.marca, d.modelo, ranked.rank
+    FROM ranked
+    JOIN devices d ON d.id = ranked.id
+    ORDER BY ranked.rank DESC, d.nombre;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Último backup exitoso de cada dispositivo activo del alcance, en una sola consulta.
+-- Usa idx_backups_device_fecha para resolver el DISTINCT ON por dispositivo.
+CREATE OR REPLACE FUNCTION get_latest_backups(p_org_unit_id UUID DEFAULT NULL)
+RETURNS TABLE (
+    device_id UUID,
+    nombre VARCHAR,
+    tipo device_type,
+    org_unit_id UUID,
+    ultimo_backup TIMESTAMP WITH TIME ZONE,
+    frecuencia VARCHAR
+) AS $$
+BEGIN
+    RETURN QUERY
+    WITH latest AS (
+        SELECT DISTINCT ON (b.device_id) b.device_id, b.fecha_backup, b.frecuencia
+        FROM backups b
+        WHERE b.exitoso IS NOT FALSE
+        ORDER BY b.device_id, b.fecha_backup DESC
+    )
+    SELECT d.id, d.nombre, d.tipo, d.org_unit_id, l.fecha_backup, l.frecuencia
+    FROM devices d
+    LEFT JOIN latest l ON l.device_id = d.id
+    WHERE d.estado <> 'RETIRADO'
+      AND (p_org_unit_id IS NULL OR d.org_unit_id = p_org_unit_id);
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Escapa &, < y > para que el HTML de usuarios no sobreviva a ts_headline:
+-- el resultado sólo contiene las etiquetas <mark> que agrega el resaltado.
+CREATE OR REPLACE FUNCTION html_escape(p_text TEXT)
+RETURNS TEXT AS $$
+    SELECT replace(replace(replace(p_text, '&', '&amp;'), '<', '&lt;'), '>', '&gt;');
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Búsqueda de texto completo en tickets y comentarios, con ranking y resaltado.
+-- Alcance: p_org_unit_id (TI/DIRECTOR), p_solicitante_id (solicitantes) o ambos
+-- NULL (LIDER_TI). Las coincidencias en comentarios pesan la mitad.
+CREATE OR REPLACE FUNCTION search_tickets(
+    p_query TEXT,
+    p_org_unit_id UUID DEFAULT NULL,
+    p_solicitante_id UUID DEFAULT NULL,
+    p_limit INTEGER DEFAULT 20
+)
+RETURNS TABLE (
+    id UUID,
+    titulo VARCHAR,
+    estado ticket_status,
+    prioridad ticket_priority,
+    org_unit_id UUID,
+    fecha_creacion TIMESTAMP WITH TIME ZONE,
+    rank REAL,
+    titulo_resaltado TEXT,
+    fragmento TEXT,
+    coincide_en TEXT
+) AS $$
+DECLARE
+    v_query TSQUERY := websearch_to_tsquery('public.spanish_unaccent', p_query);
+    v_options TEXT := 'StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=25, MinWords=8';
+BEGIN
+    RETURN QUERY
+    WITH ticket_hits AS (
+        SELECT t.id, ts_rank_cd(t.search_vector, v_query) AS rank
+        FROM tickets t
+        WHERE t.search_vector @@ v_query
+          AND (p_org_unit_id IS NULL OR t.org_unit_id = p_org_unit_id)
+          AND (p_solicitante_id IS NULL OR t.solicitante_id = p_solicitante_id)
+    ),
+    comment_hits AS (
+        SELECT DISTINCT ON (c.ticket_id)
+               c.ticket_id AS id,
+               ts_rank_cd(c.search_vector, v_query) * 0.5 AS rank,
+               c.comentario
+        FROM ticket_comments c
+        JOIN tickets t ON t.id = c.ticket_id
+        WHERE c.search_vector @@ v_query
+          AND (p_org_unit_id IS NULL OR t.org_unit_id = p_org_unit_id)
+          AND (p_solicitante_id IS NULL OR t.solicitante_id = p_solicitante_id)
+        ORDER BY c.ticket_id, ts_rank_cd(c.search_vector, v_query) DESC
+    ),
+    combined AS (
+        SELECT COALESCE(th.id, ch.id) AS id,
+               COALESCE(th.rank, 0) + COALESCE(ch.rank, 0) AS rank,
+               th.id IS NOT NULL AS en_ticket,
+               ch.comentario
+        FROM ticket_hits th
+        FULL OUTER JOIN comment_hits ch ON ch.id = th.id
+        ORDER BY 2 DESC
+        LIMIT p_limit
+    )
+    SELECT t.id, t.titulo, t.estado, t.prioridad, t.org_unit_id, t.fecha_creacion,
+           c.rank::REAL,
+           ts_headline('public.spanish_unaccent', html_escape(t.titulo), v_query, 'StartSel=<mark>, StopSel=</mark>, HighlightAll=true'),
+           CASE WHEN c.en_ticket
+                THEN ts_headline('public.spanish_unaccent', html_escape(t.descripcion), v_query, v_options)
+                ELSE ts_headline('public.spanish_unaccent', html_escape(c.comentario), v_query, v_options)
+           END,
+           CASE WHEN c.en_ticket THEN 'ticket' ELSE 'comentario' END
+    FROM combined c
+    JOIN tickets t ON t.id = c.id
+    ORDER BY c.rank DESC, t.fecha_creacion DESC;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
 -- ==================== COMENTARIOS ====================
 
 COMMENT ON TABLE org_units IS 'Dependencias organizacionales (Ej: Colegio, Administración)';
@@ -525,6 +1423,9 @@ COMMENT ON TABLE backups IS 'Registro de copias de seguridad realizadas';
 COMMENT ON TABLE tickets IS 'Tickets del sistema HelpDesk';
 COMMENT ON TABLE ticket_comments IS 'Comentarios y seguimiento de tickets';
 COMMENT ON TABLE audit_chain IS 'Registro inmutable de eventos importantes con cadena de hash';
+COMMENT ON TABLE location_rollups IS 'Conteos de dispositivos por nodo de ubicación y estado';
+COMMENT ON TABLE metric_rollups IS 'Series por hora y día de tickets, backups y logs por org unit';
+COMMENT ON TABLE dashboard_counters IS 'Contadores del dashboard por org unit mantenidos con triggers';
 COMMENT ON TABLE attachments IS 'Archivos adjuntos (imágenes, documentos, evidencias)';
 
 -- ==================== GRANTS ====================